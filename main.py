@@ -1,12 +1,32 @@
 from __future__ import annotations
 
+import argparse
 import logging
+import sys
+from collections.abc import Iterator
 from pathlib import Path
 
 from src.core.analysis import analyze, apply_operation
-from src.core.io import ask_option, ask_params, ask_path, load_image, save_image
+from src.core.batch import collect_paths, run_batch
+from src.core.hashing import HASH_KINDS, build_hash_index
+from src.core.io import (
+    SAVE_PRESETS,
+    ImageSaver,
+    ask_option,
+    ask_params,
+    ask_path,
+    load_image,
+    parse_operation,
+    save_image,
+)
+from src.core.pixel_cache import PixelCache
+from src.core.processing import APPROXIMATE_SCALES
+from src.core.report import REPORT_WORKERS, ReportEntry, write_report
+from src.core.result_cache import ResultCache
+from src.core.scan import scan_directory
 from src.core.visualization import compare_before_after, plot_histogram
-from src.database import init_db
+from src.database import init_db, rebuild_histogram_index, write_behind
+from src.database.export import export_features
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +65,7 @@ def main() -> None:
         image_data,
         {option: params},
         image_data.id,
+        features,
     )
     logger.debug('Applied transformation: %r', transformation)
 
@@ -59,6 +80,185 @@ def main() -> None:
     print('All done!')
 
 
+def batch_main(args: argparse.Namespace) -> int:
+    logger.info('Starting batch image processing')
+
+    init_db()
+    op = dict(parse_operation(spec) for spec in args.op)
+    paths = collect_paths(args.target)
+
+    failed = 0
+    max_memory = args.max_memory_mb * 1024 * 1024 if args.max_memory_mb else None
+    pixel_cache = PixelCache(args.pixel_cache, args.pixel_cache_mb * 1024 * 1024) if args.pixel_cache else None
+    result_cache = ResultCache(args.result_cache, args.result_cache_mb * 1024 * 1024) if args.result_cache else None
+    saver = ImageSaver(workers=args.save_workers, preset=args.preset)
+    results = run_batch(
+        paths,
+        op,
+        args.out,
+        workers=args.workers,
+        max_memory=max_memory,
+        sample_scale=args.approximate,
+        pixel_cache=pixel_cache,
+        save_preset=args.preset,
+        result_cache=result_cache,
+        saver=saver,
+    )
+
+    def report_entries() -> Iterator[ReportEntry]:
+        nonlocal failed
+        for result in results:
+            if result.ok:
+                print(f'OK   {result.path} -> {result.output_path}', flush=True)
+            else:
+                failed += 1
+                print(f'FAIL {result.path}: {result.error}', flush=True)
+            histogram = result.features.histogram if result.features else None
+            yield ReportEntry(result.path, result.output_path, histogram)
+
+    with saver:
+        if args.report:
+            sheets = write_report(report_entries(), args.report, workers=args.report_workers)
+            print(f'Report: {len(sheets)} sheet(s) in {args.report}')
+        else:
+            for _ in report_entries():
+                pass
+
+    print(f'Processed {len(paths)} image(s), failed: {failed}')
+    return 1 if failed else 0
+
+
+def scan_main(args: argparse.Namespace) -> int:
+    logger.info('Starting incremental directory scan')
+
+    init_db()
+    if args.write_behind:
+        with write_behind():
+            report = scan_directory(args.root, sample_scale=args.approximate)
+    else:
+        report = scan_directory(args.root, sample_scale=args.approximate)
+
+    for path, error in report.failed.items():
+        print(f'FAIL {path}: {error}')
+    for directory in report.failed_dirs:
+        print(f'FAIL {directory}: directory could not be read, its manifest entries were kept')
+    print(
+        f'Added: {len(report.added)}, changed: {len(report.changed)}, unchanged: {report.unchanged}, '
+        f'deleted: {len(report.deleted)}, failed: {len(report.failed) + len(report.failed_dirs)}'
+    )
+    return 1 if report.failed or report.failed_dirs else 0
+
+
+def duplicates_main(args: argparse.Namespace) -> int:
+    logger.info('Searching for near-duplicate images')
+
+    init_db()
+    index = build_hash_index(args.hash)
+    found = 0
+    for image_a, image_b, distance in index.duplicate_pairs(args.max_distance):
+        found += 1
+        print(f'{image_a}  {image_b}  distance={distance}')
+
+    print(f'Indexed {len(index)} image(s), near-duplicate pairs: {found}')
+    return 0
+
+
+def export_main(args: argparse.Namespace) -> int:
+    logger.info('Exporting image features to columnar files')
+
+    init_db()
+    rows = export_features(args.out, chunk_rows=args.chunk_rows)
+    print(f'Exported {rows} row(s) to {args.out}')
+    return 0
+
+
+def reindex_main(args: argparse.Namespace) -> int:
+    logger.info('Rebuilding histogram index')
+
+    init_db()
+    rows = rebuild_histogram_index(batch_size=args.batch_size)
+    print(f'Histogram index rebuilt: {rows} image(s)')
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Image analysis and transformation CLI.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    batch = subparsers.add_parser('batch', help='Process a directory or glob of images without prompts.')
+    batch.add_argument('target', help='Directory with images or glob pattern (e.g. "data/**/*.jpg").')
+    batch.add_argument(
+        '--op',
+        action='append',
+        required=True,
+        help='Transformation spec: resize=800x600, brightness=1.2, contrast=1.1, filter=blur. Can be repeated.',
+    )
+    batch.add_argument('--out', default='data/batch', help='Directory for transformed images.')
+    batch.add_argument('--workers', type=int, default=None, help='Number of worker processes (default: CPU count).')
+    batch.add_argument(
+        '--max-memory-mb',
+        type=int,
+        default=None,
+        help='Analyze images in strips so that analysis buffers stay within this many MB.',
+    )
+    batch.add_argument(
+        '--approximate',
+        type=int,
+        choices=APPROXIMATE_SCALES,
+        default=1,
+        help=(
+            'Fast approximate analysis at 1/N scale (JPEG draft decoding or pixel sampling). '
+            'Stored *_error values are sampling-only lower bounds.'
+        ),
+    )
+    batch.add_argument('--result-cache', default=None, help='Directory for cached transformation results.')
+    batch.add_argument('--result-cache-mb', type=int, default=1024, help='Size limit of the result cache in MB.')
+    batch.add_argument('--pixel-cache', default=None, help='Directory for cached decoded pixels (memory-mapped).')
+    batch.add_argument('--preset', choices=SAVE_PRESETS, default=None, help='Encoder settings: fast or small.')
+    batch.add_argument(
+        '--save-workers',
+        type=int,
+        default=None,
+        help='Threads encoding and writing results in the main process (default: Python thread pool default).',
+    )
+    batch.add_argument('--pixel-cache-mb', type=int, default=2048, help='Size limit of the pixel cache in MB.')
+    batch.add_argument('--report', default=None, help='Directory for contact sheets with before/after pairs.')
+    batch.add_argument(
+        '--report-workers',
+        type=int,
+        default=REPORT_WORKERS,
+        help='Processes rendering contact sheets, in addition to --workers.',
+    )
+
+    scan = subparsers.add_parser('scan', help='Analyze only new or changed images in a directory tree.')
+    scan.add_argument('root', help='Directory to scan recursively.')
+    scan.add_argument(
+        '--approximate',
+        type=int,
+        choices=APPROXIMATE_SCALES,
+        default=1,
+        help='Fast approximate analysis at 1/N scale. Stored *_error values are sampling-only lower bounds.',
+    )
+    scan.add_argument(
+        '--write-behind',
+        action='store_true',
+        help='Queue database writes and commit them in batches from a background thread.',
+    )
+
+    duplicates = subparsers.add_parser('duplicates', help='List near-duplicate images by perceptual hash.')
+    duplicates.add_argument('--hash', choices=HASH_KINDS, default='phash', help='Perceptual hash to compare.')
+    duplicates.add_argument('--max-distance', type=int, default=4, help='Maximum Hamming distance.')
+
+    export = subparsers.add_parser('export', help='Export image features as per-column .npy files.')
+    export.add_argument('out', help='Directory for the exported columns.')
+    export.add_argument('--chunk-rows', type=int, default=50_000, help='Rows read from the database per chunk.')
+
+    reindex = subparsers.add_parser('reindex', help='Rebuild the histogram search index from the database.')
+    reindex.add_argument('--batch-size', type=int, default=10_000, help='Histograms read from the database per batch.')
+
+    return parser
+
+
 if __name__ == '__main__':
     logging.basicConfig(
         level=logging.INFO,
@@ -66,7 +266,18 @@ if __name__ == '__main__':
         filemode='w',
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     )
+    cli_args = build_parser().parse_args()
     try:
+        if cli_args.command == 'batch':
+            sys.exit(batch_main(cli_args))
+        if cli_args.command == 'scan':
+            sys.exit(scan_main(cli_args))
+        if cli_args.command == 'duplicates':
+            sys.exit(duplicates_main(cli_args))
+        if cli_args.command == 'export':
+            sys.exit(export_main(cli_args))
+        if cli_args.command == 'reindex':
+            sys.exit(reindex_main(cli_args))
         main()
     except Exception:
         logger.exception('Unhandled exception in CLI')
@@ -1,5 +1,4 @@
 import logging
-from datetime import datetime
 from typing import Any
 from uuid import uuid4
 
@@ -7,107 +6,115 @@ from PIL import Image
 
 from ..core.processing import (
     Options,
-    apply_filter,
-    change_brightness,
-    change_contrast,
-    compute_contrast,
-    compute_edge_density,
-    compute_mean_brightness,
-    resize,
+    approximate_view,
+    compute_features,
+    compute_features_tiled,
+    sampling_errors,
 )
-from ..database import insert_image_features, insert_transformation
+from ..database import get_image_features, insert_image_features
 from ..models import ImageData, ImageFeatures, TransformationRecord
+from .hashing import compute_hashes
+from .pipeline import Pipeline
+from .result_cache import ResultCache
 
 logger = logging.getLogger(__name__)
 
 
 def apply_operation(
-    img: Image.Image, data: ImageData, op: dict[Options, Any], image_id: str
+    img: Image.Image,
+    data: ImageData,
+    op: dict[Options, Any],
+    image_id: str,
+    features: ImageFeatures | None = None,
+    cache: ResultCache | None = None,
 ) -> tuple[Image.Image, TransformationRecord]:
     """
-    Применяет одну операцию (op: {'name':..., 'params':{...}}) и возвращает новое изображение и запись об изменении.
+    Применяет операции op ({Options: params}) цепочкой и возвращает новое изображение и последнюю запись об изменении.
+
+    features: результат analyze для img; точная средняя яркость из него используется для изменения контраста.
+    cache: кеш результатов; при попадании цепочка не выполняется, но записи истории всё равно сохраняются.
+        Изображения без хеша содержимого (ImageData не из load_image) не кешируются.
     """
     logger.info('Applying operation(s) to image %s', image_id)
     logger.debug('Incoming operations: %r', op)
 
-    result = img
-    record: TransformationRecord | None = None
-
-    for key, value in op.items():
-        logger.debug('Processing operation: %s with params=%r', key, value)
-
-        if key == Options.Resize:
-            logger.debug('Resizing image from %s with size=%r', getattr(result, 'size', None), value)
-            result = resize(img, tuple(value))
-            logger.debug('Image resized, new size=%s', getattr(result, 'size', None))
-
-        elif key == Options.Brightness:
-            logger.debug('Changing brightness with factor=%s', value)
-            result = change_brightness(img, float(value))
-
-        elif key == Options.Contrast:
-            logger.debug('Changing contrast with factor=%s', value)
-            result = change_contrast(img, float(value))
-
-        elif key == Options.Filter:
-            logger.debug('Applying filter with params=%r', value)
-            result = apply_filter(img, value)
-
-        else:
-            logger.error(
-                'Wrong argument for apply_operation: %r. Available options: Resize, Brightness, Contrast, Filter.',
-                key,
-            )
-            raise AttributeError('Wrong argument. Available options are: Resize, Brightness, Contrast, Filter.')
-
-        record = TransformationRecord(
-            id=str(uuid4()),
-            image_id=image_id,
-            name=key,
-            params=value,
-            applied_at=datetime.utcnow(),
-        )
-        logger.debug('TransformationRecord created: %r', record)
-
-        data.updated_at = datetime.utcnow()
-        data.history.append(record)
-        logger.debug('ImageData updated_at=%s, history length=%d', data.updated_at, len(data.history))
-
-        insert_transformation(record)
-        logger.info('Transformation %s for image %s inserted into database', key, image_id)
-
-    if record is None:
-        logger.error('No operations provided for apply_operation() for image %s', image_id)
-        raise ValueError('No operations provided for apply_operation().')
+    pipeline = Pipeline(op.items())
+    content_hash = data.source.content_hash
+    if cache is not None and not content_hash:
+        logger.debug('Image %s has no content hash, result cache is skipped', image_id)
+    key = cache.key(content_hash, op) if cache is not None and op and content_hash else None
+    cached = cache.get(key) if cache is not None and key is not None else None
+    if cached is not None:
+        logger.info('Using cached result for image %s', image_id)
+        return cached, pipeline.record(data, image_id)[-1]
+
+    mean_brightness = features.mean_brightness if features is not None and features.sample_scale == 1 else None
+    result, records = pipeline.apply(img, data, image_id, mean_brightness)
+    if cache is not None and key is not None:
+        try:
+            cache.put(key, result)
+        except OSError:
+            logger.exception('Failed to store result for image %s in cache', image_id)
 
     logger.info('Operation(s) applied successfully to image %s', image_id)
-    return result, record
+    return result, records[-1]
 
 
-def analyze(img: Image.Image, image_id: str) -> ImageFeatures:
+def analyze(
+    img: Image.Image,
+    image_id: str,
+    max_memory: int | None = None,
+    sample_scale: int = 1,
+    use_cache: bool = True,
+) -> ImageFeatures:
     """
     Анализирует изображение и возвращает словарь с полученными значениями.
+
+    max_memory: ограничение (в байтах) на рабочую память анализа; если задано, изображение обходится полосами.
+    sample_scale: 2, 4 или 8 включают приближённый анализ уменьшенного изображения с нижней оценкой ошибок
+        (см. sampling_errors).
+    use_cache: вернуть сохранённые признаки для image_id (хеша содержимого) без декодирования изображения,
+        если они посчитаны не грубее запрошенного sample_scale.
     """
     logger.info('Analyzing image %s', image_id)
 
+    if use_cache:
+        cached = get_image_features(image_id)
+        if cached is not None and cached.sample_scale <= sample_scale:
+            logger.info('Using cached features for image %s (features_id=%s)', image_id, cached.id)
+            if cached.phash is None:
+                # Строка сохранена до появления перцептивных хешей: досчитываем их, чтобы она попала в поиск дублей.
+                logger.info('Backfilling perceptual hashes for image %s', image_id)
+                cached.ahash, cached.dhash, cached.phash = compute_hashes(approximate_view(img, sample_scale))
+                insert_image_features(cached)
+            return cached
+
     width, height = img.size
     fmt = str(getattr(img, 'format', None))
     logger.debug('Image basic info: width=%d, height=%d, format=%s', width, height, fmt)
 
-    gray = img.convert('L')
-    histogram = gray.histogram()
-    logger.debug('Histogram length: %d', len(histogram))
+    view = approximate_view(img, sample_scale)
+    if sample_scale != 1:
+        logger.debug('Using approximate analysis: scale=1/%d, view size=%s', sample_scale, view.size)
+
+    if max_memory is None:
+        gray_features = compute_features(view)
+    else:
+        logger.debug('Using tiled analysis with max_memory=%d bytes', max_memory)
+        gray_features = compute_features_tiled(view, max_memory)
 
-    mean_brightness = compute_mean_brightness(img)
-    contrast = compute_contrast(img)
-    density = compute_edge_density(img)
+    ahash, dhash, phash = compute_hashes(view)
+    brightness_error, contrast_error, density_error = (
+        sampling_errors(gray_features) if sample_scale != 1 else (0.0, 0.0, 0.0)
+    )
+    logger.debug('Histogram length: %d', len(gray_features.histogram))
 
     logger.debug(
         'Computed features for %s: mean_brightness=%f, contrast=%f, edge_density=%f',
         image_id,
-        mean_brightness,
-        contrast,
-        density,
+        gray_features.mean_brightness,
+        gray_features.contrast,
+        gray_features.density,
     )
 
     analysis = ImageFeatures(
@@ -116,10 +123,17 @@ def analyze(img: Image.Image, image_id: str) -> ImageFeatures:
         width=width,
         height=height,
         format=fmt,
-        mean_brightness=mean_brightness,
-        contrast=contrast,
-        density=density,
-        histogram=histogram,
+        mean_brightness=gray_features.mean_brightness,
+        contrast=gray_features.contrast,
+        density=gray_features.density,
+        histogram=gray_features.histogram,
+        sample_scale=sample_scale,
+        brightness_error=brightness_error,
+        contrast_error=contrast_error,
+        density_error=density_error,
+        ahash=ahash,
+        dhash=dhash,
+        phash=phash,
     )
 
     insert_image_features(analysis)
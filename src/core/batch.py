@@ -0,0 +1,178 @@
+import glob
+import logging
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+
+from ..models import ImageFeatures
+from .analysis import analyze, apply_operation
+from .io import ImageSaver, load_image, save_image
+from .pixel_cache import PixelCache
+from .processing import Options
+from .result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff'}
+
+
+@dataclass
+class BatchResult:
+    """
+    Результат обработки одного изображения в пакетном режиме.
+
+    path: путь к исходному изображению
+    output_path: путь к сохранённому результату
+    features: признаки исходного изображения
+    error: текст ошибки, если обработка не удалась
+    image: результат, который ещё нужно сохранить (при defer_save)
+    """
+
+    path: str
+    output_path: str | None = None
+    features: ImageFeatures | None = None
+    error: str | None = None
+    image: Image.Image | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def collect_paths(target: str) -> list[str]:
+    """
+    Возвращает список изображений по директории или glob-шаблону.
+    """
+    if os.path.isdir(target):
+        with os.scandir(target) as entries:
+            paths = [
+                entry.path
+                for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+            ]
+    else:
+        paths = [path for path in glob.glob(target, recursive=True) if os.path.isfile(path)]
+
+    paths.sort()
+    logger.info('Collected %d image(s) from %s', len(paths), target)
+    return paths
+
+
+def output_path_for(path: str, root: str, output_dir: str) -> str:
+    """
+    Строит путь результата, сохраняя структуру директорий относительно root.
+    """
+    return str(Path(output_dir) / os.path.relpath(path, root))
+
+
+def process_image(
+    path: str,
+    op: dict[Options, Any],
+    output_path: str,
+    max_memory: int | None = None,
+    sample_scale: int = 1,
+    pixel_cache: PixelCache | None = None,
+    save_preset: str | None = None,
+    result_cache: ResultCache | None = None,
+    defer_save: bool = False,
+) -> BatchResult:
+    """
+    Выполняет load_image -> analyze -> apply_operation -> save_image для одного файла.
+
+    При defer_save=True результат не сохраняется, а возвращается в BatchResult.image.
+    """
+    try:
+        img, _, image_data = load_image(path, pixel_cache)
+        features = analyze(img, image_data.id, max_memory=max_memory, sample_scale=sample_scale)
+        new_img, _ = apply_operation(img, image_data, op, image_data.id, features, result_cache)
+        if defer_save:
+            return BatchResult(path=path, output_path=output_path, features=features, image=new_img)
+        save_image(new_img, output_path, preset=save_preset)
+    except Exception as exc:
+        logger.exception('Batch processing failed for %s', path)
+        return BatchResult(path=path, error=f'{type(exc).__name__}: {exc}')
+
+    return BatchResult(path=path, output_path=output_path, features=features)
+
+
+def _saved(result: BatchResult, save: Future[str]) -> BatchResult:
+    """
+    Дополняет результат ошибкой фонового сохранения, если она была.
+    """
+    error = save.exception()
+    if error is None:
+        return result
+    return BatchResult(path=result.path, features=result.features, error=f'{type(error).__name__}: {error}')
+
+
+def _logged(result: BatchResult) -> BatchResult:
+    if result.ok:
+        logger.info('Processed %s -> %s', result.path, result.output_path)
+    else:
+        logger.error('Failed %s: %s', result.path, result.error)
+    return result
+
+
+def run_batch(
+    paths: Iterable[str],
+    op: dict[Options, Any],
+    output_dir: str,
+    workers: int | None = None,
+    max_memory: int | None = None,
+    sample_scale: int = 1,
+    pixel_cache: PixelCache | None = None,
+    save_preset: str | None = None,
+    result_cache: ResultCache | None = None,
+    saver: ImageSaver | None = None,
+) -> Iterator[BatchResult]:
+    """
+    Обрабатывает изображения в пуле процессов и отдаёт результаты по мере готовности.
+
+    С saver процессы только вычисляют результат, а кодирование и запись идут в потоках saver
+    родительского процесса; результат отдаётся после того, как файл записан.
+    """
+    paths = list(paths)
+    if not paths:
+        logger.warning('No images to process')
+        return
+
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    logger.info('Starting batch: %d image(s), workers=%s, output_dir=%s', len(paths), workers, output_dir)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                process_image,
+                path,
+                op,
+                output_path_for(os.path.abspath(path), root, output_dir),
+                max_memory,
+                sample_scale,
+                pixel_cache,
+                save_preset,
+                result_cache,
+                saver is not None,
+            )
+            for path in paths
+        ]
+        saving: deque[tuple[BatchResult, Future[str]]] = deque()
+        for future in as_completed(futures):
+            result = future.result()
+            if saver is not None and result.image is not None and result.output_path is not None:
+                saving.append((result, saver.save(result.image, result.output_path)))
+                result.image = None
+            else:
+                yield _logged(result)
+            while saving and saving[0][1].done():
+                yield _logged(_saved(*saving.popleft()))
+
+        while saving:
+            yield _logged(_saved(*saving.popleft()))
+
+    logger.info('Batch finished')
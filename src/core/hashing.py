@@ -0,0 +1,151 @@
+import logging
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+from numpy.typing import NDArray
+from PIL import Image
+
+from ..database import iter_image_hashes
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+HASH_KINDS = ('ahash', 'dhash', 'phash')
+PHASH_SIZE = 32
+HASH_SIZE = 8
+
+
+def _bits_to_int(bits: NDArray[np.bool_]) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+@lru_cache(maxsize=1)
+def _dct_matrix(size: int) -> NDArray[np.float64]:
+    """Матрица DCT-II размера size x size."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def compute_hashes(img: Image.Image) -> tuple[int, int, int]:
+    """
+    Вычисляет перцептивные хеши (aHash, dHash, pHash) изображения как 64-битные целые.
+
+    Изображение один раз уменьшается до 32x32 (grayscale), все три хеша считаются по этой миниатюре.
+    """
+    thumb = img.resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.BOX).convert('L')
+
+    small: NDArray[np.float64] = np.asarray(
+        thumb.resize((HASH_SIZE, HASH_SIZE), Image.Resampling.BOX), dtype=np.float64
+    )
+    ahash = _bits_to_int(small > small.mean())
+
+    wide: NDArray[np.int16] = np.asarray(thumb.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+    dhash = _bits_to_int(wide[:, 1:] > wide[:, :-1])
+
+    dct = _dct_matrix(PHASH_SIZE)
+    coefficients = (dct @ np.asarray(thumb, dtype=np.float64) @ dct.T)[:HASH_SIZE, :HASH_SIZE]
+    phash = _bits_to_int(coefficients > np.median(coefficients.ravel()[1:]))
+
+    logger.debug('Perceptual hashes computed: ahash=%016x, dhash=%016x, phash=%016x', ahash, dhash, phash)
+    return ahash, dhash, phash
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Расстояние Хэмминга между двумя хешами."""
+    return (a ^ b).bit_count()
+
+
+class HashIndex:
+    """
+    Индекс multi-index hashing для поиска хешей в пределах расстояния Хэмминга.
+
+    64-битный хеш делится на chunks частей. Если расстояние до запроса не больше k, то хотя бы одна часть
+    отличается не более чем на k // chunks бит, поэтому кандидаты ищутся по небольшому числу вариантов каждой
+    части в словарях, а не перебором всех хешей.
+    """
+
+    def __init__(self, chunks: int = 4) -> None:
+        if HASH_BITS % chunks:
+            raise ValueError(f'Number of chunks must divide {HASH_BITS}: {chunks}')
+        self.chunks = chunks
+        self.chunk_bits = HASH_BITS // chunks
+        self._mask = (1 << self.chunk_bits) - 1
+        self._tables: list[defaultdict[int, list[int]]] = [defaultdict(list) for _ in range(chunks)]
+        self._keys: list[str] = []
+        self._hashes: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _split(self, value: int) -> list[int]:
+        return [(value >> (i * self.chunk_bits)) & self._mask for i in range(self.chunks)]
+
+    def add(self, key: str, value: int) -> None:
+        """Добавляет хеш value с ключом key (например, image_id)."""
+        position = len(self._keys)
+        self._keys.append(key)
+        self._hashes.append(value)
+        for table, part in zip(self._tables, self._split(value), strict=True):
+            table[part].append(position)
+
+    def extend(self, items: Iterable[tuple[str, int]]) -> None:
+        """Добавляет пары (key, hash)."""
+        for key, value in items:
+            self.add(key, value)
+
+    def _variants(self, part: int, radius: int) -> Iterator[int]:
+        yield part
+        for distance in range(1, radius + 1):
+            for positions in combinations(range(self.chunk_bits), distance):
+                flipped = part
+                for bit in positions:
+                    flipped ^= 1 << bit
+                yield flipped
+
+    def _candidates(self, value: int, max_distance: int) -> set[int]:
+        radius = max_distance // self.chunks
+        candidates: set[int] = set()
+        for table, part in zip(self._tables, self._split(value), strict=True):
+            for variant in self._variants(part, radius):
+                candidates.update(table.get(variant, ()))
+        return candidates
+
+    def query(self, value: int, max_distance: int) -> list[tuple[str, int]]:
+        """
+        Возвращает [(key, distance)] всех хешей в пределах max_distance, отсортированные по расстоянию.
+        """
+        found = []
+        for position in self._candidates(value, max_distance):
+            distance = hamming_distance(value, self._hashes[position])
+            if distance <= max_distance:
+                found.append((self._keys[position], distance))
+        found.sort(key=lambda item: (item[1], item[0]))
+        return found
+
+    def duplicate_pairs(self, max_distance: int) -> Iterator[tuple[str, str, int]]:
+        """
+        Отдаёт пары (key_a, key_b, distance) близких хешей; каждая пара встречается один раз.
+        """
+        for position, value in enumerate(self._hashes):
+            for other in sorted(self._candidates(value, max_distance)):
+                if other <= position:
+                    continue
+                distance = hamming_distance(value, self._hashes[other])
+                if distance <= max_distance:
+                    yield self._keys[position], self._keys[other], distance
+
+
+def build_hash_index(kind: str = 'phash', chunks: int = 4) -> HashIndex:
+    """
+    Строит HashIndex по хешам kind всех изображений в базе данных.
+    """
+    index = HashIndex(chunks)
+    index.extend(iter_image_hashes(kind))
+    logger.info('Built %s index over %d image(s)', kind, len(index))
+    return index
@@ -1,16 +1,43 @@
+import hashlib
 import logging
 import os
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 from typing import Any
 
 from PIL import Image
 
 from ..models import ImageData, ImageSource
+from .pixel_cache import PixelCache
 from .processing import Options
 
 logger = logging.getLogger(__name__)
 
+HASH_CHUNK_SIZE = 1024 * 1024
+PREFETCH_DEPTH = 4
+PREFETCH_WORKERS = 2
+SAVER_MAX_PENDING_BYTES = 512 * 1024 * 1024
+
+# Настройки кодировщиков Pillow: fast - быстрее кодирование, small - меньше файл.
+SAVE_PRESETS: dict[str, dict[str, dict[str, Any]]] = {
+    'fast': {
+        'JPEG': {'quality': 85, 'optimize': False, 'progressive': False},
+        'PNG': {'compress_level': 1},
+        'WEBP': {'quality': 80, 'method': 0},
+    },
+    'small': {
+        'JPEG': {'quality': 80, 'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'WEBP': {'quality': 75, 'method': 6},
+    },
+}
+
 
 def ask_path() -> Path:
     """
@@ -72,34 +99,79 @@ def ask_params(option: Options) -> Any:
         return input("Enter the Contrast value (for example, '1.1'): ").strip()
 
     if option == Options.Filter:
-        return input("Enter the Filter (for example, 'blur', 'sharpen', 'edge_enhance', 'edges'): ").strip()
+        return input("Enter the Filter (for example, 'blur', 'blur:25', 'sharpen', 'edge_enhance', 'edges'): ").strip()
 
     return input('Enter the values ').strip()
 
 
-def load_image(path: str) -> tuple[Image.Image, ImageSource, ImageData]:
+def parse_operation(spec: str) -> tuple[Options, Any]:
     """
-    Загружает изображение и возвращает (PIL.Image, ImageSource, ImageData).
+    Разбирает строку трансформации вида 'resize=800x600', 'brightness=1.2', 'filter=blur'.
     """
-    logger.info('Loading image from %s', path)
+    name, sep, raw = spec.partition('=')
+    raw = raw.strip()
+    option = next((o for o in Options if o.name.lower() == name.strip().lower()), None)
+    if option is None or not sep or not raw:
+        available = ', '.join(o.name.lower() for o in Options)
+        raise ValueError(f'Wrong transformation spec: {spec!r}. Expected <option>=<value>, options: {available}.')
 
-    try:
-        img = Image.open(path)
-        logger.debug(
-            'Image opened: size=%s, mode=%s, format=%s',
-            getattr(img, 'size', None),
-            getattr(img, 'mode', None),
-            getattr(img, 'format', None),
-        )
+    if option == Options.Resize:
+        try:
+            w, h = (int(part) for part in raw.lower().split('x'))
+        except ValueError:
+            raise ValueError(f'Wrong size in spec: {spec!r}. Expected <width>x<height>.') from None
+        if w <= 0 or h <= 0:
+            raise ValueError(f'Size must be positive: {spec!r}.')
+        return option, (w, h)
 
-    except OSError:
-        logger.exception('Failed to open image: %s', path)
-        raise
+    if option in (Options.Brightness, Options.Contrast):
+        try:
+            return option, float(raw)
+        except ValueError:
+            raise ValueError(f'Wrong factor in spec: {spec!r}.') from None
+
+    return option, raw
 
+
+def file_hash(path: str) -> str:
+    """
+    Вычисляет BLAKE2-хеш содержимого файла, читая его блоками.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_image(path: str, cache: PixelCache | None = None) -> tuple[Image.Image, ImageSource, ImageData]:
+    """
+    Загружает изображение и возвращает (PIL.Image, ImageSource, ImageData).
+
+    ID изображения совпадает с хешем содержимого файла, поэтому одинаковые файлы получают один и тот же ID.
+    С cache пиксели берутся из дискового кеша без декодирования, а при промахе изображение декодируется и сохраняется.
+    """
+    logger.info('Loading image from %s', path)
     abs_path = os.path.abspath(path)
+
+    cached = cache.get(abs_path) if cache is not None else None
+    if cached is not None:
+        img, content_hash = cached
+    else:
+        img = _open_image(path)
+        content_hash = file_hash(abs_path)
+        if cache is not None:
+            img.load()
+            try:
+                cache.put(abs_path, img, content_hash)
+            except OSError:
+                # Кеш - только ускорение: ошибка записи (нет места, нет прав) не мешает загрузке.
+                logger.exception('Failed to store %s in pixel cache', abs_path)
+
     source = ImageSource(
         location=abs_path,
         filename=os.path.basename(abs_path),
+        content_hash=content_hash,
     )
     logger.debug('ImageSource created: %r', source)
 
@@ -108,6 +180,7 @@ def load_image(path: str) -> tuple[Image.Image, ImageSource, ImageData]:
         history=[],
         created_at=datetime.utcnow(),
         updated_at=None,
+        id=source.content_hash,
     )
     logger.debug('ImageData created: %r', data)
 
@@ -115,8 +188,97 @@ def load_image(path: str) -> tuple[Image.Image, ImageSource, ImageData]:
     return img, source, data
 
 
-def save_image(img: Image.Image, path: str, formatting: str | None = None) -> None:
-    """Сохраняет изображение по пути."""
+@dataclass
+class LoadedImage:
+    """
+    Результат фоновой загрузки одного файла в iter_images.
+
+    path: путь к файлу
+    img, source, data: то же, что возвращает load_image
+    error: текст ошибки, если файл не удалось загрузить
+    """
+
+    path: str
+    img: Image.Image | None = None
+    source: ImageSource | None = None
+    data: ImageData | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _prefetch_image(path: str, cache: PixelCache | None) -> LoadedImage:
+    # Только чтение файла (хеш содержимого) и заголовка: декодирование остаётся потребителю, чтобы не
+    # декодировать файлы с уже сохранёнными признаками и не мешать приближённому анализу (JPEG draft).
+    try:
+        img, source, data = load_image(path, cache)
+    except Exception as exc:
+        logger.exception('Failed to load %s', path)
+        return LoadedImage(path=path, error=f'{type(exc).__name__}: {exc}')
+    return LoadedImage(path=path, img=img, source=source, data=data)
+
+
+def iter_images(
+    paths: Iterable[str],
+    prefetch: int = PREFETCH_DEPTH,
+    workers: int = PREFETCH_WORKERS,
+    cache: PixelCache | None = None,
+) -> Iterator[LoadedImage]:
+    """
+    Читает изображения в фоновых потоках и отдаёт их в исходном порядке.
+
+    В фоне файл читается целиком (хеш содержимого) и открывается его заголовок; пиксели декодируются
+    при первом обращении у потребителя. Впереди потребителя читается не больше prefetch файлов: следующий
+    файл ставится в очередь, только когда забирают очередной результат. Чтение идёт без GIL, поэтому
+    ввод-вывод следующих файлов идёт одновременно с обработкой текущего.
+    """
+    if prefetch < 1:
+        raise ValueError(f'prefetch must be positive: {prefetch}')
+
+    pending: deque[Future[LoadedImage]] = deque()
+    path_iter = iter(paths)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-loader') as executor:
+        try:
+            for path in islice(path_iter, prefetch):
+                pending.append(executor.submit(_prefetch_image, path, cache))
+            while pending:
+                loaded = pending.popleft().result()
+                for path in islice(path_iter, 1):
+                    pending.append(executor.submit(_prefetch_image, path, cache))
+                yield loaded
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _open_image(path: str) -> Image.Image:
+    try:
+        img = Image.open(path)
+        logger.debug(
+            'Image opened: size=%s, mode=%s, format=%s',
+            getattr(img, 'size', None),
+            getattr(img, 'mode', None),
+            getattr(img, 'format', None),
+        )
+
+    except OSError:
+        logger.exception('Failed to open image: %s', path)
+        raise
+    return img
+
+
+def save_image(
+    img: Image.Image, path: str, formatting: str | None = None, preset: str | None = None, **options: Any
+) -> None:
+    """
+    Сохраняет изображение по пути.
+
+    preset: набор настроек кодировщика из SAVE_PRESETS ('fast' или 'small'), options - дополнительные
+    параметры Image.save (например, quality). Файл пишется во временный и переименовывается, поэтому
+    по пути path никогда не оказывается недописанное изображение.
+    """
     logger.info('Saving image to %s', path)
 
     if formatting is None:
@@ -133,6 +295,12 @@ def save_image(img: Image.Image, path: str, formatting: str | None = None) -> No
     else:
         logger.debug('Using explicit image format for saving: %s', formatting)
 
+    if preset is not None:
+        if preset not in SAVE_PRESETS:
+            raise ValueError(f'Unknown save preset: {preset}. Available: {tuple(SAVE_PRESETS)}.')
+        options = {**SAVE_PRESETS[preset].get(formatting.upper(), {}), **options}
+        logger.debug('Encoder options for %s (preset=%s): %s', formatting, preset, options)
+
     directory = os.path.dirname(path)
     if directory:
         try:
@@ -142,10 +310,80 @@ def save_image(img: Image.Image, path: str, formatting: str | None = None) -> No
             logger.exception('Failed to create directory for path: %s', directory)
             raise
 
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
     try:
-        img.save(path, format=formatting)
+        img.save(tmp_path, format=formatting, **options)
+        os.replace(tmp_path, path)
         logger.info('Image successfully saved to %s', path)
 
     except OSError:
         logger.exception('Failed to save image to %s with format %s', path, formatting)
         raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ImageSaver:
+    """
+    Сохраняет изображения в фоновом пуле потоков, чтобы кодирование не задерживало обработку следующих.
+
+    max_pending_bytes ограничивает суммарный размер (в несжатых пикселях) ещё не сохранённых изображений:
+    save() ждёт, пока освободится место. Переданное в save() изображение нельзя изменять до завершения записи.
+    Завершённые задачи не хранятся: остаются только ошибки записи, которые возвращает close().
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        max_pending_bytes: int = SAVER_MAX_PENDING_BYTES,
+        preset: str | None = None,
+    ) -> None:
+        self.preset = preset
+        self.max_pending_bytes = max_pending_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-saver')
+        self._condition = threading.Condition()
+        self._pending_bytes = 0
+        self._failed: list[tuple[str, BaseException]] = []
+
+    def __enter__(self) -> 'ImageSaver':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        for path, error in self.close():
+            logger.error('Failed to save %s: %s', path, error)
+
+    def save(self, img: Image.Image, path: str, formatting: str | None = None, **options: Any) -> Future[str]:
+        """
+        Ставит изображение в очередь на сохранение; Future возвращает путь или исключение записи.
+        """
+        size = img.width * img.height * len(img.getbands())
+        with self._condition:
+            # Изображение больше лимита всё равно принимается, когда очередь пуста.
+            while self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes:
+                self._condition.wait()
+            self._pending_bytes += size
+
+        return self._executor.submit(self._save, img, path, formatting, options, size)
+
+    def _save(self, img: Image.Image, path: str, formatting: str | None, options: dict[str, Any], size: int) -> str:
+        try:
+            save_image(img, path, formatting, self.preset, **options)
+            return path
+        except BaseException as exc:
+            with self._condition:
+                self._failed.append((path, exc))
+            raise
+        finally:
+            with self._condition:
+                self._pending_bytes -= size
+                self._condition.notify_all()
+
+    def close(self) -> list[tuple[str, BaseException]]:
+        """
+        Дожидается записи всех изображений; возвращает [(путь, исключение)] для неудачных.
+        """
+        self._executor.shutdown(wait=True)
+        with self._condition:
+            failed, self._failed = self._failed, []
+        return failed
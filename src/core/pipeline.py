@@ -0,0 +1,187 @@
+import logging
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+from uuid import uuid4
+
+import numpy as np
+from PIL import Image
+
+from ..database import insert_transformations
+from ..models import ImageData, TransformationRecord
+from .processing import (
+    POINT_TABLE_MODES,
+    Options,
+    apply_filter,
+    apply_point_table,
+    brightness_table,
+    change_brightness,
+    change_contrast,
+    compose_tables,
+    contrast_table,
+    histogram_mean,
+    resize,
+)
+
+logger = logging.getLogger(__name__)
+
+POINT_OPTIONS = (Options.Brightness, Options.Contrast)
+
+# Коэффициенты перевода RGB -> L, которые использует Pillow (ITU-R 601-2).
+GRAY_WEIGHTS = {'R': 0.299, 'G': 0.587, 'B': 0.114, 'L': 1.0}
+
+Step = tuple[Options, Any]
+
+
+class Pipeline:
+    """
+    Цепочка трансформаций, применяемых последовательно к результату предыдущего шага.
+
+    При optimize=True соседние поточечные операции (яркость, контраст) объединяются в одну таблицу
+    и выполняются за один проход.
+
+    При reorder=True уменьшение размера дополнительно переносится перед стоящими до него поточечными операциями.
+    Это быстрее, но результат отличается от последовательного выполнения: интерполяция и округление таблицы
+    не перестановочны, поэтому перестановка включается только явно.
+    """
+
+    def __init__(self, steps: Iterable[Step] = (), optimize: bool = True, reorder: bool = False) -> None:
+        self.steps: list[Step] = []
+        self.optimize = optimize
+        self.reorder = reorder
+        for option, params in steps:
+            self.add(option, params)
+
+    def add(self, option: Options, params: Any) -> 'Pipeline':
+        """Добавляет шаг в конец цепочки."""
+        if not isinstance(option, Options):
+            logger.error(
+                'Wrong argument for pipeline: %r. Available options: Resize, Brightness, Contrast, Filter.',
+                option,
+            )
+            raise AttributeError('Wrong argument. Available options are: Resize, Brightness, Contrast, Filter.')
+        self.steps.append((option, params))
+        return self
+
+    def plan(self, size: tuple[int, int]) -> list[list[Step]]:
+        """
+        Возвращает этапы выполнения для изображения размера size; каждый этап - один проход по изображению.
+        """
+        steps = self._reordered(size) if self.optimize and self.reorder else list(self.steps)
+        stages: list[list[Step]] = []
+        for step in steps:
+            if self.optimize and step[0] in POINT_OPTIONS and stages and stages[-1][0][0] in POINT_OPTIONS:
+                stages[-1].append(step)
+            else:
+                stages.append([step])
+        return stages
+
+    def _reordered(self, size: tuple[int, int]) -> list[Step]:
+        result: list[Step] = []
+        current = size
+        for option, params in self.steps:
+            if option == Options.Resize:
+                target = tuple(params)
+                position = len(result)
+                if target[0] * target[1] < current[0] * current[1]:
+                    while position > 0 and result[position - 1][0] in POINT_OPTIONS:
+                        position -= 1
+                result.insert(position, (option, params))
+                current = target
+            else:
+                result.append((option, params))
+        return result
+
+    def run(self, img: Image.Image, mean_brightness: float | None = None) -> Image.Image:
+        """
+        Применяет цепочку к изображению и возвращает результат.
+
+        mean_brightness: уже известная средняя яркость img, избавляет первый этап контраста от её подсчёта.
+        """
+        stages = self.plan(img.size)
+        logger.debug('Running pipeline: %d step(s) in %d stage(s)', len(self.steps), len(stages))
+        result = img
+        for index, stage in enumerate(stages):
+            result = self._run_stage(result, stage, mean_brightness if index == 0 else None)
+        return result
+
+    def apply(
+        self, img: Image.Image, data: ImageData, image_id: str, mean_brightness: float | None = None
+    ) -> tuple[Image.Image, list[TransformationRecord]]:
+        """
+        Применяет цепочку, дописывает историю ImageData и сохраняет все записи одной транзакцией.
+        """
+        if not self.steps:
+            logger.error('No operations provided for pipeline for image %s', image_id)
+            raise ValueError('No operations provided for apply_operation().')
+
+        result = self.run(img, mean_brightness)
+        return result, self.record(data, image_id)
+
+    def record(self, data: ImageData, image_id: str) -> list[TransformationRecord]:
+        """
+        Дописывает шаги цепочки в историю ImageData и сохраняет записи одной транзакцией (без вычислений).
+        """
+        applied_at = datetime.utcnow()
+        records = [
+            TransformationRecord(
+                id=str(uuid4()),
+                image_id=image_id,
+                name=option,
+                params=params,
+                applied_at=applied_at,
+            )
+            for option, params in self.steps
+        ]
+        data.updated_at = applied_at
+        data.history.extend(records)
+        logger.debug('ImageData updated_at=%s, history length=%d', data.updated_at, len(data.history))
+
+        insert_transformations(records)
+        logger.info('%d transformation(s) for image %s inserted into database', len(records), image_id)
+        return records
+
+    @staticmethod
+    def _run_stage(img: Image.Image, stage: list[Step], mean_brightness: float | None = None) -> Image.Image:
+        option, params = stage[0]
+
+        if option == Options.Resize:
+            return resize(img, tuple(params))
+
+        if option == Options.Filter:
+            return apply_filter(img, params)
+
+        if len(stage) == 1 or img.mode not in POINT_TABLE_MODES:
+            for point_option, factor in stage:
+                if point_option == Options.Brightness:
+                    img = change_brightness(img, float(factor))
+                else:
+                    img = change_contrast(img, float(factor), mean_brightness)
+                mean_brightness = None
+            return img
+
+        logger.debug('Fusing %d point operation(s) into one table', len(stage))
+        band_histograms = np.asarray(img.histogram(), dtype=np.int64).reshape(-1, 256)
+        table = list(range(256))
+        for point_option, factor in stage:
+            if point_option == Options.Brightness:
+                step_table = brightness_table(float(factor))
+            elif mean_brightness is not None:
+                step_table = contrast_table(float(factor), mean_brightness)
+            else:
+                step_table = contrast_table(float(factor), _mapped_gray_mean(img, band_histograms, table))
+            mean_brightness = None
+            table = compose_tables(table, step_table)
+        return apply_point_table(img, table)
+
+
+def _mapped_gray_mean(img: Image.Image, band_histograms: np.ndarray, table: list[int]) -> float:
+    """
+    Оценивает среднюю яркость (grayscale) изображения после применения таблицы по гистограммам каналов.
+    """
+    mean = 0.0
+    for band, histogram in zip(img.getbands(), band_histograms, strict=True):
+        if band in GRAY_WEIGHTS:
+            mapped = np.bincount(table, weights=histogram, minlength=256).astype(np.int64)
+            mean += GRAY_WEIGHTS[band] * histogram_mean(mapped.tolist())
+    return mean
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Режимы, пиксели которых хранятся как массив uint8 (h, w, каналы).
+PIXEL_CACHE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK')
+DEFAULT_PIXEL_CACHE_BYTES = 2 * 1024**3
+
+
+class PixelCache:
+    """
+    Дисковый кеш декодированных пикселей: файл .npy на изображение, читается через np.memmap.
+
+    Ключ - путь, размер и mtime файла, поэтому изменённый файл декодируется заново. Рядом с пикселями хранится
+    хеш содержимого, чтобы попадание в кеш не требовало и чтения исходного файла. При превышении max_bytes
+    удаляются давно не использованные записи (время использования - mtime файла .npy).
+    Для L, RGBA и CMYK изображение ссылается на отображённый файл без копирования, остальные режимы
+    распаковываются Pillow из отображённого буфера.
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_PIXEL_CACHE_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def _key(self, path: str) -> str:
+        stat = os.stat(path)
+        identity = f'{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}'
+        return hashlib.blake2b(identity.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, path: str) -> tuple[Image.Image, str] | None:
+        """
+        Возвращает (изображение, хеш содержимого) из кеша или None при промахе.
+        """
+        key = self._key(path)
+        pixels_path = self.directory / f'{key}.npy'
+        try:
+            meta = json.loads((self.directory / f'{key}.json').read_text(encoding='utf-8'))
+            pixels = np.load(pixels_path, mmap_mode='r')
+            os.utime(pixels_path)
+        except (OSError, ValueError):
+            logger.debug('Pixel cache miss: %s', path)
+            return None
+
+        img = Image.frombuffer(meta['mode'], tuple(meta['size']), pixels, 'raw', meta['mode'], 0, 1)
+        img.format = meta['format']
+        logger.debug('Pixel cache hit: %s (%s)', path, pixels_path)
+        return img, meta['content_hash']
+
+    def put(self, path: str, img: Image.Image, content_hash: str) -> None:
+        """
+        Сохраняет декодированные пиксели img для файла path (изображения других режимов не кешируются).
+        """
+        if img.mode not in PIXEL_CACHE_MODES:
+            logger.debug('Pixel cache skips mode %s: %s', img.mode, path)
+            return
+
+        key = self._key(path)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        pixels_path = self.directory / f'{key}.npy'
+        meta_path = self.directory / f'{key}.json'
+        # Запись через временные файлы и os.replace: параллельный процесс не увидит недописанную запись.
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        with open(pixels_path.with_suffix(tmp_suffix), 'wb') as f:
+            np.save(f, np.asarray(img))
+        os.replace(pixels_path.with_suffix(tmp_suffix), pixels_path)
+        meta = {'mode': img.mode, 'size': img.size, 'format': img.format, 'content_hash': content_hash}
+        meta_path.with_suffix(tmp_suffix).write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(meta_path.with_suffix(tmp_suffix), meta_path)
+        logger.debug('Pixel cache stored %s -> %s', path, pixels_path)
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Удаляет давно не использованные записи, пока размер кеша больше max_bytes; возвращает число удалённых.
+        """
+        return evict_lru(self.directory, '*.npy', self.max_bytes, ('.json',))
+
+
+def evict_lru(directory: Path, pattern: str, max_bytes: int, companions: tuple[str, ...] = ()) -> int:
+    """
+    Удаляет файлы pattern из directory по возрастанию mtime, пока их суммарный размер больше max_bytes.
+
+    companions: суффиксы сопутствующих файлов, удаляемых вместе с основным.
+    """
+    entries = []
+    for path in directory.glob(pattern):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for suffix in companions:
+            path.with_suffix(suffix).unlink(missing_ok=True)
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+
+    if removed:
+        logger.info('Evicted %d cache entr(ies) from %s, size now %d bytes', removed, directory, total)
+    return removed
@@ -1,13 +1,195 @@
 import logging
+import math
+import multiprocessing
+import os
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from typing import Any
 
 import numpy as np
 from numpy.typing import NDArray
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image, ImageEnhance, ImageFilter, ImageMode
+
+from .pyramid import pyramid_resize
 
 logger = logging.getLogger(__name__)
 
 
+EDGE_THRESHOLD = 128
+APPROXIMATE_SCALES = (1, 2, 4, 8)
+
+
+@dataclass(frozen=True)
+class GrayFeatures:
+    """
+    Признаки яркости, полученные за один проход по изображению.
+
+    histogram: 256-бинная гистограмма яркости
+    mean_brightness: средняя яркость
+    contrast: стандартное отклонение яркости
+    density: доля пикселей-границ (FIND_EDGES > EDGE_THRESHOLD)
+    """
+
+    histogram: list[int]
+    mean_brightness: float
+    contrast: float
+    density: float
+
+
+def to_gray(img: Image.Image) -> Image.Image:
+    """Переводит изображение в grayscale без лишней копии для режима 'L'."""
+    return img if img.mode == 'L' else img.convert('L')
+
+
+def histogram_mean(histogram: list[int]) -> float:
+    """Вычисляет среднюю яркость по 256-бинной гистограмме."""
+    hist: NDArray[np.int64] = np.asarray(histogram, dtype=np.int64)
+    total = int(hist.sum())
+    if total == 0:
+        return 0.0
+    return float(np.dot(np.arange(hist.size, dtype=np.int64), hist) / total)
+
+
+def histogram_std(histogram: list[int]) -> float:
+    """Вычисляет стандартное отклонение яркости по 256-бинной гистограмме."""
+    hist: NDArray[np.int64] = np.asarray(histogram, dtype=np.int64)
+    total = int(hist.sum())
+    if total == 0:
+        return 0.0
+    levels = np.arange(hist.size, dtype=np.float64)
+    mean = float(np.dot(levels, hist) / total)
+    return float(np.sqrt(np.dot((levels - mean) ** 2, hist) / total))
+
+
+def edge_histogram_density(edge_histogram: list[int]) -> float:
+    """Вычисляет долю пикселей-границ по гистограмме результата FIND_EDGES."""
+    total = sum(edge_histogram)
+    if total == 0:
+        return 0.0
+    return sum(edge_histogram[EDGE_THRESHOLD + 1 :]) / total
+
+
+def compute_features(img: Image.Image) -> GrayFeatures:
+    """Вычисляет гистограмму, яркость, контраст и плотность краёв за одно преобразование в grayscale."""
+    logger.debug(
+        'Computing fused features: size=%s, mode=%s',
+        getattr(img, 'size', None),
+        getattr(img, 'mode', None),
+    )
+    gray = to_gray(img)
+    histogram = gray.histogram()
+    edge_histogram = gray.filter(ImageFilter.FIND_EDGES).histogram()
+
+    features = GrayFeatures(
+        histogram=histogram,
+        mean_brightness=histogram_mean(histogram),
+        contrast=histogram_std(histogram),
+        density=edge_histogram_density(edge_histogram),
+    )
+    logger.debug(
+        'Fused features computed: mean_brightness=%f, contrast=%f, edge_density=%f',
+        features.mean_brightness,
+        features.contrast,
+        features.density,
+    )
+    return features
+
+
+def _strip_rows(img: Image.Image, max_memory: int) -> int:
+    """Подбирает высоту полосы так, чтобы полоса с копиями 'L' и краёв укладывалась в max_memory байт."""
+    pixel_bytes = 1 if img.mode in ('1', 'L', 'P') else 4
+    row_bytes = img.width * (pixel_bytes + 2)
+    return max(1, max_memory // row_bytes - 2)
+
+
+def compute_features_tiled(img: Image.Image, max_memory: int) -> GrayFeatures:
+    """
+    Вычисляет те же признаки, что и compute_features, обходя изображение горизонтальными полосами.
+
+    Полосы берутся с перекрытием в одну строку для ядра FIND_EDGES, поэтому результат совпадает с
+    compute_features. В памяти одновременно находятся только копии одной полосы.
+    """
+    width, height = img.size
+    rows = _strip_rows(img, max_memory)
+    logger.debug('Computing tiled features: size=%s, mode=%s, strip_rows=%d', img.size, img.mode, rows)
+
+    histogram: NDArray[np.int64] = np.zeros(256, dtype=np.int64)
+    edge_histogram: NDArray[np.int64] = np.zeros(256, dtype=np.int64)
+
+    for y0 in range(0, height, rows):
+        y1 = min(height, y0 + rows)
+        top = max(0, y0 - 1)
+        bottom = min(height, y1 + 1)
+        inner = (0, y0 - top, width, y1 - top)
+
+        gray = to_gray(img.crop((0, top, width, bottom)))
+        histogram += gray.crop(inner).histogram()
+        edge_histogram += gray.filter(ImageFilter.FIND_EDGES).crop(inner).histogram()
+
+    hist_list = [int(v) for v in histogram]
+    features = GrayFeatures(
+        histogram=hist_list,
+        mean_brightness=histogram_mean(hist_list),
+        contrast=histogram_std(hist_list),
+        density=edge_histogram_density([int(v) for v in edge_histogram]),
+    )
+    logger.debug(
+        'Tiled features computed: mean_brightness=%f, contrast=%f, edge_density=%f',
+        features.mean_brightness,
+        features.contrast,
+        features.density,
+    )
+    return features
+
+
+def approximate_view(img: Image.Image, scale: int) -> Image.Image:
+    """
+    Возвращает уменьшенное в scale раз grayscale-изображение для приближённого анализа.
+
+    JPEG-файлы заново открываются и декодируются сразу в уменьшенном масштабе (Image.draft), исходный img не
+    меняется. Для остальных форматов берётся каждый scale-й пиксель по обеим осям.
+    """
+    if scale not in APPROXIMATE_SCALES:
+        raise ValueError(f'Unsupported approximate scale: {scale}. Available: {APPROXIMATE_SCALES}.')
+    if scale == 1:
+        return img
+
+    width, height = img.size
+    target = (max(1, -(-width // scale)), max(1, -(-height // scale)))
+    filename = getattr(img, 'filename', '')
+
+    if img.format == 'JPEG' and filename:
+        logger.debug('Decoding JPEG draft of %s at scale 1/%d', filename, scale)
+        with Image.open(filename) as draft_src:
+            draft_src.draft('L', target)
+            draft_src.load()
+            return draft_src.convert('L')
+
+    logger.debug('Sampling every %d-th pixel of %s image', scale, img.format)
+    return to_gray(img.resize(target, Image.Resampling.NEAREST))
+
+
+def sampling_errors(features: GrayFeatures) -> tuple[float, float, float]:
+    """
+    Оценивает стандартные ошибки яркости, контраста и плотности краёв по числу проанализированных пикселей.
+
+    Это нижняя граница ошибки: учитывается только случайная ошибка выборки, а систематическое смещение
+    уменьшенного вида (усреднение при JPEG draft, края на другом масштабе) не оценивается и может быть больше.
+    """
+    n = sum(features.histogram)
+    if n == 0:
+        return 0.0, 0.0, 0.0
+    p = features.density
+    return (
+        features.contrast / math.sqrt(n),
+        features.contrast / math.sqrt(2 * n),
+        math.sqrt(p * (1 - p) / n),
+    )
+
+
 def compute_mean_brightness(img: Image.Image) -> float:
     """Вычисляет среднюю яркость (grayscale)."""
     logger.debug(
@@ -15,8 +197,7 @@ def compute_mean_brightness(img: Image.Image) -> float:
         getattr(img, 'size', None),
         getattr(img, 'mode', None),
     )
-    arr: NDArray[np.float32] = np.asarray(img.convert('L'), dtype=np.float32)
-    mean_value = float(arr.mean())
+    mean_value = histogram_mean(to_gray(img).histogram())
     logger.debug('Mean brightness computed: %f', mean_value)
     return mean_value
 
@@ -28,8 +209,7 @@ def compute_contrast(img: Image.Image) -> float:
         getattr(img, 'size', None),
         getattr(img, 'mode', None),
     )
-    arr: NDArray[np.float32] = np.asarray(img.convert('L'), dtype=np.float32)
-    contrast_value = float(arr.std())
+    contrast_value = histogram_std(to_gray(img).histogram())
     logger.debug('Contrast computed: %f', contrast_value)
     return contrast_value
 
@@ -41,10 +221,7 @@ def compute_edge_density(img: Image.Image) -> float:
         getattr(img, 'size', None),
         getattr(img, 'mode', None),
     )
-
-    arr: NDArray[np.float32] = np.asarray(img.convert('L').filter(ImageFilter.FIND_EDGES), dtype=np.float32)
-    edges_mask = arr > 128
-    density = float(edges_mask.mean())
+    density = edge_histogram_density(to_gray(img).filter(ImageFilter.FIND_EDGES).histogram())
     logger.debug('Edge density computed: %f', density)
     return density
 
@@ -56,51 +233,293 @@ class Options(Enum):
     Filter = 4
 
 
-def resize(img: Image.Image, size: tuple[int, int]) -> Image.Image:
-    """Изменение размера изображения."""
+def resize(img: Image.Image, size: tuple[int, int], use_pyramid: bool = False) -> Image.Image:
+    """
+    Изменение размера изображения.
+
+    use_pyramid: уменьшать с ближайшего уровня пирамиды исходника (кешируется между вызовами), а не с оригинала.
+    """
     logger.debug('Resizing image from %s to %s', getattr(img, 'size', None), size)
-    result = img.resize(size)
+    result = pyramid_resize(img, size) if use_pyramid else img.resize(size)
     logger.debug('Image resized: new_size=%s', getattr(result, 'size', None))
     return result
 
 
+POINT_TABLE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+POINT_TABLE_CACHE_SIZE = 256
+
+
+def blend_table(base: int, factor: float) -> list[int]:
+    """
+    Строит таблицу яркостей, совпадающую с Image.blend(base, img, factor) для 8-битного канала.
+    """
+    levels: NDArray[np.float32] = np.arange(256, dtype=np.float32)
+    values = np.float32(base) + np.float32(factor) * (levels - np.float32(base))
+    table = np.clip(np.trunc(values), 0, 255).astype(np.uint8)
+    return [int(v) for v in table]
+
+
+def brightness_table(factor: float) -> list[int]:
+    """Таблица изменения яркости (эквивалент ImageEnhance.Brightness)."""
+    return blend_table(0, factor)
+
+
+def contrast_table(factor: float, mean: float) -> list[int]:
+    """Таблица изменения контраста относительно средней яркости (эквивалент ImageEnhance.Contrast)."""
+    return blend_table(int(mean + 0.5), factor)
+
+
+def compose_tables(first: list[int], second: list[int]) -> list[int]:
+    """Объединяет две таблицы в одну: сначала first, затем second."""
+    return [second[v] for v in first]
+
+
+def expand_table(table: list[int], mode: str) -> list[int]:
+    """
+    Разворачивает таблицу на все каналы режима mode для Image.point; альфа-канал не меняется.
+    """
+    if mode not in POINT_TABLE_MODES:
+        raise ValueError(f'Point tables are not supported for mode {mode}.')
+    identity = list(range(256))
+    lut: list[int] = []
+    for band in ImageMode.getmode(mode).bands:
+        lut.extend(identity if band == 'A' else table)
+    return lut
+
+
+@lru_cache(maxsize=POINT_TABLE_CACHE_SIZE)
+def point_lut(operation: Options, factor: float, mode: str, base: int = 0) -> tuple[int, ...]:
+    """
+    Возвращает закешированную таблицу Image.point для операции над изображением режима mode.
+
+    base: уровень, относительно которого масштабируется яркость (0 для яркости, средняя яркость для контраста).
+    """
+    logger.debug('Building point table: operation=%s, factor=%s, mode=%s, base=%d', operation.name, factor, mode, base)
+    return tuple(expand_table(blend_table(base, factor), mode))
+
+
+def apply_point_table(img: Image.Image, table: list[int]) -> Image.Image:
+    """
+    Применяет таблицу к цветовым каналам изображения за один проход, альфа-канал не меняется.
+    """
+    return img.point(expand_table(table, img.mode))
+
+
 def change_brightness(img: Image.Image, factor: float) -> Image.Image:
     """Изменение яркости (factor: 1.0 = no change)."""
     logger.debug('Changing brightness with factor=%s', factor)
-    enhancer = ImageEnhance.Brightness(img)
-    result = enhancer.enhance(factor)
+    if img.mode in POINT_TABLE_MODES:
+        result = img.point(point_lut(Options.Brightness, factor, img.mode))
+    else:
+        enhancer = ImageEnhance.Brightness(img)
+        result = enhancer.enhance(factor)
     logger.debug('Brightness changed with factor=%s', factor)
     return result
 
 
-def change_contrast(img: Image.Image, factor: float) -> Image.Image:
-    """Изменение контраста."""
+def change_contrast(img: Image.Image, factor: float, mean: float | None = None) -> Image.Image:
+    """
+    Изменение контраста.
+
+    mean: средняя яркость img (например, ImageFeatures.mean_brightness); если не задана, вычисляется.
+    """
     logger.debug('Changing contrast with factor=%s', factor)
-    enhancer = ImageEnhance.Contrast(img)
-    result = enhancer.enhance(factor)
+    if img.mode in POINT_TABLE_MODES:
+        if mean is None:
+            mean = compute_mean_brightness(img)
+        result = img.point(point_lut(Options.Contrast, factor, img.mode, int(mean + 0.5)))
+    else:
+        enhancer = ImageEnhance.Contrast(img)
+        result = enhancer.enhance(factor)
     logger.debug('Contrast changed with factor=%s', factor)
     return result
 
 
-def apply_filter(img: Image.Image, ftype: str) -> Image.Image:
-    """Применяет фильтр (blur, sharpen, edge_enhance и т.п.)."""
-    logger.debug('Applying filter: type=%s, params=%r', ftype)
+PARALLEL_FILTER_MIN_PIXELS = 2_000_000
+PARALLEL_FILTER_MIN_ROWS = 64
+
+
+def _max_radius(radius: float | Sequence[float]) -> float:
+    return float(max(radius)) if isinstance(radius, Sequence) else float(radius)
+
+
+def filter_margin(image_filter: Any) -> int | None:
+    """
+    Возвращает число строк перекрытия, при котором фильтр полосы совпадает с фильтром всего изображения.
+
+    None - для фильтров, размер ядра которых неизвестен.
+    """
+    if isinstance(image_filter, ImageFilter.GaussianBlur):
+        radius = _max_radius(image_filter.radius)
+        # GaussianBlur в Pillow - три прохода box-фильтра с дисперсией radius**2 / 3 каждый.
+        box_radius = (math.sqrt(4 * radius**2 + 1) - 1) / 2
+        return 3 * (math.ceil(box_radius) + 1)
+
+    if isinstance(image_filter, ImageFilter.BoxBlur):
+        return math.ceil(_max_radius(image_filter.radius)) + 1
+
+    filterargs = getattr(image_filter, 'filterargs', None)
+    if filterargs is not None:
+        return max(filterargs[0]) // 2
+
+    return None
+
+
+def default_filter_workers(size: tuple[int, int]) -> int:
+    """
+    Число потоков для фильтрации: все ядра для больших изображений, один поток для маленьких.
+
+    В дочернем процессе (воркер пакетной обработки) - один поток: ядра уже заняты параллельными процессами.
+    """
+    if size[0] * size[1] < PARALLEL_FILTER_MIN_PIXELS or multiprocessing.parent_process() is not None:
+        return 1
+    return os.cpu_count() or 1
+
+
+def filter_parallel(img: Image.Image, image_filter: Any, workers: int | None = None) -> Image.Image:
+    """
+    Применяет фильтр Pillow по горизонтальным полосам в пуле потоков и склеивает результат.
+
+    Полосы перекрываются на filter_margin строк, поэтому результат совпадает с img.filter(image_filter).
+    Фильтры Pillow отпускают GIL, так что полосы обрабатываются параллельно.
+    """
+    if workers is None:
+        workers = default_filter_workers(img.size)
+    margin = filter_margin(image_filter)
+    width, height = img.size
+
+    rows = max(PARALLEL_FILTER_MIN_ROWS, 4 * (margin or 0), -(-height // max(workers, 1)))
+    if workers <= 1 or margin is None or rows >= height:
+        return img.filter(image_filter)
+
+    logger.debug('Filtering %s in strips: rows=%d, margin=%d, workers=%d', img.size, rows, margin, workers)
+    img.load()
+
+    def run_strip(y0: int) -> tuple[int, Image.Image]:
+        y1 = min(height, y0 + rows)
+        top = max(0, y0 - margin)
+        bottom = min(height, y1 + margin)
+        strip = img.crop((0, top, width, bottom)).filter(image_filter)
+        return y0, strip.crop((0, y0 - top, width, y1 - top))
+
+    result = Image.new(img.mode, img.size)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for y0, part in executor.map(run_strip, range(0, height, rows)):
+            result.paste(part, (0, y0))
+    return result
+
+
+BLUR_QUALITIES = ('auto', 'exact', 'box', 'downsample')
+DEFAULT_BLUR_RADIUS = 10.0
+BOX_BLUR_PASSES = 2
+# Ниже этого числа пикселей экономия приближений не окупается, всегда используется точный фильтр.
+BLUR_EXACT_MAX_PIXELS = 1_000_000
+# Минимальный радиус на уменьшенном изображении, при котором ошибка уменьшения и обратного увеличения мала.
+BLUR_DOWNSAMPLE_MIN_RADIUS = 4.0
+BLUR_MAX_DOWNSAMPLE = 16
+# Относительная стоимость способов размытия в проходах по изображению (по замерам на RGB 3000x2500).
+BLUR_PASS_COST = {'exact': 3.0, 'box': 2.6}
+BLUR_RESAMPLE_COST = 1.0
+
+
+def blur_downsample_factor(radius: float) -> int:
+    """Наибольший коэффициент уменьшения (степень двойки), после которого радиус остаётся достаточно большим."""
+    factor = 1
+    while factor < BLUR_MAX_DOWNSAMPLE and radius / (factor * 2) >= BLUR_DOWNSAMPLE_MIN_RADIUS:
+        factor *= 2
+    return factor
+
+
+def choose_blur_quality(size: tuple[int, int], radius: float) -> str:
+    """
+    Выбирает самый дешёвый способ размытия по оценке стоимости.
+
+    Стоимость считается в проходах по изображению (BLUR_PASS_COST): GaussianBlur - три прохода box-фильтра,
+    'box' - два прохода BoxBlur (с накладными расходами на промежуточное изображение), 'downsample' - уменьшение
+    и увеличение (около одного прохода) плюс три прохода по изображению, меньшему в factor**2 раз.
+    """
+    if size[0] * size[1] <= BLUR_EXACT_MAX_PIXELS or radius < BLUR_DOWNSAMPLE_MIN_RADIUS:
+        return 'exact'
+
+    costs = dict(BLUR_PASS_COST)
+    factor = blur_downsample_factor(radius)
+    if factor > 1:
+        costs['downsample'] = BLUR_RESAMPLE_COST + costs['exact'] / factor**2
+    return min(costs, key=costs.__getitem__)
+
+
+def blur(
+    img: Image.Image, radius: float = DEFAULT_BLUR_RADIUS, quality: str = 'auto', workers: int | None = None
+) -> Image.Image:
+    """
+    Размытие по Гауссу с радиусом radius (стандартное отклонение в пикселях).
+
+    quality: 'exact' - GaussianBlur, 'box' - несколько проходов BoxBlur с той же дисперсией, 'downsample' - размытие
+    уменьшенной копии с последующим увеличением, 'auto' - выбор по choose_blur_quality.
+    workers: число потоков для filter_parallel (None - автоматически).
+    """
+    if quality not in BLUR_QUALITIES:
+        raise ValueError(f'Unknown blur quality: {quality}. Available: {BLUR_QUALITIES}.')
+    if radius < 0:
+        raise ValueError(f'Blur radius must be non-negative: {radius}')
+
+    if quality == 'auto':
+        quality = choose_blur_quality(img.size, radius)
+    logger.debug('Blurring image: size=%s, radius=%s, quality=%s', img.size, radius, quality)
+
+    if quality == 'exact' or radius == 0:
+        return filter_parallel(img, ImageFilter.GaussianBlur(radius), workers)
+
+    if quality == 'box':
+        box_radius = (math.sqrt(12 * radius**2 / BOX_BLUR_PASSES + 1) - 1) / 2
+        result = img
+        for _ in range(BOX_BLUR_PASSES):
+            result = filter_parallel(result, ImageFilter.BoxBlur(box_radius), workers)
+        return result
+
+    factor = blur_downsample_factor(radius)
+    if factor == 1:
+        return filter_parallel(img, ImageFilter.GaussianBlur(radius), workers)
+
+    # Уменьшение (box) и билинейное увеличение сами дают размытие, вычитаем их дисперсию.
+    own_variance = (factor**2 - 1) / 12 + factor**2 / 6
+    small_radius = math.sqrt(max(radius**2 - own_variance, 0.0)) / factor
+    small = filter_parallel(img.reduce(factor), ImageFilter.GaussianBlur(small_radius), workers)
+    width, height = img.size
+    return small.resize(img.size, Image.Resampling.BILINEAR, box=(0, 0, width / factor, height / factor))
+
+
+def apply_filter(img: Image.Image, ftype: str, workers: int | None = None) -> Image.Image:
+    """
+    Применяет фильтр (blur, sharpen, edge_enhance и т.п.).
+
+    Для размытия можно указать радиус и способ: 'blur:25', 'blur:25:downsample'.
+    workers: число потоков для обработки полосами (None - все ядра для больших изображений).
+    """
+    logger.debug('Applying filter: type=%s', ftype)
+    name, _, args = ftype.partition(':')
 
-    if ftype == 'blur':
-        logger.debug('Applying GaussianBlur with radius=%s', 10)
-        result = img.filter(ImageFilter.GaussianBlur(10))
+    if name == 'blur':
+        radius_arg, _, quality = args.partition(':')
+        try:
+            radius = float(radius_arg) if radius_arg else DEFAULT_BLUR_RADIUS
+        except ValueError:
+            logger.error('Wrong blur radius: %s', radius_arg)
+            raise ValueError(f'Wrong blur radius: {radius_arg}') from None
+        logger.debug('Applying GaussianBlur with radius=%s, quality=%s', radius, quality or 'auto')
+        result = blur(img, radius, quality or 'auto', workers)
 
     elif ftype == 'sharpen':
         logger.debug('Applying SHARPEN filter')
-        result = img.filter(ImageFilter.SHARPEN)
+        result = filter_parallel(img, ImageFilter.SHARPEN, workers)
 
     elif ftype == 'edge_enhance':
         logger.debug('Applying EDGE_ENHANCE filter')
-        result = img.filter(ImageFilter.EDGE_ENHANCE)
+        result = filter_parallel(img, ImageFilter.EDGE_ENHANCE, workers)
 
     elif ftype == 'edges':
         logger.debug('Applying FIND_EDGES filter')
-        result = img.filter(ImageFilter.FIND_EDGES)
+        result = filter_parallel(img, ImageFilter.FIND_EDGES, workers)
 
     else:
         logger.error('Unknown filter type: %s', ftype)
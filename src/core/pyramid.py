@@ -0,0 +1,95 @@
+import logging
+import threading
+import weakref
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+PYRAMID_CACHE_SIZE = 4
+# Image.reduce не поддерживает палитровые, однобитные и 16-битные изображения.
+PYRAMID_UNSUPPORTED_MODES = ('P', '1', 'I;16', 'I;16L', 'I;16B', 'I;16N')
+
+
+class ImagePyramid:
+    """
+    Уровни изображения с уменьшением в 2, 4, 8... раз, построенные через Image.reduce(2) по мере надобности.
+
+    Каждый уровень считается из предыдущего, поэтому следующий уровень стоит четверть предыдущего.
+    Сам исходник хранится по слабой ссылке: пирамида в кеше не удерживает полноразмерное изображение.
+    """
+
+    def __init__(self, img: Image.Image) -> None:
+        self.source = weakref.ref(img)
+        self.levels: list[Image.Image] = []
+        self._lock = threading.Lock()
+
+    def level_for(self, img: Image.Image, size: tuple[int, int]) -> Image.Image:
+        """
+        Возвращает самый маленький уровень img, который не меньше size по обеим сторонам.
+        """
+        width, height = size
+        with self._lock:
+            current = img
+            for index in range(len(self.levels) + 1):
+                if current.width < 2 * width or current.height < 2 * height:
+                    break
+                if index == len(self.levels):
+                    self.levels.append(current.reduce(2))
+                    logger.debug('Pyramid level %d built: %s', index + 1, self.levels[-1].size)
+                current = self.levels[index]
+            return current
+
+
+_cache_lock = threading.Lock()
+_cache: OrderedDict[int, ImagePyramid] = OrderedDict()
+
+
+def pyramid_for(img: Image.Image) -> ImagePyramid:
+    """
+    Возвращает пирамиду изображения из кеша последних PYRAMID_CACHE_SIZE исходников (или строит новую).
+    """
+    key = id(img)
+    with _cache_lock:
+        pyramid = _cache.get(key)
+        if pyramid is not None and pyramid.source() is img:
+            _cache.move_to_end(key)
+            return pyramid
+
+        # Пирамиды уже удалённых исходников держат только свои уровни - их не ждём до вытеснения.
+        for stale in [stale for stale, cached in _cache.items() if cached.source() is None]:
+            del _cache[stale]
+        pyramid = ImagePyramid(img)
+        _cache[key] = pyramid
+        while len(_cache) > PYRAMID_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return pyramid
+
+
+def pyramid_resize(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    """
+    Уменьшает img до size, начиная с самого маленького уровня пирамиды, который не меньше size.
+    """
+    if img.mode in PYRAMID_UNSUPPORTED_MODES or size[0] <= 0 or size[1] <= 0:
+        return img.resize(size)
+    try:
+        level = pyramid_for(img).level_for(img, size)
+    except ValueError:
+        logger.debug('Image.reduce does not support mode %s, resizing directly', img.mode)
+        return img.resize(size)
+    logger.debug('Resizing from pyramid level %s to %s', level.size, size)
+    return level.resize(size)
+
+
+def renditions(img: Image.Image, sizes: list[tuple[int, int]]) -> list[Image.Image]:
+    """
+    Строит несколько уменьшенных копий img по одной пирамиде (от крупных к мелким уровни считаются один раз).
+    """
+    return [pyramid_resize(img, size) for size in sizes]
+
+
+def clear_pyramids() -> None:
+    """Очищает кеш пирамид."""
+    with _cache_lock:
+        _cache.clear()
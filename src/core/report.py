@@ -0,0 +1,163 @@
+import logging
+import os
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+from .io import save_image
+from .visualization import BACKGROUND, FOREGROUND, fit_image, render_histogram
+
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = 3
+REPORT_ROWS = 8
+THUMB_SIZE = (240, 180)
+CAPTION_HEIGHT = 20
+TILE_PADDING = 10
+SHEET_NAME = 'sheet_{:04d}.jpg'
+# Пул отчёта работает одновременно с пулом пакетной обработки и по умолчанию не отнимает у неё ядра.
+REPORT_WORKERS = 1
+
+
+@dataclass
+class ReportEntry:
+    """
+    Одна строка отчёта: исходное изображение, результат и гистограмма исходника.
+
+    path: путь к исходному изображению
+    output_path: путь к результату трансформации (None, если результата нет)
+    histogram: гистограмма яркости исходника
+    title: подпись плитки (по умолчанию имя файла)
+    """
+
+    path: str
+    output_path: str | None = None
+    histogram: list[int] | None = None
+    title: str | None = None
+
+
+def load_thumbnail(path: str, box: tuple[int, int] = THUMB_SIZE) -> Image.Image:
+    """
+    Открывает изображение сразу в уменьшенном виде: для JPEG декодируется с понижением масштаба (draft).
+    """
+    with Image.open(path) as img:
+        img.draft('RGB', box)
+        return fit_image(img, box)
+
+
+def _placeholder(text: str, box: tuple[int, int] = THUMB_SIZE) -> Image.Image:
+    img = Image.new('RGB', box, (230, 230, 230))
+    ImageDraw.Draw(img).text((box[0] // 2, box[1] // 2), text, fill=FOREGROUND, anchor='mm')
+    return img
+
+
+def _panel(path: str | None) -> Image.Image:
+    if path is None:
+        return _placeholder('no output')
+    try:
+        return load_thumbnail(path)
+    except Exception:
+        # Одно нечитаемое или неподдерживаемое изображение не должно останавливать весь отчёт.
+        logger.exception('Failed to load thumbnail: %s', path)
+        return _placeholder('unreadable')
+
+
+def render_tile(entry: ReportEntry) -> Image.Image:
+    """
+    Рисует плитку отчёта: 'до', 'после' и гистограмма в ряд, под ними подпись.
+    """
+    thumb_w, thumb_h = THUMB_SIZE
+    tile = Image.new('RGB', (3 * thumb_w + 2 * TILE_PADDING, thumb_h + CAPTION_HEIGHT), BACKGROUND)
+    histogram = render_histogram(entry.histogram, THUMB_SIZE) if entry.histogram else _placeholder('no histogram')
+
+    for index, panel in enumerate((_panel(entry.path), _panel(entry.output_path), histogram)):
+        left = index * (thumb_w + TILE_PADDING)
+        tile.paste(panel, (left + (thumb_w - panel.width) // 2, (thumb_h - panel.height) // 2))
+
+    title = entry.title or os.path.basename(entry.path)
+    ImageDraw.Draw(tile).text((0, thumb_h + CAPTION_HEIGHT // 2), title, fill=FOREGROUND, anchor='lm')
+    return tile
+
+
+def render_sheet(entries: list[ReportEntry], columns: int = REPORT_COLUMNS) -> Image.Image:
+    """
+    Собирает страницу отчёта из плиток entries (по columns в ряд).
+    """
+    rows = -(-len(entries) // columns)
+    tile_w = 3 * THUMB_SIZE[0] + 2 * TILE_PADDING
+    tile_h = THUMB_SIZE[1] + CAPTION_HEIGHT
+    sheet = Image.new(
+        'RGB',
+        (columns * (tile_w + 2 * TILE_PADDING), max(rows, 1) * (tile_h + 2 * TILE_PADDING)),
+        BACKGROUND,
+    )
+    for index, entry in enumerate(entries):
+        row, column = divmod(index, columns)
+        tile = render_tile(entry)
+        sheet.paste(
+            tile,
+            (TILE_PADDING + column * (tile_w + 2 * TILE_PADDING), TILE_PADDING + row * (tile_h + 2 * TILE_PADDING)),
+        )
+    return sheet
+
+
+def write_sheet(entries: list[ReportEntry], path: str, columns: int = REPORT_COLUMNS) -> str:
+    """
+    Рисует и сохраняет одну страницу отчёта; возвращает путь к ней.
+    """
+    save_image(render_sheet(entries, columns), path, preset='fast')
+    return path
+
+
+def _pages(entries: Iterable[ReportEntry], per_page: int) -> Iterator[list[ReportEntry]]:
+    iterator = iter(entries)
+    while page := list(islice(iterator, per_page)):
+        yield page
+
+
+def write_report(
+    entries: Iterable[ReportEntry],
+    directory: str | Path,
+    columns: int = REPORT_COLUMNS,
+    rows: int = REPORT_ROWS,
+    workers: int = REPORT_WORKERS,
+) -> list[str]:
+    """
+    Раскладывает entries по страницам columns x rows и рисует страницы в пуле процессов.
+
+    entries читаются лениво, а в работе одновременно не больше двух страниц на процесс, поэтому память
+    не зависит от числа изображений. Каждая страница открывает только свои изображения и сразу уменьшает их.
+    Возвращает пути записанных страниц в порядке следования; страницы, которые не удалось записать, пропускаются.
+    """
+    directory = Path(directory)
+    per_page = columns * rows
+    logger.info('Writing contact sheets to %s: %d per page, workers=%d', directory, per_page, workers)
+
+    sheets: list[str] = []
+    pending: deque[tuple[str, Future[str]]] = deque()
+
+    def collect() -> None:
+        path, future = pending.popleft()
+        try:
+            sheets.append(future.result())
+        except Exception:
+            logger.exception('Failed to write contact sheet %s', path)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for number, page in enumerate(_pages(entries, per_page), start=1):
+            if len(pending) >= 2 * workers:
+                collect()
+            path = str(directory / SHEET_NAME.format(number))
+            pending.append((path, executor.submit(write_sheet, page, path, columns)))
+            logger.debug('Contact sheet %d queued: %d image(s)', number, len(page))
+
+        while pending:
+            collect()
+
+    logger.info('Report finished: %d sheet(s) in %s', len(sheets), directory)
+    return sheets
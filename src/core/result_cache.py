@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any
+
+from PIL import Image
+
+from .io import save_image
+from .pixel_cache import evict_lru
+from .processing import Options
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESULT_CACHE_BYTES = 1024**3
+# Режимы, которые PNG сохраняет без потерь; результаты других режимов не кешируются.
+# 'I' (32 бита со знаком) PNG записывает как 16 бит без знака, значения вне 0..65535 обрезались бы.
+RESULT_CACHE_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I;16')
+
+
+def canonical_operation(op: dict[Options, Any]) -> list[list[Any]]:
+    """
+    Приводит цепочку операций к виду, не зависящему от типов параметров: [[имя, параметры], ...] в порядке шагов.
+    """
+    steps = []
+    for option, params in op.items():
+        if option == Options.Resize:
+            value: Any = [int(side) for side in params]
+        elif option in (Options.Brightness, Options.Contrast):
+            value = float(params)
+        else:
+            value = str(params).strip().lower()
+        steps.append([option.name, value])
+    return steps
+
+
+class ResultCache:
+    """
+    Дисковый кеш результатов трансформаций: PNG без потерь на пару (хеш содержимого исходника, цепочка операций).
+
+    При превышении max_bytes удаляются давно не использованные результаты (время использования - mtime файла).
+    """
+
+    def __init__(self, directory: str | Path, max_bytes: int = DEFAULT_RESULT_CACHE_BYTES) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, content_hash: str, op: dict[Options, Any]) -> str:
+        """Ключ результата цепочки op для исходника с хешем содержимого content_hash."""
+        spec = json.dumps([content_hash, canonical_operation(op)], separators=(',', ':'))
+        return hashlib.blake2b(spec.encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Image.Image | None:
+        """
+        Возвращает сохранённый результат или None при промахе.
+        """
+        path = self.directory / f'{key}.png'
+        try:
+            img = Image.open(path)
+            img.load()
+            os.utime(path)
+        except OSError:
+            logger.debug('Result cache miss: %s', key)
+            return None
+
+        logger.debug('Result cache hit: %s', key)
+        return img
+
+    def put(self, key: str, img: Image.Image) -> None:
+        """
+        Сохраняет результат трансформации под ключом key.
+        """
+        if img.mode not in RESULT_CACHE_MODES:
+            logger.debug('Result cache skips mode %s', img.mode)
+            return
+        save_image(img, str(self.directory / f'{key}.png'), 'PNG', preset='fast')
+        evict_lru(self.directory, '*.png', self.max_bytes)
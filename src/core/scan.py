@@ -0,0 +1,116 @@
+import logging
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+
+from ..database import delete_manifest_entries, load_manifest, upsert_manifest_entry
+from .analysis import analyze
+from .batch import IMAGE_EXTENSIONS
+from .io import iter_images
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScanReport:
+    """
+    Итог инкрементального сканирования директории.
+
+    added: новые файлы
+    changed: файлы, у которых изменились размер или mtime
+    unchanged: число файлов без изменений
+    deleted: файлы, пропавшие с диска
+    failed: файлы, которые не удалось проанализировать, и текст ошибки
+    failed_dirs: директории, которые не удалось прочитать; записи манифеста под ними не удаляются
+    """
+
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+    deleted: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    failed_dirs: list[str] = field(default_factory=list)
+
+
+def iter_image_files(root: str, failed_dirs: list[str] | None = None) -> Iterator[tuple[str, os.stat_result]]:
+    """
+    Рекурсивно обходит директорию через os.scandir и отдаёт (путь, stat) для изображений.
+
+    failed_dirs: список, в который добавляются директории, обход которых прервался ошибкой.
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                        yield entry.path, entry.stat()
+        except OSError:
+            logger.exception('Failed to scan directory: %s', directory)
+            if failed_dirs is not None:
+                failed_dirs.append(directory)
+
+
+def _is_under(path: str, directories: list[str]) -> bool:
+    return any(path == directory or path.startswith(directory + os.sep) for directory in directories)
+
+
+def scan_directory(root: str, max_memory: int | None = None, sample_scale: int = 1) -> ScanReport:
+    """
+    Анализирует только новые и изменённые файлы директории, сверяясь с манифестом в базе данных.
+
+    Файлы читаются в фоне (iter_images), пока анализируется предыдущий; декодирование идёт при анализе,
+    поэтому файлы с сохранёнными признаками не декодируются, а sample_scale может использовать JPEG draft.
+    """
+    root = os.path.abspath(root)
+    logger.info('Scanning %s', root)
+
+    known = load_manifest(root)
+    report = ScanReport()
+
+    pending: dict[str, tuple[os.stat_result, bool]] = {}
+    for path, stat in iter_image_files(root, report.failed_dirs):
+        previous = known.pop(path, None)
+        if previous == (stat.st_size, stat.st_mtime_ns):
+            report.unchanged += 1
+            continue
+        logger.debug('File %s is %s', path, 'new' if previous is None else 'changed')
+        pending[path] = (stat, previous is None)
+
+    for loaded in iter_images(pending):
+        stat, is_new = pending[loaded.path]
+        if loaded.img is None or loaded.data is None:
+            report.failed[loaded.path] = str(loaded.error)
+            continue
+        try:
+            features = analyze(loaded.img, loaded.data.id, max_memory=max_memory, sample_scale=sample_scale)
+        except Exception as exc:
+            logger.exception('Failed to analyze %s', loaded.path)
+            report.failed[loaded.path] = f'{type(exc).__name__}: {exc}'
+            continue
+        finally:
+            # Изображение с сохранёнными признаками не декодировалось и ещё держит файл открытым.
+            loaded.img.close()
+
+        upsert_manifest_entry(loaded.path, stat.st_size, stat.st_mtime_ns, features.image_id, features.id)
+        (report.added if is_new else report.changed).append(loaded.path)
+
+    # Файлы в непрочитанных директориях могли остаться на диске: их записи сохраняются до следующего сканирования.
+    report.deleted = sorted(path for path in known if not _is_under(path, report.failed_dirs))
+    if report.deleted:
+        delete_manifest_entries(report.deleted)
+
+    logger.info(
+        'Scan of %s finished: added=%d, changed=%d, unchanged=%d, deleted=%d, failed=%d, failed directories=%d',
+        root,
+        len(report.added),
+        len(report.changed),
+        report.unchanged,
+        len(report.deleted),
+        len(report.failed),
+        len(report.failed_dirs),
+    )
+    return report
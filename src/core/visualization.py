@@ -1,28 +1,48 @@
 import logging
 from pathlib import Path
+from typing import Any
 
-import matplotlib.pyplot as plt
 import numpy as np
 from numpy.typing import NDArray
-from PIL import Image
+from PIL import Image, ImageDraw
 
 from ..models import ImageFeatures
+from .pyramid import pyramid_resize
 
 logger = logging.getLogger(__name__)
 
+VISUALIZATION_BACKENDS = ('pillow', 'matplotlib')
+HISTOGRAM_SIZE = (800, 400)
+COMPARISON_SIZE = (1400, 700)
+BACKGROUND = (255, 255, 255)
+FOREGROUND = (0, 0, 0)
+BAR_COLOR = (31, 119, 180)
+MARGIN = 40
+COMPARISON_PATH = 'data/comparison.jpg'
+
+
+def _load_pyplot() -> Any:
+    """Импортирует matplotlib.pyplot (необязательная зависимость для backend='matplotlib')."""
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError as exc:
+        logger.error('matplotlib is not installed, backend="matplotlib" is unavailable')
+        raise ImportError('matplotlib is required for backend="matplotlib": pip install matplotlib') from exc
+    return plt
 
-def plot_histogram(result: ImageFeatures, save_path: str | None = None) -> None:
-    """
-    Рисует/сохраняет гистограмму на основе result['features']['histogram'].
-    """
-    logger.info('Plotting histogram for image %s', result.image_id)
 
+def _check_backend(backend: str) -> None:
+    if backend not in VISUALIZATION_BACKENDS:
+        raise ValueError(f'Unknown visualization backend: {backend}. Available: {VISUALIZATION_BACKENDS}.')
+
+
+def _validated_histogram(result: ImageFeatures) -> NDArray[np.float64]:
     hist = result.histogram
     if hist is None:
         logger.error('Histogram is None for image %s', result.image_id)
         raise ValueError('Nothing to visualize.')
 
-    hist_ar: NDArray[np.float32] = np.asarray(hist)
+    hist_ar: NDArray[np.float64] = np.asarray(hist, dtype=np.float64)
     if hist_ar.ndim != 1 or hist_ar.size == 0:
         logger.error('Invalid histogram for image %s: shape=%s', result.image_id, hist_ar.shape)
         raise ValueError('Nothing to visualize.')
@@ -33,7 +53,118 @@ def plot_histogram(result: ImageFeatures, save_path: str | None = None) -> None:
         float(np.min(hist_ar)),
         float(np.max(hist_ar)),
     )
+    return hist_ar
+
+
+def _save_or_show(img: Image.Image, save_path: str | None) -> None:
+    if save_path is None:
+        logger.debug('Showing image interactively')
+        img.show()
+        return
+    saved_path = Path(save_path)
+    saved_path.parent.mkdir(parents=True, exist_ok=True)
+    img.save(saved_path, quality=90)
+
 
+def render_histogram(histogram: list[int] | NDArray[Any], size: tuple[int, int] = HISTOGRAM_SIZE) -> Image.Image:
+    """
+    Рисует гистограмму средствами NumPy и Pillow: одна заливка массива вместо прямоугольника на каждый бин.
+    """
+    width, height = size
+    hist_ar = np.asarray(histogram, dtype=np.float64)
+    plot_w, plot_h = width - 2 * MARGIN, height - 2 * MARGIN
+
+    # Для каждого столбца пикселей - высота бина, в который он попадает (максимум, если бинов больше столбцов).
+    starts = np.arange(plot_w) * hist_ar.size // plot_w
+    columns = np.maximum.reduceat(hist_ar, starts) if plot_w < hist_ar.size else hist_ar[starts]
+    peak = hist_ar.max()
+    bar_heights = np.rint(columns / peak * plot_h).astype(np.int64) if peak > 0 else np.zeros(plot_w, np.int64)
+
+    canvas = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+    rows = np.arange(plot_h)[:, None]
+    mask = rows >= plot_h - bar_heights[None, :]
+    canvas[MARGIN : MARGIN + plot_h, MARGIN : MARGIN + plot_w][mask] = BAR_COLOR
+
+    img = Image.fromarray(canvas, mode='RGB')
+    draw = ImageDraw.Draw(img)
+    left, top, right, bottom = MARGIN, MARGIN, MARGIN + plot_w, MARGIN + plot_h
+    draw.line([(left, top), (left, bottom), (right, bottom)], fill=FOREGROUND)
+    draw.text((width // 2, MARGIN // 2), 'Histogram', fill=FOREGROUND, anchor='mm')
+    draw.text((width // 2, height - MARGIN // 2), 'Brightness', fill=FOREGROUND, anchor='mm')
+    draw.text((left, bottom + 4), '0', fill=FOREGROUND, anchor='mt')
+    draw.text((right, bottom + 4), str(hist_ar.size - 1), fill=FOREGROUND, anchor='mt')
+    draw.text((left - 4, top), f'{int(peak)}', fill=FOREGROUND, anchor='rm')
+    return img
+
+
+def to_8bit(img: Image.Image) -> Image.Image:
+    """
+    Приводит изображение с глубиной больше 8 бит (I;16*, I, F) к режиму L для показа; остальные не меняет.
+
+    I;16 сдвигается на 8 бит, у I и F диапазон значений растягивается на 0..255.
+    """
+    if img.mode.startswith('I;16'):
+        arr = (np.asarray(img).astype(np.uint32) >> 8).astype(np.uint8)
+    elif img.mode in ('I', 'F'):
+        values = np.asarray(img, dtype=np.float64)
+        low, high = float(values.min()), float(values.max())
+        scale = 255.0 / (high - low) if high > low else 0.0
+        arr = np.rint((values - low) * scale).astype(np.uint8)
+    else:
+        return img
+    return Image.fromarray(arr)
+
+
+def fit_image(img: Image.Image, box: tuple[int, int]) -> Image.Image:
+    """
+    Уменьшает изображение, чтобы оно помещалось в box с сохранением пропорций.
+
+    Уменьшение идёт с уровня пирамиды изображения, поэтому повторные миниатюры того же исходника
+    не пересчитывают уровни.
+    """
+    img = to_8bit(img)
+    scale = min(box[0] / img.width, box[1] / img.height, 1.0)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.convert('RGB') if size == img.size else pyramid_resize(img, size).convert('RGB')
+
+
+def render_comparison(
+    original: Image.Image, modified: Image.Image, size: tuple[int, int] = COMPARISON_SIZE
+) -> Image.Image:
+    """
+    Собирает коллаж 'до/после' нужного размера; изображения уменьшаются до размера панелей до компоновки.
+    """
+    width, height = size
+    panel = ((width - 3 * MARGIN // 2) // 2, height - 2 * MARGIN)
+    canvas = Image.new('RGB', size, BACKGROUND)
+    draw = ImageDraw.Draw(canvas)
+
+    for index, (title, img) in enumerate((('Original', original), ('Modified', modified))):
+        left = MARGIN // 2 + index * (panel[0] + MARGIN // 2)
+        thumb = fit_image(img, panel)
+        canvas.paste(thumb, (left + (panel[0] - thumb.width) // 2, MARGIN + (panel[1] - thumb.height) // 2))
+        draw.text((left + panel[0] // 2, MARGIN // 2), title, fill=FOREGROUND, anchor='mm')
+    return canvas
+
+
+def plot_histogram(result: ImageFeatures, save_path: str | None = None, backend: str = 'pillow') -> None:
+    """
+    Рисует/сохраняет гистограмму на основе result['features']['histogram'].
+
+    backend: 'pillow' - быстрая отрисовка NumPy/Pillow, 'matplotlib' - график matplotlib (необязательная зависимость).
+    """
+    logger.info('Plotting histogram for image %s (backend=%s)', result.image_id, backend)
+    _check_backend(backend)
+    hist_ar = _validated_histogram(result)
+
+    if backend == 'pillow':
+        img = render_histogram(hist_ar)
+        if save_path is not None:
+            logger.info('Saving histogram to %s', save_path)
+        _save_or_show(img, save_path)
+        return
+
+    plt = _load_pyplot()
     plt.rcParams['font.family'] = 'serif'
     plt.rcParams['font.style'] = 'normal'
     fig, ax = plt.subplots(figsize=(8, 4))
@@ -61,25 +192,43 @@ def plot_histogram(result: ImageFeatures, save_path: str | None = None) -> None:
         plt.close(fig)
 
 
-def compare_before_after(original: Image.Image, modified: Image.Image) -> None:
+def compare_before_after(
+    original: Image.Image,
+    modified: Image.Image,
+    save_path: str | None = COMPARISON_PATH,
+    backend: str = 'pillow',
+) -> None:
     """
-    Создаёт коллаж 'до/после' и сохраняет/показывает.
+    Создаёт коллаж 'до/после' и сохраняет в save_path (None - показывает).
+
+    Для просмотра многих изображений сразу см. src.core.report.write_report.
     """
     logger.info(
-        "Creating 'before/after' comparison: original_size=%s, modified_size=%s",
+        "Creating 'before/after' comparison: original_size=%s, modified_size=%s, backend=%s",
         getattr(original, 'size', None),
         getattr(modified, 'size', None),
+        backend,
     )
+    _check_backend(backend)
+
+    if backend == 'pillow':
+        if save_path is not None:
+            logger.info("Saving 'before/after' comparison to %s", save_path)
+        _save_or_show(render_comparison(original, modified), save_path)
+        return
 
+    plt = _load_pyplot()
     plt.rcParams['font.family'] = 'serif'
     plt.rcParams['font.style'] = 'normal'
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 7))
 
-    ax1.imshow(original.convert('RGB'))
+    # Фигура 14x7 дюймов при dpi=200: больше 1400 пикселей на панель не видно.
+    panel = (COMPARISON_SIZE[0], COMPARISON_SIZE[0])
+    ax1.imshow(fit_image(original, panel))
     ax1.set_title('Original')
     ax1.axis('off')
 
-    ax2.imshow(modified.convert('RGB'))
+    ax2.imshow(fit_image(modified, panel))
     ax2.set_title('Modified')
     ax2.axis('off')
 
@@ -87,10 +236,13 @@ def compare_before_after(original: Image.Image, modified: Image.Image) -> None:
     plt.subplots_adjust(wspace=0.02, hspace=0.02)
 
     try:
-        saved_path = Path('data/comparison.jpg')
-        logger.info("Saving 'before/after' comparison to %s", saved_path)
-        saved_path.parent.mkdir(parents=True, exist_ok=True)
-        fig.savefig(saved_path, bbox_inches='tight', dpi=200, facecolor='white')
-
+        if save_path is not None:
+            saved_path = Path(save_path)
+            logger.info("Saving 'before/after' comparison to %s", saved_path)
+            saved_path.parent.mkdir(parents=True, exist_ok=True)
+            fig.savefig(saved_path, bbox_inches='tight', dpi=200, facecolor='white')
+        else:
+            logger.debug("Showing 'before/after' comparison interactively")
+            plt.show()
     finally:
         plt.close(fig)
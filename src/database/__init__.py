@@ -1,3 +1,50 @@
-from .sqlite import init_db, insert_image_features, insert_transformation
+from .aggregates import FeatureAggregates
+from .queries import iter_transformations, query_image_features
+from .sqlite import (
+    delete_manifest_entries,
+    flush_writes,
+    get_aggregates,
+    get_histogram,
+    get_image_features,
+    init_db,
+    insert_image_features,
+    insert_transformation,
+    insert_transformations,
+    iter_histograms,
+    iter_image_hashes,
+    load_manifest,
+    rebuild_aggregates,
+    rebuild_histogram_index,
+    search_histograms,
+    start_write_behind,
+    stop_write_behind,
+    upsert_manifest_entry,
+    write_behind,
+)
+from .writer import BatchWriter
 
-__all__ = ['init_db', 'insert_transformation', 'insert_image_features']
+__all__ = [
+    'init_db',
+    'insert_transformation',
+    'insert_transformations',
+    'insert_image_features',
+    'get_image_features',
+    'get_histogram',
+    'iter_histograms',
+    'iter_image_hashes',
+    'load_manifest',
+    'upsert_manifest_entry',
+    'delete_manifest_entries',
+    'search_histograms',
+    'rebuild_histogram_index',
+    'BatchWriter',
+    'start_write_behind',
+    'stop_write_behind',
+    'flush_writes',
+    'write_behind',
+    'query_image_features',
+    'iter_transformations',
+    'FeatureAggregates',
+    'get_aggregates',
+    'rebuild_aggregates',
+]
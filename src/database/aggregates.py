@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .histogram_index import HISTOGRAM_BINS
+
+logger = logging.getLogger(__name__)
+
+# Имя метрики -> столбец image_features.
+AGGREGATE_METRICS = {'brightness': 'mean_brightness', 'contrast': 'contrast', 'density': 'density'}
+AGGREGATE_HISTOGRAM_DTYPE = np.dtype('<i8')
+
+AGGREGATES_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS feature_aggregates (
+        format          TEXT PRIMARY KEY,
+        count           INTEGER NOT NULL,
+        brightness_sum  REAL NOT NULL,
+        brightness_sq   REAL NOT NULL,
+        contrast_sum    REAL NOT NULL,
+        contrast_sq     REAL NOT NULL,
+        density_sum     REAL NOT NULL,
+        density_sq      REAL NOT NULL,
+        histogram_blob  BLOB NOT NULL
+    )
+"""
+
+# Вклад одного изображения: (format, mean_brightness, contrast, density, histogram).
+Contribution = tuple[str, float, float, float, list[int] | NDArray[np.integer]]
+
+
+def _zero_histogram() -> NDArray[np.int64]:
+    return np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+
+@dataclass
+class FeatureAggregates:
+    """
+    Суммарная статистика признаков по набору изображений; агрегаты разных форматов складываются через merge().
+
+    sums, squares: {метрика: сумма значений / сумма квадратов} для brightness, contrast, density
+    histogram: сумма гистограмм яркости всех изображений
+    """
+
+    format: str | None = None
+    count: int = 0
+    sums: dict[str, float] = field(default_factory=lambda: dict.fromkeys(AGGREGATE_METRICS, 0.0))
+    squares: dict[str, float] = field(default_factory=lambda: dict.fromkeys(AGGREGATE_METRICS, 0.0))
+    histogram: NDArray[np.int64] = field(default_factory=_zero_histogram)
+
+    def merge(self, other: FeatureAggregates) -> FeatureAggregates:
+        """Объединяет статистику двух наборов изображений."""
+        return FeatureAggregates(
+            format=self.format if self.format == other.format else None,
+            count=self.count + other.count,
+            sums={metric: self.sums[metric] + other.sums[metric] for metric in AGGREGATE_METRICS},
+            squares={metric: self.squares[metric] + other.squares[metric] for metric in AGGREGATE_METRICS},
+            histogram=self.histogram + other.histogram,
+        )
+
+    def mean(self, metric: str) -> float:
+        """Среднее значение метрики (0 для пустого набора)."""
+        return self.sums[metric] / self.count if self.count else 0.0
+
+    def variance(self, metric: str) -> float:
+        """Дисперсия метрики по набору (смещённая, как np.var)."""
+        if not self.count:
+            return 0.0
+        return max(self.squares[metric] / self.count - self.mean(metric) ** 2, 0.0)
+
+
+def row_to_aggregates(row: sqlite3.Row) -> FeatureAggregates:
+    """
+    Собирает FeatureAggregates из строки таблицы feature_aggregates.
+    """
+    return FeatureAggregates(
+        format=row['format'],
+        count=row['count'],
+        sums={metric: row[f'{metric}_sum'] for metric in AGGREGATE_METRICS},
+        squares={metric: row[f'{metric}_sq'] for metric in AGGREGATE_METRICS},
+        histogram=np.frombuffer(row['histogram_blob'], dtype=AGGREGATE_HISTOGRAM_DTYPE).astype(np.int64),
+    )
+
+
+def update_aggregates(cur: sqlite3.Cursor, removed: Iterable[Contribution], added: Iterable[Contribution]) -> None:
+    """
+    Вычитает из агрегатов вклад заменённых строк и прибавляет вклад новых (в транзакции курсора cur).
+
+    Чтение и запись должны идти в одной транзакции с блокировкой записи (BEGIN IMMEDIATE).
+    """
+    deltas: dict[str, FeatureAggregates] = {}
+    for sign, contributions in ((-1, removed), (1, added)):
+        for fmt, brightness, contrast, density, histogram in contributions:
+            delta = deltas.setdefault(fmt, FeatureAggregates(format=fmt))
+            delta.count += sign
+            for metric, value in zip(AGGREGATE_METRICS, (brightness, contrast, density), strict=True):
+                delta.sums[metric] += sign * value
+                delta.squares[metric] += sign * value * value
+            delta.histogram += sign * np.asarray(histogram, dtype=np.int64)
+
+    for fmt, delta in deltas.items():
+        cur.execute('SELECT * FROM feature_aggregates WHERE format = ?', (fmt,))
+        row = cur.fetchone()
+        store_aggregates(cur, delta if row is None else row_to_aggregates(row).merge(delta))
+    logger.debug('Feature aggregates updated for format(s): %s', sorted(deltas))
+
+
+def store_aggregates(cur: sqlite3.Cursor, aggregates: FeatureAggregates) -> None:
+    """
+    Записывает строку feature_aggregates для aggregates.format.
+    """
+    cur.execute(
+        """
+        INSERT OR REPLACE INTO feature_aggregates (
+            format, count, brightness_sum, brightness_sq, contrast_sum, contrast_sq, density_sum, density_sq,
+            histogram_blob
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            aggregates.format,
+            aggregates.count,
+            *(value for metric in AGGREGATE_METRICS for value in (aggregates.sums[metric], aggregates.squares[metric])),
+            aggregates.histogram.astype(AGGREGATE_HISTOGRAM_DTYPE).tobytes(),
+        ),
+    )
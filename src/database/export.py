@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from numpy.typing import DTypeLike
+
+from .histogram_index import HISTOGRAM_BINS
+from .sqlite import HASH_COLUMNS, HISTOGRAM_BLOB_SIZE, HISTOGRAM_DTYPE, db_cursor, row_histogram
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_META = 'columns.json'
+
+# Числовые столбцы image_features и их типы в выгрузке.
+NUMERIC_COLUMNS = {
+    'width': np.int32,
+    'height': np.int32,
+    'mean_brightness': np.float64,
+    'contrast': np.float64,
+    'density': np.float64,
+    'sample_scale': np.int16,
+    'brightness_error': np.float64,
+    'contrast_error': np.float64,
+    'density_error': np.float64,
+}
+
+
+def export_features(directory: str | Path, chunk_rows: int = EXPORT_CHUNK_ROWS) -> int:
+    """
+    Выгружает image_features в директорию: по файлу .npy на столбец, гистограммы - матрица N x 256 uint32.
+
+    Строки читаются пачками по chunk_rows и сразу пишутся в отображённые в память файлы, поэтому память
+    не зависит от размера таблицы. Вся выгрузка читается в одной транзакции и видит согласованный снимок базы.
+    Отсутствующий перцептивный хеш записывается как 0, флаг has_hashes отмечает строки с хешами.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    with db_cursor() as cur:
+        cur.execute('BEGIN')
+        cur.execute('SELECT COUNT(*), MAX(LENGTH(image_id)), MAX(LENGTH(format)) FROM image_features')
+        rows, id_length, format_length = cur.fetchone()
+        logger.info('Exporting %d image feature row(s) to %s', rows, directory)
+
+        def column(name: str, dtype: DTypeLike, shape: tuple[int, ...] = ()) -> np.memmap:
+            return open_memmap(directory / f'{name}.npy', mode='w+', dtype=dtype, shape=(rows, *shape))
+
+        columns = {
+            'image_id': column('image_id', f'<U{max(id_length or 0, 1)}'),
+            'format': column('format', f'<U{max(format_length or 0, 1)}'),
+            'computed_at': column('computed_at', 'datetime64[us]'),
+            'has_hashes': column('has_hashes', np.bool_),
+            **{name: column(name, dtype) for name, dtype in NUMERIC_COLUMNS.items()},
+            **{name: column(name, np.uint64) for name in HASH_COLUMNS},
+            'histogram': column('histogram', HISTOGRAM_DTYPE, (HISTOGRAM_BINS,)),
+        }
+
+        cur.execute('SELECT * FROM image_features ORDER BY rowid')
+        start = 0
+        while start < rows and (chunk := cur.fetchmany(min(chunk_rows, rows - start))):
+            stop = start + len(chunk)
+            columns['image_id'][start:stop] = [row['image_id'] for row in chunk]
+            columns['format'][start:stop] = [row['format'] for row in chunk]
+            columns['computed_at'][start:stop] = np.array([row['computed_at'] for row in chunk], dtype='datetime64[us]')
+            for name, dtype in NUMERIC_COLUMNS.items():
+                columns[name][start:stop] = np.array([row[name] for row in chunk], dtype=dtype)
+            for name in HASH_COLUMNS:
+                values = np.array([row[name] or 0 for row in chunk], dtype=np.int64)
+                columns[name][start:stop] = values.view(np.uint64)
+            columns['has_hashes'][start:stop] = [row['phash'] is not None for row in chunk]
+
+            blobs = [row['histogram_blob'] for row in chunk]
+            if all(blob is not None and len(blob) == HISTOGRAM_BLOB_SIZE for blob in blobs):
+                histograms = np.frombuffer(b''.join(blobs), dtype=HISTOGRAM_DTYPE).reshape(-1, HISTOGRAM_BINS)
+            else:
+                histograms = np.stack([row_histogram(row) for row in chunk])
+            columns['histogram'][start:stop] = histograms
+
+            start = stop
+            logger.debug('Exported %d / %d row(s)', start, rows)
+
+    for array in columns.values():
+        array.flush()
+    (directory / EXPORT_META).write_text(
+        json.dumps({'rows': start, 'columns': sorted(columns)}, indent=2), encoding='utf-8'
+    )
+    logger.info('Export finished: %d row(s), %d column(s)', start, len(columns))
+    return start
+
+
+def load_features(directory: str | Path) -> dict[str, np.ndarray]:
+    """
+    Открывает выгрузку export_features: {столбец: массив}, файлы отображаются в память только для чтения.
+    """
+    directory = Path(directory)
+    meta = json.loads((directory / EXPORT_META).read_text(encoding='utf-8'))
+    return {name: np.load(directory / f'{name}.npy', mmap_mode='r')[: meta['rows']] for name in meta['columns']}
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+try:
+    import fcntl
+except ImportError:  # Windows: файлы индекса защищены только от потоков текущего процесса.
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BINS = 256
+# Грубые гистограммы (соседние бины сложены) дают нижнюю оценку расстояния для всех метрик.
+COARSE_BINS = 32
+HISTOGRAM_METRICS = ('chi2', 'intersection', 'bhattacharyya')
+QUERY_BATCH_ROWS = 65_536
+MIN_CANDIDATES = 256
+_EPS = np.float32(1e-12)
+
+
+def normalize_histograms(histograms: Iterable[list[int]] | NDArray[np.integer]) -> NDArray[np.float32]:
+    """
+    Переводит гистограммы в матрицу float32, где каждая строка нормирована на сумму 1.
+    """
+    if not isinstance(histograms, np.ndarray):
+        histograms = list(histograms)
+    matrix = np.array(histograms, dtype=np.float32).reshape(-1, HISTOGRAM_BINS)
+    totals = matrix.sum(axis=1, keepdims=True)
+    np.divide(matrix, totals, out=matrix, where=totals > 0)
+    return matrix
+
+
+def coarsen(matrix: NDArray[np.float32]) -> NDArray[np.float32]:
+    """Складывает соседние бины нормированных гистограмм: N x 256 -> N x COARSE_BINS."""
+    return matrix.reshape(len(matrix), COARSE_BINS, -1).sum(axis=2, dtype=np.float32)
+
+
+def histogram_distances(matrix: NDArray[np.float32], query: NDArray[np.float32], metric: str) -> NDArray[np.float32]:
+    """
+    Считает расстояния от query до каждой строки matrix (меньше - ближе).
+
+    chi2 - симметричный хи-квадрат, intersection - 1 минус пересечение гистограмм,
+    bhattacharyya - расстояние Бхаттачарьи в форме Хеллингера.
+    """
+    if metric == 'chi2':
+        diff = matrix - query
+        return 0.5 * np.sum(diff * diff / (matrix + query + _EPS), axis=1)
+    if metric == 'intersection':
+        return 1 - np.sum(np.minimum(matrix, query), axis=1)
+    if metric == 'bhattacharyya':
+        coefficient = np.sqrt(matrix * query).sum(axis=1)
+        return np.sqrt(np.clip(1 - coefficient, 0, None))
+    raise ValueError(f'Unknown histogram metric: {metric}. Available: {HISTOGRAM_METRICS}.')
+
+
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path: Path, exclusive: bool) -> Iterator[None]:
+    """
+    Блокировка индекса между процессами (fcntl.flock на файле path): запись - эксклюзивная, чтение - общая.
+    """
+    if fcntl is None:
+        yield
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class HistogramIndex:
+    """
+    Нормированные гистограммы всех изображений в файле float32 (N x 256), читаемом через np.memmap.
+
+    matrix_path: строки гистограмм, дописываются в конец файла
+    ids_path: image_id по одному на строку, в том же порядке
+
+    Рядом хранится грубая матрица (N x COARSE_BINS). Все три метрики - f-дивергенции, поэтому расстояние между
+    грубыми гистограммами не больше точного: запрос сначала считается по грубой матрице, а точные расстояния -
+    только для строк, которые ещё могут попасть в top-k. При повторной записи image_id учитывается последняя строка.
+
+    Три файла дописываются под блокировкой (lock_path), поэтому строки матриц и image_id не перемешиваются
+    при записи из нескольких процессов. Новые строки подгружаются инкрементально: при запросе читается только
+    хвост файла image_id, дописанный после предыдущего запроса.
+
+    Если дописать строки не удалось, индекс помечается файлом dirty_path: он мог разойтись с базой данных
+    и должен быть пересобран (init_db делает это сам). clear() снимает пометку.
+    """
+
+    def __init__(self, matrix_path: Path, ids_path: Path) -> None:
+        self.matrix_path = matrix_path
+        self.ids_path = ids_path
+        self.coarse_path = matrix_path.with_suffix('.coarse')
+        self.lock_path = matrix_path.with_suffix('.lock')
+        self.dirty_path = matrix_path.with_suffix('.dirty')
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._matrix: NDArray[np.float32] | None = None
+        self._coarse: NDArray[np.float32] | None = None
+        self._ids: list[str] = []
+        self._ids_offset = 0
+        self._positions: dict[str, int] = {}
+        self._live: NDArray[np.bool_] = np.zeros(0, dtype=bool)
+        self._loaded_size = -1
+
+    def append(self, items: list[tuple[str, list[int]]]) -> None:
+        """Дописывает гистограммы [(image_id, histogram)] в индекс."""
+        if items:
+            self.append_matrix([image_id for image_id, _ in items], normalize_histograms(h for _, h in items))
+
+    def append_matrix(self, image_ids: list[str], matrix: NDArray[np.float32]) -> None:
+        """Дописывает уже нормированные гистограммы (строки matrix) для image_ids."""
+        if not image_ids:
+            return
+        coarse = coarsen(matrix)
+        with _write_lock, _file_lock(self.lock_path, exclusive=True):
+            with open(self.matrix_path, 'ab') as f:
+                f.write(matrix.tobytes())
+            with open(self.coarse_path, 'ab') as f:
+                f.write(coarse.tobytes())
+            with open(self.ids_path, 'a', encoding='utf-8') as f:
+                f.writelines(f'{image_id}\n' for image_id in image_ids)
+        logger.debug('Appended %d histogram(s) to %s', len(image_ids), self.matrix_path)
+
+    def clear(self) -> None:
+        """Удаляет файлы индекса и пометку о том, что он устарел."""
+        with self._lock, _write_lock, _file_lock(self.lock_path, exclusive=True):
+            for path in (self.matrix_path, self.coarse_path, self.ids_path, self.dirty_path):
+                path.unlink(missing_ok=True)
+            self._reset()
+
+    def mark_dirty(self) -> None:
+        """Помечает индекс как требующий пересборки."""
+        self.dirty_path.touch()
+
+    @property
+    def dirty(self) -> bool:
+        return self.dirty_path.exists()
+
+    def _refresh(self) -> None:
+        with self._lock, _file_lock(self.lock_path, exclusive=False):
+            size = os.path.getsize(self.matrix_path) if self.matrix_path.exists() else 0
+            if size == self._loaded_size:
+                return
+            ids_size = os.path.getsize(self.ids_path) if self.ids_path.exists() else 0
+            if size < self._loaded_size or ids_size < self._ids_offset:
+                # Индекс очищен или пересобран другим процессом - читаем заново.
+                self._reset()
+
+            if ids_size > self._ids_offset:
+                with open(self.ids_path, 'rb') as f:
+                    f.seek(self._ids_offset)
+                    tail = f.read()
+                complete = tail[: tail.rfind(b'\n') + 1]
+                self._ids.extend(complete.decode('utf-8').splitlines())
+                self._ids_offset += len(complete)
+
+            coarse_size = os.path.getsize(self.coarse_path) if self.coarse_path.exists() else 0
+            rows = min(size // (HISTOGRAM_BINS * 4), coarse_size // (COARSE_BINS * 4), len(self._ids))
+            indexed = min(len(self._live), rows)
+            live = np.zeros(rows, dtype=bool)
+            live[:indexed] = self._live[:indexed]
+            for row in range(indexed, rows):
+                previous = self._positions.get(self._ids[row])
+                if previous is not None:
+                    live[previous] = False
+                self._positions[self._ids[row]] = row
+                live[row] = True
+            self._live = live
+
+            if rows:
+                self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(rows, HISTOGRAM_BINS))
+                self._coarse = np.memmap(self.coarse_path, dtype=np.float32, mode='r', shape=(rows, COARSE_BINS))
+            else:
+                self._matrix = self._coarse = None
+            self._loaded_size = size
+        logger.debug('Histogram index loaded: %d row(s), %d new', rows, rows - indexed)
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._positions)
+
+    def query(self, histogram: list[int], k: int = 10, metric: str = 'chi2') -> list[tuple[str, float]]:
+        """
+        Возвращает k ближайших изображений [(image_id, distance)] по метрике metric.
+        """
+        if metric not in HISTOGRAM_METRICS:
+            raise ValueError(f'Unknown histogram metric: {metric}. Available: {HISTOGRAM_METRICS}.')
+        self._refresh()
+        with self._lock:
+            matrix, coarse, live, ids = self._matrix, self._coarse, self._live, self._ids
+        if matrix is None or coarse is None or k <= 0:
+            return []
+
+        query = normalize_histograms([histogram])[0]
+        coarse_query = coarsen(query[None, :])[0]
+        rows = len(matrix)
+
+        bounds = np.empty(rows, dtype=np.float32)
+        for start in range(0, rows, QUERY_BATCH_ROWS):
+            stop = min(start + QUERY_BATCH_ROWS, rows)
+            bounds[start:stop] = histogram_distances(np.asarray(coarse[start:stop]), coarse_query, metric)
+        bounds[~live] = np.inf
+
+        distances = np.full(rows, np.inf, dtype=np.float32)
+        evaluated = np.zeros(rows, dtype=bool)
+        first = min(max(k, MIN_CANDIDATES), rows)
+        candidates = np.argpartition(bounds, first - 1)[:first]
+        while candidates.size:
+            evaluated[candidates] = True
+            candidates = np.sort(candidates[np.isfinite(bounds[candidates])])
+            if candidates.size:
+                distances[candidates] = histogram_distances(np.asarray(matrix[candidates]), query, metric)
+
+            kth = np.partition(distances, min(k, rows) - 1)[min(k, rows) - 1]
+            # Запас на погрешность float32: нижняя оценка может превышать точное расстояние на ulp.
+            candidates = np.flatnonzero(~evaluated & (bounds <= kth * (1 + 1e-5) + 1e-7))
+
+        order = np.argsort(distances, kind='stable')[:k]
+        logger.debug('Histogram query: %d row(s), %d evaluated exactly', rows, int(evaluated.sum()))
+        return [(ids[int(row)], float(distances[row])) for row in order if np.isfinite(distances[row])]
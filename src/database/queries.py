@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+
+from ..core.processing import Options
+from ..models import ImageFeatures, TransformationRecord
+from .sqlite import db_cursor, row_to_features
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_SIZE = 1_000
+RANGE_COLUMNS = ('mean_brightness', 'contrast', 'density', 'width', 'height')
+
+Range = tuple[float | None, float | None]
+
+
+def build_features_query(
+    ranges: dict[str, Range],
+    formats: Iterable[str] | None = None,
+    order_by: str | None = None,
+    limit: int | None = None,
+) -> tuple[str, list]:
+    """
+    Собирает SELECT по image_features и его параметры.
+
+    ranges: {столбец: (min, max)}, None вместо границы - без ограничения
+    formats: допустимые форматы изображения
+    """
+    clauses: list[str] = []
+    params: list = []
+    for column, (low, high) in ranges.items():
+        if column not in RANGE_COLUMNS:
+            raise ValueError(f'Unknown range column: {column}. Available: {RANGE_COLUMNS}.')
+        if low is not None:
+            clauses.append(f'{column} >= ?')
+            params.append(low)
+        if high is not None:
+            clauses.append(f'{column} <= ?')
+            params.append(high)
+
+    if formats is not None:
+        formats = [fmt.upper() for fmt in formats]
+        clauses.append(f'format IN ({", ".join("?" * len(formats))})')
+        params.extend(formats)
+
+    sql = 'SELECT * FROM image_features'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    if order_by is not None:
+        if order_by not in RANGE_COLUMNS:
+            raise ValueError(f'Unknown order column: {order_by}. Available: {RANGE_COLUMNS}.')
+        sql += f' ORDER BY {order_by}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+
+def query_image_features(
+    mean_brightness: Range | None = None,
+    contrast: Range | None = None,
+    density: Range | None = None,
+    width: Range | None = None,
+    height: Range | None = None,
+    formats: Iterable[str] | None = None,
+    order_by: str | None = None,
+    limit: int | None = None,
+    batch_size: int = QUERY_BATCH_SIZE,
+) -> Iterator[ImageFeatures]:
+    """
+    Отдаёт признаки изображений, попадающих во все заданные диапазоны (границы включительно).
+
+    Строки читаются пачками по batch_size, поэтому память не зависит от числа найденных изображений.
+    """
+    given = {
+        'mean_brightness': mean_brightness,
+        'contrast': contrast,
+        'density': density,
+        'width': width,
+        'height': height,
+    }
+    ranges = {column: bounds for column, bounds in given.items() if bounds is not None}
+    sql, params = build_features_query(ranges, formats, order_by, limit)
+    logger.debug('Querying image features: %s %s', sql, params)
+
+    with db_cursor() as cur:
+        cur.execute(sql, params)
+        while rows := cur.fetchmany(batch_size):
+            for row in rows:
+                yield row_to_features(row)
+
+
+def row_to_transformation(row: sqlite3.Row) -> TransformationRecord:
+    """
+    Собирает TransformationRecord из строки таблицы transformations.
+    """
+    name = row['name'].rsplit('.', 1)[-1]
+    return TransformationRecord(
+        id=row['id'],
+        image_id=row['image_id'],
+        name=Options[name.capitalize()],
+        params=json.loads(row['params_json']),
+        applied_at=datetime.fromisoformat(row['applied_at']),
+    )
+
+
+def iter_transformations(image_id: str, batch_size: int = QUERY_BATCH_SIZE) -> Iterator[TransformationRecord]:
+    """
+    Отдаёт историю трансформаций изображения в порядке применения.
+    """
+    logger.debug('Reading transformations for image_id=%s', image_id)
+    with db_cursor() as cur:
+        cur.execute(
+            'SELECT * FROM transformations WHERE image_id = ? ORDER BY applied_at, rowid',
+            (image_id,),
+        )
+        while rows := cur.fetchmany(batch_size):
+            for row in rows:
+                yield row_to_transformation(row)
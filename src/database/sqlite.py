@@ -1,38 +1,134 @@
 from __future__ import annotations
 
+import atexit
 import json
 import logging
+import os
 import sqlite3
+import threading
+import weakref
+import zlib
 from collections.abc import Iterator
 from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+from numpy.typing import NDArray
+
 from ..models import ImageFeatures, TransformationRecord
+from .aggregates import (
+    AGGREGATE_METRICS,
+    AGGREGATES_SCHEMA,
+    Contribution,
+    FeatureAggregates,
+    row_to_aggregates,
+    store_aggregates,
+    update_aggregates,
+)
+from .histogram_index import HISTOGRAM_BINS, HistogramIndex, normalize_histograms
+from .writer import WRITER_MAX_BATCH, WRITER_MAX_DELAY, BatchWriter
 
 DB_PATH = Path('src/database') / 'image_features.sqlite3'
 
 logger = logging.getLogger(__name__)
 
 
-def get_connection() -> sqlite3.Connection:
+CONNECT_TIMEOUT = 30.0
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA foreign_keys = ON',
+)
+
+_local = threading.local()
+_connections_lock = threading.Lock()
+
+
+def _close_thread_connections(connections: dict[tuple[int, str], sqlite3.Connection]) -> int:
+    """
+    Закрывает соединения connections, открытые текущим процессом; возвращает их число.
+    """
+    pid = os.getpid()
+    own = [key for key in connections if key[0] == pid]
+    for key in own:
+        conn = connections.pop(key)
+        try:
+            # Обновляет статистику планировщика для индексов, по которым были запросы.
+            conn.execute('PRAGMA optimize')
+            conn.close()
+        except sqlite3.Error:
+            logger.exception('Failed to close SQLite connection')
+    return len(own)
+
+
+class _ThreadConnections:
     """
-    Создаёт соединение с SQLite, включает foreign_keys и row_factory=Row.
+    Соединения одного потока {(pid, путь к базе): соединение}; закрываются, когда поток завершается.
+
+    Объект живёт только в threading.local потока, поэтому при выходе потока он удаляется и weakref.finalize
+    закрывает его соединения, а не оставляет их (и файлы WAL) открытыми до завершения процесса.
+    """
+
+    def __init__(self) -> None:
+        self.connections: dict[tuple[int, str], sqlite3.Connection] = {}
+        weakref.finalize(self, _close_thread_connections, self.connections)
+
+
+_holders: weakref.WeakSet[_ThreadConnections] = weakref.WeakSet()
+
+
+def open_connection() -> sqlite3.Connection:
+    """
+    Создаёт новое соединение с SQLite: WAL, synchronous=NORMAL, увеличенный кеш, foreign_keys и row_factory=Row.
     """
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     logger.debug('Ensured database directory exists: %s', DB_PATH.parent)
 
     logger.info('Opening SQLite connection to %s', DB_PATH)
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=CONNECT_TIMEOUT, check_same_thread=False)
     conn.row_factory = sqlite3.Row
-    conn.execute('PRAGMA foreign_keys = ON')
-    logger.debug('SQLite connection established, foreign_keys enabled')
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    logger.debug('SQLite connection established: %s', ', '.join(CONNECTION_PRAGMAS))
     return conn
 
 
+def get_connection() -> sqlite3.Connection:
+    """
+    Возвращает постоянное соединение текущего потока (и процесса) с DB_PATH, открывая его при первом обращении.
+    """
+    key = (os.getpid(), str(DB_PATH))
+    holder: _ThreadConnections | None = getattr(_local, 'holder', None)
+    if holder is None:
+        holder = _local.holder = _ThreadConnections()
+        with _connections_lock:
+            _holders.add(holder)
+    conn = holder.connections.get(key)
+    if conn is None:
+        conn = holder.connections[key] = open_connection()
+    return conn
+
+
+def close_connections() -> None:
+    """
+    Закрывает все соединения, открытые текущим процессом (при завершении работы или смене базы).
+    """
+    with _connections_lock:
+        holders = list(_holders)
+    closed = sum(_close_thread_connections(holder.connections) for holder in holders)
+    logger.debug('Closed %d SQLite connection(s)', closed)
+
+
+atexit.register(close_connections)
+
+
 @contextmanager
 def db_cursor() -> Iterator[sqlite3.Cursor]:
     """
-    Контекстный менеджер для работы с курсором.
+    Контекстный менеджер для работы с курсором постоянного соединения потока.
     """
     conn = get_connection()
     cur = conn.cursor()
@@ -46,34 +142,192 @@ def db_cursor() -> Iterator[sqlite3.Cursor]:
         conn.rollback()
         raise
     finally:
-        try:
-            cur.close()
-            logger.debug('Cursor closed')
-        finally:
-            conn.close()
-            logger.debug('Connection closed')
+        cur.close()
+        logger.debug('Cursor closed')
+
+
+IMAGE_FEATURES_SCHEMA = """
+    CREATE TABLE {table} (
+        image_id         TEXT PRIMARY KEY,
+        id               TEXT,
+        width            INTEGER NOT NULL,
+        height           INTEGER NOT NULL,
+        format           TEXT NOT NULL,
+        mean_brightness  REAL NOT NULL,
+        contrast         REAL NOT NULL,
+        density          REAL NOT NULL,
+        histogram_json   TEXT,
+        computed_at      TEXT NOT NULL,
+        sample_scale     INTEGER NOT NULL DEFAULT 1,
+        brightness_error REAL NOT NULL DEFAULT 0,
+        contrast_error   REAL NOT NULL DEFAULT 0,
+        density_error    REAL NOT NULL DEFAULT 0,
+        ahash            INTEGER,
+        dhash            INTEGER,
+        phash            INTEGER,
+        histogram_blob   BLOB
+    )
+"""
+
+IMAGE_FEATURES_MIGRATIONS = {
+    'id': 'TEXT',
+    'sample_scale': 'INTEGER NOT NULL DEFAULT 1',
+    'brightness_error': 'REAL NOT NULL DEFAULT 0',
+    'contrast_error': 'REAL NOT NULL DEFAULT 0',
+    'density_error': 'REAL NOT NULL DEFAULT 0',
+    'ahash': 'INTEGER',
+    'dhash': 'INTEGER',
+    'phash': 'INTEGER',
+    'histogram_blob': 'BLOB',
+}
+
+# Гистограмма хранится как 256 x uint32 little-endian. При HISTOGRAM_COMPRESSION = True сохраняется сжатый zlib
+# вариант, если он короче: база меньше, но каждое чтение платит за распаковку. Чтение понимает оба вида.
+HISTOGRAM_DTYPE = np.dtype('<u4')
+HISTOGRAM_BLOB_SIZE = HISTOGRAM_BINS * HISTOGRAM_DTYPE.itemsize
+HISTOGRAM_COMPRESSION = False
+HISTOGRAM_COMPRESSION_LEVEL = 1
+
+# Индексы для выборок по диапазонам признаков и истории изображения (создаются после миграций таблицы).
+# (width, height) обслуживает фильтры по ширине (и ширине с высотой), фильтр только по высоте - отдельный индекс.
+INDEXES = """
+    CREATE INDEX IF NOT EXISTS idx_image_features_brightness ON image_features(mean_brightness);
+    CREATE INDEX IF NOT EXISTS idx_image_features_contrast ON image_features(contrast);
+    CREATE INDEX IF NOT EXISTS idx_image_features_density ON image_features(density);
+    CREATE INDEX IF NOT EXISTS idx_image_features_size ON image_features(width, height);
+    CREATE INDEX IF NOT EXISTS idx_image_features_height ON image_features(height);
+    CREATE INDEX IF NOT EXISTS idx_image_features_format ON image_features(format);
+    CREATE INDEX IF NOT EXISTS idx_transformations_image ON transformations(image_id, applied_at);
+"""
+
+HASH_COLUMNS = ('ahash', 'dhash', 'phash')
+UINT64_MASK = (1 << 64) - 1
+
+
+_writer: BatchWriter | None = None
+
+
+def active_writer() -> BatchWriter | None:
+    """
+    Возвращает включённый в этом процессе BatchWriter (после fork поток записи остаётся в родителе).
+    """
+    writer = _writer
+    if writer is None or writer.pid != os.getpid():
+        return None
+    return writer
+
+
+def start_write_behind(max_batch: int = WRITER_MAX_BATCH, max_delay: float = WRITER_MAX_DELAY) -> BatchWriter:
+    """
+    Включает отложенную запись: признаки, история и манифест пишутся фоновым потоком пачками.
+    """
+    global _writer
+    stop_write_behind()
+    _writer = BatchWriter(write_batch, max_batch, max_delay)
+    logger.info('Write-behind enabled: max_batch=%d, max_delay=%.2fs', max_batch, max_delay)
+    return _writer
+
+
+def flush_writes() -> None:
+    """
+    Дожидается записи всех поставленных в очередь записей (если отложенная запись включена).
+    """
+    writer = active_writer()
+    if writer is not None:
+        writer.flush()
+
+
+def stop_write_behind() -> None:
+    """
+    Записывает очередь и выключает отложенную запись.
+    """
+    global _writer
+    writer = active_writer()
+    _writer = None
+    if writer is not None:
+        writer.close()
+        logger.info('Write-behind disabled')
+
+
+atexit.register(stop_write_behind)
+
+
+@contextmanager
+def write_behind(max_batch: int = WRITER_MAX_BATCH, max_delay: float = WRITER_MAX_DELAY) -> Iterator[BatchWriter]:
+    """
+    Контекстный менеджер отложенной записи; при выходе очередь гарантированно записана.
+    """
+    writer = start_write_behind(max_batch, max_delay)
+    try:
+        yield writer
+    finally:
+        stop_write_behind()
+
+
+def to_sqlite_int(value: int | None) -> int | None:
+    """Переводит беззнаковый 64-битный хеш в знаковое целое SQLite."""
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def from_sqlite_int(value: int | None) -> int | None:
+    """Переводит знаковое целое SQLite обратно в беззнаковый 64-битный хеш."""
+    return None if value is None else value & UINT64_MASK
+
+
+def encode_histogram(histogram: list[int] | NDArray[np.integer], compress: bool = False) -> bytes:
+    """
+    Упаковывает гистограмму в BLOB: 256 x uint32 little-endian, при compress=True - zlib, если так короче.
+    """
+    raw = np.asarray(histogram, dtype=HISTOGRAM_DTYPE).tobytes()
+    if compress:
+        packed = zlib.compress(raw, HISTOGRAM_COMPRESSION_LEVEL)
+        if len(packed) < len(raw):
+            return packed
+    return raw
+
+
+def decode_histogram(blob: bytes) -> NDArray[np.uint32]:
+    """
+    Распаковывает BLOB гистограммы в массив uint32 (без промежуточного списка Python-int).
+    """
+    if len(blob) != HISTOGRAM_BLOB_SIZE:
+        blob = zlib.decompress(blob)
+    return np.frombuffer(blob, dtype=HISTOGRAM_DTYPE)
+
+
+def row_histogram(row: sqlite3.Row) -> NDArray[np.uint32]:
+    """Гистограмма строки image_features: из histogram_blob или, для ещё не перенесённых строк, из JSON."""
+    if row['histogram_blob'] is not None:
+        return decode_histogram(row['histogram_blob'])
+    return np.asarray(json.loads(row['histogram_json']), dtype=HISTOGRAM_DTYPE)
+
+
+def ensure_columns(cur: sqlite3.Cursor, table: str, columns: dict[str, str]) -> None:
+    """
+    Добавляет в существующую таблицу недостающие столбцы (миграция старых баз).
+    """
+    cur.execute(f'PRAGMA table_info({table})')
+    existing = {row['name'] for row in cur.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            logger.info('Migrating table %s: adding column %s', table, name)
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
 
 
 def init_db() -> None:
     """
     Создаёт таблицы, если их ещё нет.
     """
-    logger.info('Initializing database schema (image_features, transformations)')
+    logger.info('Initializing database schema (image_features, transformations, manifest, feature_aggregates)')
     with db_cursor() as cur:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'feature_aggregates'")
+        new_aggregates = cur.fetchone() is None
+        cur.execute(IMAGE_FEATURES_SCHEMA.format(table='IF NOT EXISTS image_features'))
+        cur.execute(AGGREGATES_SCHEMA)
         cur.executescript(
             """
-            CREATE TABLE IF NOT EXISTS image_features (
-                image_id        TEXT PRIMARY KEY,
-                width           INTEGER NOT NULL,
-                height          INTEGER NOT NULL,
-                format          TEXT NOT NULL,
-                mean_brightness REAL NOT NULL,
-                contrast        REAL NOT NULL,
-                density         REAL NOT NULL,
-                histogram_json  TEXT NOT NULL,
-                computed_at     TEXT NOT NULL
-            );
-
             CREATE TABLE IF NOT EXISTS transformations (
                 id           TEXT PRIMARY KEY,
                 image_id     TEXT NOT NULL,
@@ -82,11 +336,115 @@ def init_db() -> None:
                 applied_at   TEXT NOT NULL,
                 FOREIGN KEY(image_id) REFERENCES image_features(image_id) ON DELETE CASCADE
             );
+
+            CREATE TABLE IF NOT EXISTS manifest (
+                path         TEXT PRIMARY KEY,
+                size         INTEGER NOT NULL,
+                mtime_ns     INTEGER NOT NULL,
+                image_id     TEXT,
+                features_id  TEXT,
+                scanned_at   TEXT NOT NULL
+            );
             """
         )
+        ensure_columns(cur, 'image_features', IMAGE_FEATURES_MIGRATIONS)
+        cur.execute('PRAGMA table_info(image_features)')
+        legacy_json = any(row['name'] == 'histogram_json' and row['notnull'] for row in cur.fetchall())
+
+    if legacy_json:
+        rebuild_image_features()
+    migrate_histograms()
+    with db_cursor() as cur:
+        cur.executescript(INDEXES)
+    if new_aggregates:
+        rebuild_aggregates()
+    if histogram_index_is_stale():
+        rebuild_histogram_index()
     logger.info('Database schema initialized (or already existed)')
 
 
+def rebuild_image_features() -> None:
+    """
+    Пересоздаёт таблицу image_features старой схемы, где histogram_json объявлен NOT NULL.
+    """
+    logger.info('Migrating table image_features: rebuilding to make histogram_json nullable')
+    conn = get_connection()
+    conn.commit()
+    cur = conn.cursor()
+    # DROP TABLE при включённых внешних ключах удалил бы историю трансформаций каскадом.
+    cur.execute('PRAGMA foreign_keys = OFF')
+    try:
+        cur.execute('PRAGMA table_info(image_features)')
+        columns = ', '.join(row['name'] for row in cur.fetchall())
+        cur.execute('BEGIN')
+        cur.execute(IMAGE_FEATURES_SCHEMA.format(table='image_features_new'))
+        cur.execute(f'INSERT INTO image_features_new ({columns}) SELECT {columns} FROM image_features')
+        cur.execute('DROP TABLE image_features')
+        cur.execute('ALTER TABLE image_features_new RENAME TO image_features')
+        conn.commit()
+    except Exception:
+        logger.exception('Failed to rebuild image_features, rolling back')
+        conn.rollback()
+        raise
+    finally:
+        cur.execute('PRAGMA foreign_keys = ON')
+        cur.close()
+
+
+def migrate_histograms(batch_size: int = 10_000) -> int:
+    """
+    Переносит гистограммы из histogram_json в histogram_blob пачками по batch_size строк.
+    """
+    migrated = 0
+    last_rowid = 0
+    while True:
+        with db_cursor() as cur:
+            cur.execute(
+                """
+                SELECT rowid, histogram_json FROM image_features
+                WHERE rowid > ? AND histogram_blob IS NULL AND histogram_json IS NOT NULL
+                ORDER BY rowid
+                LIMIT ?
+                """,
+                (last_rowid, batch_size),
+            )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            cur.executemany(
+                'UPDATE image_features SET histogram_blob = ?, histogram_json = NULL WHERE rowid = ?',
+                [
+                    (encode_histogram(json.loads(row['histogram_json']), HISTOGRAM_COMPRESSION), row['rowid'])
+                    for row in rows
+                ],
+            )
+        migrated += len(rows)
+        last_rowid = rows[-1]['rowid']
+
+    if migrated:
+        logger.info('Migrated %d histogram(s) from JSON to binary storage', migrated)
+    return migrated
+
+
+INSERT_TRANSFORMATION_SQL = """
+    INSERT INTO transformations (
+        id, image_id, name, params_json, applied_at
+    )
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def transformation_params(record: TransformationRecord) -> tuple:
+    """Параметры INSERT_TRANSFORMATION_SQL для записи истории."""
+    return (
+        record.id,
+        record.image_id,
+        str(record.name),
+        json.dumps(record.params, ensure_ascii=False),
+        record.applied_at.isoformat(),
+    )
+
+
 def insert_transformation(record: TransformationRecord) -> None:
     """
     Сохраняет одну запись истории в таблицу transformations.
@@ -97,28 +455,94 @@ def insert_transformation(record: TransformationRecord) -> None:
         record.image_id,
         record.name,
     )
-    with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO transformations (
-                id, image_id, name, params_json, applied_at
-            )
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                record.id,
-                record.image_id,
-                str(record.name),
-                json.dumps(record.params, ensure_ascii=False),
-                record.applied_at.isoformat(),
-            ),
-        )
+    insert_transformations([record])
     logger.debug('Transformation %s inserted successfully', record.id)
 
 
+def insert_transformations(records: list[TransformationRecord]) -> None:
+    """
+    Сохраняет несколько записей истории одной транзакцией (при включённой отложенной записи - ставит в очередь).
+    """
+    writer = active_writer()
+    if writer is not None:
+        for record in records:
+            writer.put('transformations', record)
+        return
+
+    logger.info('Inserting %d transformation(s)', len(records))
+    with db_cursor() as cur:
+        cur.executemany(INSERT_TRANSFORMATION_SQL, [transformation_params(record) for record in records])
+    logger.debug('Transformations inserted: %s', [record.id for record in records])
+
+
+INSERT_FEATURES_SQL = """
+    INSERT INTO image_features (
+        image_id,
+        id,
+        width,
+        height,
+        format,
+        mean_brightness,
+        contrast,
+        density,
+        histogram_blob,
+        computed_at,
+        sample_scale,
+        brightness_error,
+        contrast_error,
+        density_error,
+        ahash,
+        dhash,
+        phash
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(image_id) DO UPDATE SET
+        id = excluded.id,
+        width = excluded.width,
+        height = excluded.height,
+        format = excluded.format,
+        mean_brightness = excluded.mean_brightness,
+        contrast = excluded.contrast,
+        density = excluded.density,
+        histogram_json = NULL,
+        histogram_blob = excluded.histogram_blob,
+        computed_at = excluded.computed_at,
+        sample_scale = excluded.sample_scale,
+        brightness_error = excluded.brightness_error,
+        contrast_error = excluded.contrast_error,
+        density_error = excluded.density_error,
+        ahash = excluded.ahash,
+        dhash = excluded.dhash,
+        phash = excluded.phash
+"""
+
+
+def features_params(features: ImageFeatures) -> tuple:
+    """Параметры INSERT_FEATURES_SQL для признаков изображения."""
+    return (
+        features.image_id,
+        features.id,
+        features.width,
+        features.height,
+        features.format,
+        features.mean_brightness,
+        features.contrast,
+        features.density,
+        encode_histogram(features.histogram, HISTOGRAM_COMPRESSION),
+        features.computed_at.isoformat(),
+        features.sample_scale,
+        features.brightness_error,
+        features.contrast_error,
+        features.density_error,
+        to_sqlite_int(features.ahash),
+        to_sqlite_int(features.dhash),
+        to_sqlite_int(features.phash),
+    )
+
+
 def insert_image_features(features: ImageFeatures) -> None:
     """
-    Сохраняет признаки изображения в таблицу image_features.
+    Сохраняет признаки изображения в таблицу image_features (повторная запись для image_id обновляет строку).
     """
     logger.info(
         'Inserting image features: image_id=%s, width=%d, height=%d, format=%s',
@@ -127,32 +551,316 @@ def insert_image_features(features: ImageFeatures) -> None:
         features.height,
         features.format,
     )
+    writer = active_writer()
+    if writer is not None:
+        writer.put('features', features)
+        return
+
+    write_batch({'features': [features]})
+    logger.debug('Image features inserted for image_id=%s', features.image_id)
+
+
+def write_batch(batch: dict[str, list]) -> None:
+    """
+    Записывает пачку {'features': [...], 'transformations': [...], 'manifest': [...]} одной транзакцией.
+
+    Признаки пишутся первыми, чтобы записи истории и манифеста ссылались на уже сохранённые изображения.
+    Транзакция открывается с блокировкой записи (BEGIN IMMEDIATE) до чтения старых значений агрегатов,
+    иначе параллельный писатель успел бы изменить их между чтением и записью.
+    """
+    features = batch.get('features', [])
     with db_cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO image_features (
-                image_id,
-                width,
-                height,
-                format,
-                mean_brightness,
-                contrast,
-                density,
-                histogram_json,
-                computed_at
+        cur.execute('BEGIN IMMEDIATE')
+        if features:
+            latest = {item.image_id: item for item in features}
+            update_aggregates(cur, stored_contributions(cur, list(latest)), map(contribution, latest.values()))
+            cur.executemany(INSERT_FEATURES_SQL, [features_params(item) for item in features])
+        if batch.get('transformations'):
+            cur.executemany(
+                INSERT_TRANSFORMATION_SQL, [transformation_params(record) for record in batch['transformations']]
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        if batch.get('manifest'):
+            cur.executemany(UPSERT_MANIFEST_SQL, batch['manifest'])
+
+    if features:
+        try:
+            histogram_index().append([(item.image_id, item.histogram) for item in features])
+        except OSError:
+            logger.exception('Failed to update histogram index for %d image(s), marking it dirty', len(features))
+            try:
+                histogram_index().mark_dirty()
+            except OSError:
+                logger.exception('Failed to mark histogram index dirty')
+
+
+def contribution(features: ImageFeatures) -> Contribution:
+    """Вклад признаков изображения в агрегаты feature_aggregates."""
+    return features.format, features.mean_brightness, features.contrast, features.density, features.histogram
+
+
+def stored_contributions(cur: sqlite3.Cursor, image_ids: list[str], chunk_size: int = 500) -> list[Contribution]:
+    """
+    Вклад уже сохранённых строк image_ids в агрегаты (их заменит повторная запись).
+    """
+    found: list[Contribution] = []
+    for start in range(0, len(image_ids), chunk_size):
+        chunk = image_ids[start : start + chunk_size]
+        cur.execute(
+            f"""
+            SELECT format, mean_brightness, contrast, density, histogram_blob, histogram_json FROM image_features
+            WHERE image_id IN ({', '.join('?' * len(chunk))})
             """,
-            (
-                features.image_id,
-                features.width,
-                features.height,
-                features.format,
-                features.mean_brightness,
-                features.contrast,
-                features.density,
-                json.dumps(features.histogram),
-                features.computed_at.isoformat(),
-            ),
+            chunk,
         )
-    logger.debug('Image features inserted for image_id=%s', features.image_id)
+        found.extend(
+            (row['format'], row['mean_brightness'], row['contrast'], row['density'], row_histogram(row))
+            for row in cur.fetchall()
+        )
+    return found
+
+
+def row_to_features(row: sqlite3.Row) -> ImageFeatures:
+    """
+    Собирает ImageFeatures из строки таблицы image_features.
+    """
+    return ImageFeatures(
+        id=row['id'] or row['image_id'],
+        image_id=row['image_id'],
+        width=row['width'],
+        height=row['height'],
+        format=row['format'],
+        mean_brightness=row['mean_brightness'],
+        contrast=row['contrast'],
+        density=row['density'],
+        histogram=row_histogram(row).tolist(),
+        computed_at=datetime.fromisoformat(row['computed_at']),
+        sample_scale=row['sample_scale'],
+        brightness_error=row['brightness_error'],
+        contrast_error=row['contrast_error'],
+        density_error=row['density_error'],
+        ahash=from_sqlite_int(row['ahash']),
+        dhash=from_sqlite_int(row['dhash']),
+        phash=from_sqlite_int(row['phash']),
+    )
+
+
+def get_image_features(image_id: str) -> ImageFeatures | None:
+    """
+    Возвращает сохранённые признаки изображения или None, если их нет.
+    """
+    logger.debug('Looking up image features for image_id=%s', image_id)
+    writer = active_writer()
+    if writer is not None:
+        pending = writer.find('features', lambda item: item.image_id == image_id)
+        if pending is not None:
+            return pending
+
+    with db_cursor() as cur:
+        cur.execute('SELECT * FROM image_features WHERE image_id = ?', (image_id,))
+        row = cur.fetchone()
+
+    if row is None:
+        logger.debug('No stored features for image_id=%s', image_id)
+        return None
+    return row_to_features(row)
+
+
+def load_manifest(root: str) -> dict[str, tuple[int, int]]:
+    """
+    Возвращает {path: (size, mtime_ns)} для всех файлов манифеста внутри директории root.
+    """
+    prefix = root.rstrip(os.sep) + os.sep
+    upper = prefix[:-1] + chr(ord(os.sep) + 1)
+    logger.debug('Loading manifest entries for %s', prefix)
+    with db_cursor() as cur:
+        cur.execute(
+            'SELECT path, size, mtime_ns FROM manifest WHERE path >= ? AND path < ?',
+            (prefix, upper),
+        )
+        manifest = {row['path']: (row['size'], row['mtime_ns']) for row in cur.fetchall()}
+    logger.debug('Loaded %d manifest entries', len(manifest))
+    return manifest
+
+
+UPSERT_MANIFEST_SQL = """
+    INSERT INTO manifest (path, size, mtime_ns, image_id, features_id, scanned_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        size = excluded.size,
+        mtime_ns = excluded.mtime_ns,
+        image_id = excluded.image_id,
+        features_id = excluded.features_id,
+        scanned_at = excluded.scanned_at
+"""
+
+
+def upsert_manifest_entry(path: str, size: int, mtime_ns: int, image_id: str, features_id: str) -> None:
+    """
+    Записывает в манифест состояние файла и ID последних посчитанных признаков.
+    """
+    logger.debug('Updating manifest entry: path=%s, size=%d, mtime_ns=%d', path, size, mtime_ns)
+    params = (path, size, mtime_ns, image_id, features_id, datetime.utcnow().isoformat())
+    writer = active_writer()
+    if writer is not None:
+        writer.put('manifest', params)
+        return
+
+    with db_cursor() as cur:
+        cur.execute(UPSERT_MANIFEST_SQL, params)
+
+
+def delete_manifest_entries(paths: list[str]) -> None:
+    """
+    Удаляет из манифеста записи об удалённых файлах.
+    """
+    logger.info('Removing %d deleted file(s) from manifest', len(paths))
+    with db_cursor() as cur:
+        cur.executemany('DELETE FROM manifest WHERE path = ?', [(path,) for path in paths])
+
+
+def iter_image_hashes(kind: str = 'phash', batch_size: int = 10_000) -> Iterator[tuple[str, int]]:
+    """
+    Отдаёт пары (image_id, hash) для всех строк с посчитанным хешем kind.
+    """
+    if kind not in HASH_COLUMNS:
+        raise ValueError(f'Unknown hash kind: {kind}. Available: {HASH_COLUMNS}.')
+
+    logger.debug('Reading %s hashes from database', kind)
+    with db_cursor() as cur:
+        cur.execute(f'SELECT image_id, {kind} FROM image_features WHERE {kind} IS NOT NULL')
+        while rows := cur.fetchmany(batch_size):
+            for image_id, value in rows:
+                yield image_id, value & UINT64_MASK
+
+
+_histogram_indexes: dict[str, HistogramIndex] = {}
+
+
+def histogram_index() -> HistogramIndex:
+    """
+    Возвращает индекс гистограмм, хранящийся рядом с файлом базы данных.
+
+    Объект индекса один на файл базы: между запросами он подгружает только дописанные строки.
+    """
+    key = str(DB_PATH)
+    with _connections_lock:
+        index = _histogram_indexes.get(key)
+        if index is None:
+            index = HistogramIndex(DB_PATH.with_suffix('.hist.f32'), DB_PATH.with_suffix('.hist.ids'))
+            _histogram_indexes[key] = index
+    return index
+
+
+def search_histograms(histogram: list[int], k: int = 10, metric: str = 'chi2') -> list[tuple[str, float]]:
+    """
+    Ищет k изображений с ближайшими гистограммами: [(image_id, distance)], по возрастанию расстояния.
+    """
+    logger.info('Searching %d nearest histograms with metric=%s', k, metric)
+    return histogram_index().query(histogram, k, metric)
+
+
+def get_histogram(image_id: str) -> NDArray[np.uint32] | None:
+    """
+    Возвращает гистограмму изображения как массив uint32 или None, если признаков нет.
+    """
+    with db_cursor() as cur:
+        cur.execute('SELECT histogram_blob, histogram_json FROM image_features WHERE image_id = ?', (image_id,))
+        row = cur.fetchone()
+    return None if row is None else row_histogram(row)
+
+
+def iter_histograms(batch_size: int = 10_000) -> Iterator[tuple[list[str], NDArray[np.uint32]]]:
+    """
+    Отдаёт гистограммы всех изображений пачками: (image_id, матрица uint32 размера len x 256).
+    """
+    with db_cursor() as cur:
+        cur.execute('SELECT image_id, histogram_blob, histogram_json FROM image_features')
+        while rows := cur.fetchmany(batch_size):
+            blobs = [row['histogram_blob'] for row in rows]
+            if all(blob is not None and len(blob) == HISTOGRAM_BLOB_SIZE for blob in blobs):
+                matrix = np.frombuffer(b''.join(blobs), dtype=HISTOGRAM_DTYPE)
+            else:
+                matrix = np.concatenate([row_histogram(row) for row in rows])
+            yield [row['image_id'] for row in rows], matrix.reshape(len(rows), HISTOGRAM_BINS)
+
+
+def histogram_index_is_stale() -> bool:
+    """
+    Проверяет, нужно ли пересобрать индекс гистограмм: он помечен как устаревший или число изображений
+    в нём не совпадает с числом строк image_features (индекс отсутствует, база создана до индекса и т. п.).
+    """
+    index = histogram_index()
+    if index.dirty:
+        logger.warning('Histogram index %s is marked dirty', index.matrix_path)
+        return True
+    with db_cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM image_features')
+        rows = cur.fetchone()[0]
+    indexed = len(index)
+    if indexed != rows:
+        logger.warning('Histogram index has %d image(s), image_features has %d row(s)', indexed, rows)
+        return True
+    return False
+
+
+def rebuild_histogram_index(batch_size: int = 10_000) -> int:
+    """
+    Пересобирает индекс гистограмм по таблице image_features (например, для базы, созданной до индекса).
+    """
+    index = histogram_index()
+    index.clear()
+    count = 0
+    for image_ids, matrix in iter_histograms(batch_size):
+        index.append_matrix(image_ids, normalize_histograms(matrix))
+        count += len(image_ids)
+    logger.info('Histogram index rebuilt: %d row(s)', count)
+    return count
+
+
+def get_aggregates(fmt: str | None = None) -> FeatureAggregates:
+    """
+    Возвращает статистику признаков по изображениям формата fmt (None - по всем форматам) без просмотра image_features.
+    """
+    with db_cursor() as cur:
+        if fmt is None:
+            cur.execute('SELECT * FROM feature_aggregates')
+        else:
+            cur.execute('SELECT * FROM feature_aggregates WHERE format = ?', (fmt,))
+        rows = cur.fetchall()
+
+    total = FeatureAggregates(format=fmt)
+    for row in rows:
+        total = total.merge(row_to_aggregates(row))
+    total.format = fmt
+    return total
+
+
+def rebuild_aggregates(batch_size: int = 10_000) -> int:
+    """
+    Пересчитывает feature_aggregates по всей таблице image_features (для баз, созданных до агрегатов).
+    """
+    aggregates: dict[str, FeatureAggregates] = {}
+    metrics = ', '.join(f'SUM({column}), SUM({column} * {column})' for column in AGGREGATE_METRICS.values())
+    with db_cursor() as cur:
+        cur.execute('BEGIN IMMEDIATE')
+        cur.execute(f'SELECT format, COUNT(*), {metrics} FROM image_features GROUP BY format')
+        for fmt, count, *values in cur.fetchall():
+            aggregates[fmt] = FeatureAggregates(
+                format=fmt,
+                count=count,
+                sums=dict(zip(AGGREGATE_METRICS, values[0::2], strict=True)),
+                squares=dict(zip(AGGREGATE_METRICS, values[1::2], strict=True)),
+            )
+
+        cur.execute('SELECT format, histogram_blob, histogram_json FROM image_features')
+        while rows := cur.fetchmany(batch_size):
+            for row in rows:
+                aggregates[row['format']].histogram += row_histogram(row)
+
+        cur.execute('DELETE FROM feature_aggregates')
+        for aggregate in aggregates.values():
+            store_aggregates(cur, aggregate)
+
+    count = sum(aggregate.count for aggregate in aggregates.values())
+    logger.info('Feature aggregates rebuilt: %d image(s), %d format(s)', count, len(aggregates))
+    return count
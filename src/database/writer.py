@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+WRITER_MAX_BATCH = 500
+WRITER_MAX_DELAY = 0.5
+WRITER_RETRIES = 3
+WRITER_RETRY_DELAY = 0.1
+# Порядок видов при записи по одной: признаки раньше ссылающихся на них записей истории и манифеста.
+RECORD_ORDER = ('features', 'transformations', 'manifest')
+
+Batch = dict[str, list[Any]]
+
+
+def _kind_rank(kind: str) -> int:
+    return RECORD_ORDER.index(kind) if kind in RECORD_ORDER else len(RECORD_ORDER)
+
+
+class BatchWriter:
+    """
+    Отложенная запись: записи копятся в очереди и сбрасываются фоновым потоком пачками.
+
+    flush_batch: функция, записывающая пачку {вид записи: [записи]} одной транзакцией
+    max_batch: число записей, при котором пачка сбрасывается сразу
+    max_delay: максимальное время (с) ожидания записи в очереди
+
+    retries, retry_delay: число повторов неудачной записи пачки и пауза перед первым (удваивается)
+
+    flush() - барьер: возвращается, когда всё, что было поставлено в очередь до вызова, записано.
+    Пачка, которую не удалось записать и после повторов, записывается по одной записи (в порядке RECORD_ORDER),
+    так что теряются только записи, запись которых не проходит и по отдельности. О них из ближайшего flush()
+    или close() пробрасывается RuntimeError с числом потерянных записей (причина - в __cause__).
+    """
+
+    def __init__(
+        self,
+        flush_batch: Callable[[Batch], None],
+        max_batch: int = WRITER_MAX_BATCH,
+        max_delay: float = WRITER_MAX_DELAY,
+        retries: int = WRITER_RETRIES,
+        retry_delay: float = WRITER_RETRY_DELAY,
+    ) -> None:
+        if max_batch < 1:
+            raise ValueError(f'max_batch must be positive: {max_batch}')
+        self.flush_batch = flush_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        self._pending: Batch = defaultdict(list)
+        self._inflight: Batch = {}
+        self._count = 0
+        self._first_at = 0.0
+        self._submitted = 0
+        self._written = 0
+        self._barrier = 0
+        self._closed = False
+        self._error: BaseException | None = None
+        self._lost = 0
+        self._thread = threading.Thread(target=self._run, name='db-batch-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, kind: str, item: Any) -> None:
+        """Ставит запись вида kind в очередь, не дожидаясь её записи."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('BatchWriter is closed')
+            if not self._count:
+                self._first_at = time.monotonic()
+            self._pending[kind].append(item)
+            self._count += 1
+            self._submitted += 1
+            if self._count >= self.max_batch:
+                self._condition.notify_all()
+
+    def find(self, kind: str, predicate: Callable[[Any], bool]) -> Any | None:
+        """Возвращает последнюю ещё не записанную запись вида kind, для которой predicate истинен."""
+        with self._condition:
+            for batch in (self._pending, self._inflight):
+                items: list[Any] = batch.get(kind, [])
+                for item in reversed(items):
+                    if predicate(item):
+                        return item
+        return None
+
+    def flush(self) -> None:
+        """Дожидается записи всего, что было поставлено в очередь до вызова."""
+        with self._condition:
+            target = self._submitted
+            self._barrier = max(self._barrier, target)
+            self._condition.notify_all()
+            while self._written < target and self._thread.is_alive():
+                self._condition.wait()
+            self._raise_error()
+
+    def close(self) -> None:
+        """Записывает очередь и останавливает фоновый поток."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        with self._condition:
+            self._raise_error()
+
+    def _raise_error(self) -> None:
+        error, self._error = self._error, None
+        lost, self._lost = self._lost, 0
+        if error is not None:
+            raise RuntimeError(f'Write-behind failed, {lost} record(s) were not written') from error
+
+    def _ready(self) -> bool:
+        if not self._count:
+            return self._closed
+        return (
+            self._closed
+            or self._count >= self.max_batch
+            or self._barrier > self._written
+            or time.monotonic() - self._first_at >= self.max_delay
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._ready():
+                    timeout = self.max_delay - (time.monotonic() - self._first_at) if self._count else None
+                    self._condition.wait(timeout)
+                if not self._count:
+                    return
+                batch, self._pending = dict(self._pending), defaultdict(list)
+                self._inflight = batch
+                written = self._written + self._count
+                self._count = 0
+
+            count = written - self._written
+            logger.debug('Flushing %d record(s): %s', count, {k: len(v) for k, v in batch.items()})
+            lost, error = self._write(batch, count)
+
+            with self._condition:
+                if error is not None:
+                    self._lost += lost
+                    self._error = self._error or error
+                self._inflight = {}
+                self._written = written
+                self._condition.notify_all()
+
+    def _write(self, batch: Batch, count: int) -> tuple[int, Exception | None]:
+        """
+        Записывает пачку, а если она не проходит и после повторов - по одной записи.
+
+        Возвращает (число потерянных записей, последняя ошибка или None).
+        """
+        error = self._write_batch(batch, count)
+        if error is None:
+            return 0, None
+        if count == 1:
+            return 1, error
+
+        logger.warning('Writing %d record(s) one by one to drop only the failing ones', count)
+        lost = 0
+        last_error: Exception | None = None
+        for kind in sorted(batch, key=_kind_rank):
+            for item in batch[kind]:
+                try:
+                    self.flush_batch({kind: [item]})
+                except Exception as exc:
+                    logger.exception('Failed to write a %s record, dropping it', kind)
+                    lost += 1
+                    last_error = exc
+        return lost, last_error
+
+    def _write_batch(self, batch: Batch, count: int) -> Exception | None:
+        """Записывает пачку, повторяя при ошибке с растущей паузой; возвращает последнюю ошибку или None."""
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                self.flush_batch(batch)
+            except Exception as exc:
+                if attempt == self.retries:
+                    logger.exception('Failed to flush %d record(s), giving up after %d attempt(s)', count, attempt + 1)
+                    return exc
+                logger.warning('Failed to flush %d record(s) (%s), retrying in %.2fs', count, exc, delay)
+                time.sleep(delay)
+                delay *= 2
+            else:
+                return None
+        return None
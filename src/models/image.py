@@ -35,7 +35,13 @@ class ImageFeatures:
     format: формат изображения
     mean_brightness: средняя яркость
     contrast: стандартное отклонение яркости
+    density: плотность краёв
+    histogram: гистограмма яркости
     computed_at: время вычисления признаков
+    sample_scale: масштаб приближённого анализа (1 - точный анализ)
+    brightness_error, contrast_error, density_error: нижние оценки ошибок приближённого анализа (только ошибка
+        выборки, без систематического смещения уменьшенного вида)
+    ahash, dhash, phash: перцептивные хеши (64-битные целые)
     """
 
     id: str
@@ -48,3 +54,10 @@ class ImageFeatures:
     density: float
     histogram: list[int]
     computed_at: datetime = field(default_factory=datetime.utcnow)
+    sample_scale: int = 1
+    brightness_error: float = 0.0
+    contrast_error: float = 0.0
+    density_error: float = 0.0
+    ahash: int | None = None
+    dhash: int | None = None
+    phash: int | None = None
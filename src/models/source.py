@@ -11,10 +11,12 @@ class ImageSource:
     id: уникальный идентификатор источника
     location: путь к файлу или URL
     filename: имя файла
+    content_hash: BLAKE2-хеш содержимого файла
     created_at: время создания записи
     """
 
     id: str = field(default_factory=lambda: uuid4().hex)
     location: str = ''
     filename: str = ''
+    content_hash: str = ''
     created_at: datetime = field(default_factory=datetime.utcnow)
@@ -27,3 +27,27 @@ def edge_image_10x10() -> Image.Image:
     arr = np.zeros((10, 10), dtype=np.uint8)
     arr[:, 5:] = 255
     return Image.fromarray(arr, mode='L')
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """
+    Временная база данных SQLite.
+    """
+    import src.database.sqlite as db
+
+    test_db_path = tmp_path / 'test.sqlite3'
+    monkeypatch.setattr(db, 'DB_PATH', test_db_path)
+    db.init_db()
+    yield test_db_path
+    db.close_connections()
+
+
+@pytest.fixture
+def noise_image_64x48() -> Image.Image:
+    """
+    RGB-изображение 64x48 со случайным шумом.
+    """
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+    return Image.fromarray(arr, mode='RGB')
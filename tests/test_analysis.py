@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.core import analysis
+from src.core.analysis import analyze
+from src.core.io import load_image
+from src.core.processing import compute_features
+from src.database import get_image_features
+
+
+def test_analyze_uses_fused_features(temp_db, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка признаков, возвращаемых analyze.
+    """
+    features = analyze(noise_image_64x48, 'img-1')
+    expected = compute_features(noise_image_64x48)
+
+    assert (features.width, features.height) == (64, 48)
+    assert features.histogram == expected.histogram
+    assert features.mean_brightness == expected.mean_brightness
+    assert features.contrast == expected.contrast
+    assert features.density == expected.density
+
+
+@pytest.mark.parametrize('suffix', ['.jpg', '.png'])
+def test_analyze_approximate_is_close_to_exact(temp_db, tmp_path: Path, suffix: str) -> None:
+    """
+    Проверка приближённого анализа (JPEG draft и прореживание пикселей).
+    """
+    x = np.linspace(0, 255, 256, dtype=np.float32)
+    arr = np.tile(x, (192, 1)).astype(np.uint8)
+    path = tmp_path / f'gradient{suffix}'
+    Image.fromarray(arr, mode='L').convert('RGB').save(path)
+
+    img, _, data = load_image(str(path))
+    exact = analyze(img, data.id + '-exact')
+    approx = analyze(img, data.id + '-approx', sample_scale=4)
+
+    assert img.size == (256, 192)
+    assert (approx.width, approx.height) == (exact.width, exact.height)
+    assert approx.sample_scale == 4
+    assert sum(approx.histogram) < sum(exact.histogram)
+    assert approx.brightness_error > 0
+    assert abs(approx.mean_brightness - exact.mean_brightness) < 2.0
+    assert abs(approx.contrast - exact.contrast) < 2.0
+    assert exact.brightness_error == 0.0
+
+
+def test_analyze_rejects_unknown_scale(temp_db, gray_image_10x10: Image.Image) -> None:
+    """
+    Проверка недопустимого масштаба приближённого анализа.
+    """
+    with pytest.raises(ValueError):
+        analyze(gray_image_10x10, 'img-1', sample_scale=3)
+
+
+def test_analyze_returns_cached_features_for_same_file(temp_db, tmp_path: Path, monkeypatch) -> None:
+    """
+    Проверка кеша признаков по хешу содержимого файла.
+    """
+    path = tmp_path / 'img.png'
+    Image.new('RGB', (8, 8), color=(50, 100, 150)).save(path)
+
+    img, _, data = load_image(str(path))
+    first = analyze(img, data.id)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('features must not be recomputed')
+
+    monkeypatch.setattr(analysis, 'compute_features', fail)
+    img2, _, data2 = load_image(str(path))
+    second = analyze(img2, data2.id)
+
+    assert data2.id == data.id
+    assert second.id == first.id
+    assert second.histogram == first.histogram
+
+
+def test_analyze_recomputes_exact_over_approximate(temp_db, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка пересчёта точных признаков поверх приближённых.
+    """
+    approx = analyze(noise_image_64x48, 'img-1', sample_scale=2)
+    assert analyze(noise_image_64x48, 'img-1', sample_scale=4).id == approx.id
+
+    exact = analyze(noise_image_64x48, 'img-1')
+    assert exact.id != approx.id
+    assert exact.sample_scale == 1
+    stored = get_image_features('img-1')
+    assert stored is not None and stored.id == exact.id
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+from PIL import Image
+
+from src.core.batch import collect_paths, run_batch
+from src.core.io import ImageSaver
+from src.core.processing import Options
+
+
+def test_collect_paths_filters_images(tmp_path: Path) -> None:
+    """
+    Проверка выбора изображений из директории.
+    """
+    Image.new('RGB', (4, 4)).save(tmp_path / 'a.png')
+    Image.new('RGB', (4, 4)).save(tmp_path / 'b.jpg')
+    (tmp_path / 'notes.txt').write_text('skip me')
+
+    assert [Path(p).name for p in collect_paths(str(tmp_path))] == ['a.png', 'b.jpg']
+    assert [Path(p).name for p in collect_paths(str(tmp_path / '*.png'))] == ['a.png']
+
+
+def test_run_batch_reports_results_and_errors(temp_db, tmp_path: Path) -> None:
+    """
+    Проверка пакетной обработки в пуле процессов.
+    """
+    src_dir = tmp_path / 'src'
+    src_dir.mkdir()
+    for i in range(3):
+        Image.new('RGB', (16, 12), color=(i * 40, 0, 0)).save(src_dir / f'img{i}.png')
+    (src_dir / 'broken.png').write_bytes(b'not an image')
+
+    out_dir = tmp_path / 'out'
+    paths = collect_paths(str(src_dir))
+    results = list(run_batch(paths, {Options.Resize: (8, 6)}, str(out_dir), workers=2))
+
+    assert len(results) == 4
+    failed = [r for r in results if not r.ok]
+    assert [Path(r.path).name for r in failed] == ['broken.png']
+    for result in results:
+        if result.ok:
+            assert result.output_path is not None
+            assert Image.open(result.output_path).size == (8, 6)
+            assert result.features is not None
+
+
+def test_run_batch_saves_through_image_saver(temp_db, tmp_path: Path) -> None:
+    """
+    Проверка записи результатов пакетной обработки через ImageSaver и отчёта об ошибке записи.
+    """
+    src_dir = tmp_path / 'src'
+    src_dir.mkdir()
+    for i in range(3):
+        Image.new('RGB', (16, 12), color=(i * 40, 0, 0)).save(src_dir / f'img{i}.png')
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+    (out_dir / 'img1.png').mkdir()
+
+    with ImageSaver(workers=2) as saver:
+        results = list(run_batch(collect_paths(str(src_dir)), {Options.Resize: (8, 6)}, str(out_dir), 2, saver=saver))
+
+    assert all(result.image is None for result in results)
+    assert sorted(Path(r.path).name for r in results if not r.ok) == ['img1.png']
+    with Image.open(out_dir / 'img2.png') as img:
+        assert (img.size, img.getpixel((0, 0))) == ((8, 6), (80, 0, 0))
@@ -1,6 +1,18 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
 from pathlib import Path
 
+import numpy as np
+import pytest
+from PIL import Image
+
 import src.database.sqlite as db
+from src.core.analysis import analyze
+from src.core.processing import Options
+from src.database import BatchWriter
+from src.models import ImageFeatures, TransformationRecord
 
 
 def test_init_db_creates_tables(tmp_path: Path, monkeypatch) -> None:
@@ -18,3 +30,350 @@ def test_init_db_creates_tables(tmp_path: Path, monkeypatch) -> None:
         tables = {row[0] for row in cur.fetchall()}
 
     assert 'image_features' in tables or 'images' in tables
+
+
+def test_init_db_migrates_old_schema(tmp_path: Path, monkeypatch) -> None:
+    """
+    Проверка добавления новых столбцов в существующую базу.
+    """
+    test_db_path = tmp_path / 'old.sqlite3'
+    monkeypatch.setattr(db, 'DB_PATH', test_db_path)
+
+    conn = sqlite3.connect(test_db_path)
+    conn.execute(
+        """
+        CREATE TABLE image_features (
+            image_id TEXT PRIMARY KEY, width INTEGER NOT NULL, height INTEGER NOT NULL, format TEXT NOT NULL,
+            mean_brightness REAL NOT NULL, contrast REAL NOT NULL, density REAL NOT NULL,
+            histogram_json TEXT NOT NULL, computed_at TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE transformations (
+            id TEXT PRIMARY KEY, image_id TEXT NOT NULL, name TEXT NOT NULL, params_json TEXT NOT NULL,
+            applied_at TEXT NOT NULL, FOREIGN KEY(image_id) REFERENCES image_features(image_id) ON DELETE CASCADE
+        )
+        """
+    )
+    histogram = list(range(256))
+    conn.execute(
+        "INSERT INTO image_features VALUES ('old', 2, 2, 'PNG', 1.0, 2.0, 0.5, ?, '2024-01-01T00:00:00')",
+        (json.dumps(histogram),),
+    )
+    conn.execute("INSERT INTO transformations VALUES ('t1', 'old', 'resize', '{}', '2024-01-01T00:00:00')")
+    conn.commit()
+    conn.close()
+
+    db.init_db()
+
+    with db.db_cursor() as cur:
+        cur.execute('PRAGMA table_info(image_features)')
+        columns = {row['name'] for row in cur.fetchall()}
+        cur.execute("SELECT histogram_json FROM image_features WHERE image_id = 'old'")
+        assert cur.fetchone()[0] is None
+        cur.execute('SELECT COUNT(*) FROM transformations')
+        assert cur.fetchone()[0] == 1
+
+    assert set(db.IMAGE_FEATURES_MIGRATIONS) <= columns
+    stored_histogram = db.get_histogram('old')
+    features = db.get_image_features('old')
+    assert stored_histogram is not None and features is not None
+    assert stored_histogram.tolist() == histogram
+    assert features.histogram == histogram
+    db.close_connections()
+
+
+def test_histogram_blob_roundtrip_and_bulk_read(temp_db: Path, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка упаковки гистограмм в BLOB и чтения пачками через np.frombuffer.
+    """
+    sparse = [0] * 256
+    sparse[10] = 5
+    dense = list(range(1_000_000, 1_000_256))
+    for histogram in (sparse, dense):
+        assert len(db.encode_histogram(histogram)) == db.HISTOGRAM_BLOB_SIZE
+        blob = db.encode_histogram(histogram, compress=True)
+        assert len(blob) <= db.HISTOGRAM_BLOB_SIZE
+        assert db.decode_histogram(blob).tolist() == histogram
+    assert len(db.encode_histogram(sparse, compress=True)) < db.HISTOGRAM_BLOB_SIZE
+
+    features = [analyze(noise_image_64x48, f'img-{i}') for i in range(3)]
+    batches = list(db.iter_histograms(batch_size=2))
+
+    assert [len(image_ids) for image_ids, _ in batches] == [2, 1]
+    image_ids = [image_id for ids, _ in batches for image_id in ids]
+    matrix = np.concatenate([matrix for _, matrix in batches])
+    assert matrix.dtype == np.uint32
+    for image_id, row in zip(image_ids, matrix, strict=True):
+        assert row.tolist() == features[int(image_id[-1])].histogram
+
+
+def test_hash_columns_store_unsigned_64_bit_values() -> None:
+    """
+    Проверка перевода беззнаковых 64-битных хешей в целые SQLite и обратно.
+    """
+    for value in (0, 1, 2**63 - 1, 2**63, 2**64 - 1):
+        stored = db.to_sqlite_int(value)
+        assert stored is not None
+        assert -(2**63) <= stored < 2**63
+        assert db.from_sqlite_int(stored) == value
+
+
+def test_connection_is_reused_per_thread_in_wal_mode(temp_db: Path) -> None:
+    """
+    Проверка постоянного соединения потока, его закрытия при выходе потока и журнала WAL.
+    """
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    other: list[sqlite3.Connection] = []
+    thread = threading.Thread(target=lambda: other.append(db.get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+    # Соединение завершившегося потока закрывается вместе с ним.
+    with pytest.raises(sqlite3.ProgrammingError):
+        other[0].execute('SELECT 1')
+    conn.execute('SELECT 1')
+
+
+def test_concurrent_inserts_from_threads(temp_db: Path) -> None:
+    """
+    Проверка одновременной записи из нескольких потоков.
+    """
+    with db.db_cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO image_features (
+                image_id, width, height, format, mean_brightness, contrast, density, histogram_json, computed_at
+            )
+            VALUES ('img', 1, 1, 'PNG', 0, 0, 0, '[]', '2024-01-01T00:00:00')
+            """
+        )
+
+    def worker(thread_index: int) -> None:
+        for i in range(20):
+            db.insert_transformation(
+                TransformationRecord(
+                    id=f'{thread_index}-{i}',
+                    image_id='img',
+                    name=Options.Brightness,
+                    params={'factor': 1.0},
+                    applied_at=datetime(2024, 1, 1),
+                )
+            )
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with db.db_cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM transformations')
+        assert cur.fetchone()[0] == 80
+
+
+def test_batch_writer_groups_records_and_flushes_on_barrier() -> None:
+    """
+    Проверка группировки записей в пачки и барьера flush().
+    """
+    batches: list[dict] = []
+    writer = BatchWriter(batches.append, max_batch=4, max_delay=60)
+    for i in range(10):
+        writer.put('transformations', i)
+    writer.flush()
+
+    assert [item for batch in batches for item in batch['transformations']] == list(range(10))
+    assert len(batches) <= 3
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.put('transformations', 10)
+
+
+def test_batch_writer_retries_and_reports_lost_records() -> None:
+    """
+    Проверка повтора неудачной записи и ошибки о потерянных записях, если повторы не помогли.
+    """
+    attempts: list[int] = []
+
+    def flaky(batch: dict) -> None:
+        attempts.append(len(batch['features']))
+        if len(attempts) < 3:
+            raise sqlite3.OperationalError('database is locked')
+
+    writer = BatchWriter(flaky, max_delay=60, retries=3, retry_delay=0.001)
+    writer.put('features', 1)
+    writer.flush()
+    assert attempts == [1, 1, 1]
+    writer.close()
+
+    def broken(batch: dict) -> None:
+        raise sqlite3.OperationalError('disk I/O error')
+
+    writer = BatchWriter(broken, max_delay=60, retries=1, retry_delay=0.001)
+    writer.put('features', 1)
+    writer.put('manifest', 2)
+    with pytest.raises(RuntimeError, match='2 record') as error:
+        writer.flush()
+    assert isinstance(error.value.__cause__, sqlite3.OperationalError)
+    writer.close()
+
+
+def test_batch_writer_drops_only_failing_records() -> None:
+    """
+    Проверка записи по одной после неудачных повторов: теряется только запись, которая не проходит сама.
+    """
+    written: list[tuple[str, int]] = []
+
+    def strict(batch: dict) -> None:
+        if any(item < 0 for items in batch.values() for item in items):
+            raise sqlite3.IntegrityError('CHECK constraint failed')
+        written.extend((kind, item) for kind, items in batch.items() for item in items)
+
+    writer = BatchWriter(strict, max_delay=60, retries=1, retry_delay=0.001)
+    writer.put('manifest', 3)
+    writer.put('features', 1)
+    writer.put('features', -1)
+    writer.put('transformations', 2)
+    with pytest.raises(RuntimeError, match='1 record') as error:
+        writer.flush()
+    assert isinstance(error.value.__cause__, sqlite3.IntegrityError)
+    assert written == [('features', 1), ('transformations', 2), ('manifest', 3)]
+
+    writer.put('features', 4)
+    writer.flush()
+    writer.close()
+    assert written[-1] == ('features', 4)
+
+
+def test_write_behind_defers_database_writes(temp_db: Path, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка отложенной записи признаков: до flush они видны через get_image_features, но не в базе.
+    """
+    with db.write_behind(max_delay=60):
+        features = analyze(noise_image_64x48, 'img-deferred')
+        with db.db_cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM image_features')
+            assert cur.fetchone()[0] == 0
+        assert db.get_image_features('img-deferred') is features
+
+        db.flush_writes()
+        with db.db_cursor() as cur:
+            cur.execute('SELECT COUNT(*) FROM image_features')
+            assert cur.fetchone()[0] == 1
+
+    assert db.active_writer() is None
+    assert db.get_image_features('img-deferred') == features
+
+
+def test_aggregates_follow_inserts_and_updates(temp_db: Path) -> None:
+    """
+    Проверка инкрементальных агрегатов: повторная запись изображения заменяет его вклад.
+    """
+
+    def features(image_id: str, fmt: str, brightness: float, contrast: float, bin_: int) -> ImageFeatures:
+        histogram = [0] * 256
+        histogram[bin_] = 10
+        return ImageFeatures(
+            id=image_id,
+            image_id=image_id,
+            width=1,
+            height=1,
+            format=fmt,
+            mean_brightness=brightness,
+            contrast=contrast,
+            density=0.5,
+            histogram=histogram,
+        )
+
+    db.insert_image_features(features('a', 'PNG', 10, 1, 0))
+    db.insert_image_features(features('b', 'PNG', 30, 3, 1))
+    db.insert_image_features(features('c', 'JPEG', 50, 5, 2))
+    db.insert_image_features(features('b', 'PNG', 20, 2, 2))
+
+    png = db.get_aggregates('PNG')
+    assert png.count == 2
+    assert png.mean('brightness') == pytest.approx(15)
+    assert png.variance('contrast') == pytest.approx(np.var([1, 2]))
+    assert png.histogram[:3].tolist() == [10, 0, 10]
+
+    total = db.get_aggregates()
+    assert total.count == 3
+    assert total.mean('density') == pytest.approx(0.5)
+    assert total.histogram[:3].tolist() == [10, 0, 20]
+
+    with db.db_cursor() as cur:
+        cur.execute('DELETE FROM feature_aggregates')
+    assert db.rebuild_aggregates() == 3
+    rebuilt = db.get_aggregates()
+    assert rebuilt.sums == total.sums
+    assert rebuilt.histogram.tolist() == total.histogram.tolist()
+
+
+def test_aggregates_are_consistent_with_concurrent_writers(temp_db: Path) -> None:
+    """
+    Проверка, что параллельные писатели не теряют обновления агрегатов.
+    """
+
+    def write(prefix: str) -> None:
+        for number in range(40):
+            db.insert_image_features(
+                ImageFeatures(
+                    id=f'{prefix}-{number}',
+                    image_id=f'{prefix}-{number}',
+                    width=1,
+                    height=1,
+                    format='PNG',
+                    mean_brightness=1.0,
+                    contrast=1.0,
+                    density=1.0,
+                    histogram=[1] * 256,
+                )
+            )
+
+    threads = [threading.Thread(target=write, args=(prefix,)) for prefix in ('a', 'b', 'c')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    aggregates = db.get_aggregates('PNG')
+    assert aggregates.count == 120
+    assert aggregates.sums['brightness'] == pytest.approx(120)
+    assert aggregates.histogram.tolist() == [120] * 256
+
+
+def test_histogram_compression_is_a_setting(temp_db: Path, monkeypatch) -> None:
+    """
+    Проверка, что гистограммы по умолчанию хранятся несжатыми, а сжатые по настройке читаются так же.
+    """
+    histogram = [0] * 256
+    histogram[3] = 7
+    features = ImageFeatures(
+        id='f',
+        image_id='raw',
+        width=1,
+        height=7,
+        format='PNG',
+        mean_brightness=3.0,
+        contrast=0.0,
+        density=0.0,
+        histogram=histogram,
+    )
+    db.insert_image_features(features)
+    monkeypatch.setattr(db, 'HISTOGRAM_COMPRESSION', True)
+    features.image_id = 'packed'
+    db.insert_image_features(features)
+
+    with db.db_cursor() as cur:
+        cur.execute('SELECT image_id, length(histogram_blob) AS size FROM image_features ORDER BY image_id')
+        sizes = {row['image_id']: row['size'] for row in cur.fetchall()}
+    assert sizes['raw'] == db.HISTOGRAM_BLOB_SIZE
+    assert sizes['packed'] < db.HISTOGRAM_BLOB_SIZE
+    for image_id in ('raw', 'packed'):
+        stored = db.get_histogram(image_id)
+        assert stored is not None and stored.tolist() == histogram
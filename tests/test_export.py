@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from src.core.analysis import analyze
+from src.database import get_image_features
+from src.database.export import export_features, load_features
+
+
+def test_export_features_roundtrip(temp_db, tmp_path: Path, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка выгрузки признаков по столбцам и чтения через np.memmap.
+    """
+    image_ids = [f'img-{i}' for i in range(5)]
+    for i, image_id in enumerate(image_ids):
+        analyze(noise_image_64x48.rotate(90 * i, expand=True), image_id)
+
+    out = tmp_path / 'export'
+    assert export_features(out, chunk_rows=2) == 5
+
+    columns = load_features(out)
+    assert isinstance(columns['histogram'], np.memmap)
+    assert columns['histogram'].shape == (5, 256)
+    assert columns['histogram'].dtype == np.uint32
+    assert columns['image_id'].tolist() == image_ids
+    assert columns['has_hashes'].all()
+
+    for row, image_id in enumerate(image_ids):
+        features = get_image_features(image_id)
+        assert features is not None
+        assert columns['histogram'][row].tolist() == features.histogram
+        assert columns['mean_brightness'][row] == features.mean_brightness
+        assert (columns['width'][row], columns['height'][row]) == (features.width, features.height)
+        assert int(columns['phash'][row]) == features.phash
+        assert columns['computed_at'][row] == np.datetime64(features.computed_at)
+
+
+def test_export_empty_table(temp_db, tmp_path: Path) -> None:
+    """
+    Проверка выгрузки пустой таблицы.
+    """
+    assert export_features(tmp_path / 'empty') == 0
+    assert load_features(tmp_path / 'empty')['histogram'].shape == (0, 256)
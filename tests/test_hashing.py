@@ -0,0 +1,74 @@
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from src.core.analysis import analyze
+from src.core.hashing import HashIndex, build_hash_index, compute_hashes, hamming_distance
+from src.database import get_image_features
+from src.database.sqlite import db_cursor
+
+
+def test_hashes_are_stable_under_small_changes(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка устойчивости хешей к небольшим изменениям изображения.
+    """
+    img = noise_image_64x48.resize((256, 192), Image.Resampling.BICUBIC)
+    brighter = ImageEnhance.Brightness(img).enhance(1.05)
+    other = Image.fromarray(np.random.default_rng(1).integers(0, 256, (192, 256, 3), dtype=np.uint8))
+
+    original = compute_hashes(img)
+    for a, b, c in zip(original, compute_hashes(brighter), compute_hashes(other), strict=True):
+        assert hamming_distance(a, b) <= 6
+        assert hamming_distance(a, c) > 12
+
+
+def test_hash_index_query_matches_brute_force() -> None:
+    """
+    Проверка поиска в индексе относительно полного перебора.
+    """
+    rng = np.random.default_rng(0)
+    base = [int(v) for v in rng.integers(0, 2**63, size=50, dtype=np.int64)]
+    hashes = base + [h ^ (1 << i) ^ (1 << (i + 5)) for i, h in enumerate(base)]
+
+    index = HashIndex()
+    index.extend((str(i), h) for i, h in enumerate(hashes))
+
+    for max_distance in (0, 2, 5, 9):
+        query = hashes[3]
+        expected = sorted(
+            (str(i), hamming_distance(query, h))
+            for i, h in enumerate(hashes)
+            if hamming_distance(query, h) <= max_distance
+        )
+        assert sorted(index.query(query, max_distance)) == expected
+
+    pairs = {(a, b) for a, b, _ in index.duplicate_pairs(2)}
+    assert {(str(i), str(i + 50)) for i in range(50)} <= pairs
+
+
+def test_hashes_round_trip_through_database(temp_db, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка сохранения 64-битных хешей в базе данных.
+    """
+    features = analyze(noise_image_64x48, 'img-1')
+    stored = get_image_features('img-1')
+
+    assert stored is not None and features.phash is not None
+    assert (stored.ahash, stored.dhash, stored.phash) == (features.ahash, features.dhash, features.phash)
+    assert build_hash_index('phash').query(features.phash, 0) == [('img-1', 0)]
+
+
+def test_cached_features_without_hashes_are_backfilled(temp_db, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка, что строки, сохранённые до появления хешей, получают хеши при попадании в кеш.
+    """
+    features = analyze(noise_image_64x48, 'img-old')
+    with db_cursor() as cur:
+        cur.execute("UPDATE image_features SET ahash = NULL, dhash = NULL, phash = NULL WHERE image_id = 'img-old'")
+    assert len(build_hash_index('phash')) == 0
+
+    cached = analyze(noise_image_64x48, 'img-old')
+
+    stored = get_image_features('img-old')
+    assert features.phash is not None and stored is not None
+    assert cached.phash == stored.phash == features.phash
+    assert build_hash_index('phash').query(features.phash, 0) == [('img-old', 0)]
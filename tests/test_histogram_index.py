@@ -0,0 +1,148 @@
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import src.database.sqlite as db
+from src.database.histogram_index import HistogramIndex, histogram_distances, normalize_histograms
+from src.models import ImageFeatures
+
+
+def _features(image_id: str, histogram: list[int]) -> ImageFeatures:
+    return ImageFeatures(
+        id=image_id,
+        image_id=image_id,
+        width=1,
+        height=sum(histogram),
+        format='PNG',
+        mean_brightness=0.0,
+        contrast=0.0,
+        density=0.0,
+        histogram=histogram,
+    )
+
+
+@pytest.mark.parametrize('metric', ['chi2', 'intersection', 'bhattacharyya'])
+def test_histogram_index_query_matches_brute_force(tmp_path: Path, metric: str, monkeypatch) -> None:
+    """
+    Проверка точности поиска по частям матрицы с отсечением по грубым гистограммам.
+    """
+    import src.database.histogram_index as histogram_index
+
+    monkeypatch.setattr(histogram_index, 'QUERY_BATCH_ROWS', 7)
+    monkeypatch.setattr(histogram_index, 'MIN_CANDIDATES', 1)
+    rng = np.random.default_rng(0)
+    histograms = rng.integers(0, 1000, size=(40, 256)).tolist()
+
+    index = HistogramIndex(tmp_path / 'h.f32', tmp_path / 'h.ids')
+    index.append([(f'img-{i}', h) for i, h in enumerate(histograms)])
+
+    query = histograms[5]
+    distances = histogram_distances(normalize_histograms(histograms), normalize_histograms([query])[0], metric)
+    expected = [f'img-{i}' for i in np.argsort(distances, kind='stable')[:5]]
+
+    result = index.query(query, k=5, metric=metric)
+    assert [image_id for image_id, _ in result] == expected
+    assert result[0] == ('img-5', pytest.approx(0.0, abs=1e-4))
+
+
+def test_histogram_index_is_updated_on_insert(temp_db) -> None:
+    """
+    Проверка обновления индекса при сохранении признаков и повторной записи image_id.
+    """
+    dark = [100] + [0] * 255
+    bright = [0] * 255 + [100]
+
+    db.insert_image_features(_features('a', dark))
+    db.insert_image_features(_features('b', bright))
+    assert [image_id for image_id, _ in db.search_histograms(dark, k=2)] == ['a', 'b']
+
+    db.insert_image_features(_features('a', bright))
+    assert len(db.histogram_index()) == 2
+    assert {image_id for image_id, _ in db.search_histograms(bright, k=2)} == {'a', 'b'}
+
+    db.histogram_index().clear()
+    assert db.rebuild_histogram_index() == 2
+    assert len(db.histogram_index()) == 2
+
+
+def test_histogram_index_refreshes_incrementally(tmp_path: Path) -> None:
+    """
+    Проверка, что запрос подгружает только дописанные строки и учитывает повторную запись image_id.
+    """
+    index = HistogramIndex(tmp_path / 'h.f32', tmp_path / 'h.ids')
+    dark = [100] + [0] * 255
+    bright = [0] * 255 + [100]
+    index.append([('a', dark), ('b', bright)])
+    assert index.query(dark, k=1)[0][0] == 'a'
+    offset = index._ids_offset
+
+    other = HistogramIndex(tmp_path / 'h.f32', tmp_path / 'h.ids')
+    other.append([('a', bright), ('c', dark)])
+
+    assert len(index) == 3
+    assert index._ids_offset > offset
+    assert [image_id for image_id, _ in index.query(dark, k=3)][:1] == ['c']
+    assert {image_id for image_id, _ in index.query(bright, k=2)} == {'a', 'b'}
+
+
+def test_histogram_index_concurrent_appends_keep_rows_aligned(tmp_path: Path) -> None:
+    """
+    Проверка, что параллельные записи не перемешивают строки матрицы и image_id.
+    """
+
+    def write(thread: int) -> None:
+        index = HistogramIndex(tmp_path / 'h.f32', tmp_path / 'h.ids')
+        for step in range(30):
+            bin_ = (thread * 30 + step) % 256
+            histogram = [0] * 256
+            histogram[bin_] = 1
+            index.append([(f'{thread}-{step}-{bin_}', histogram)])
+
+    threads = [threading.Thread(target=write, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    index = HistogramIndex(tmp_path / 'h.f32', tmp_path / 'h.ids')
+    assert len(index) == 120
+    matrix = np.asarray(index._matrix)
+    for row, image_id in enumerate(index._ids):
+        assert matrix[row].argmax() == int(image_id.rsplit('-', 1)[1])
+
+
+def test_histogram_index_is_cached_per_database(temp_db) -> None:
+    """
+    Проверка, что search_histograms использует один объект индекса.
+    """
+    assert db.histogram_index() is db.histogram_index()
+
+
+def test_init_db_rebuilds_missing_or_dirty_index(temp_db, monkeypatch) -> None:
+    """
+    Проверка пересборки индекса при запуске, если он отсутствует, отстаёт от базы или помечен как устаревший.
+    """
+    dark = [100] + [0] * 255
+    bright = [0] * 255 + [100]
+    db.insert_image_features(_features('a', dark))
+    db.insert_image_features(_features('b', [0] * 128 + [100] + [0] * 127))
+    index = db.histogram_index()
+
+    index.clear()
+    db.init_db()
+    assert len(index) == 2
+
+    def fail(items):
+        raise OSError('No space left on device')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(index, 'append', fail)
+        db.insert_image_features(_features('a', bright))
+    assert index.dirty
+    assert db.search_histograms(bright, k=1)[0][1] > 0
+
+    db.init_db()
+    assert not index.dirty
+    assert db.search_histograms(bright, k=1) == [('a', 0.0)]
@@ -3,9 +3,11 @@ from __future__ import annotations
 from pathlib import Path
 
 import pytest
-from PIL import Image
+from PIL import Image, ImageFile
 
-from src.core.io import load_image, save_image
+from src.core import io
+from src.core.io import file_hash, load_image, parse_operation, save_image
+from src.core.processing import Options
 
 
 def test_load_png(tmp_path: Path) -> None:
@@ -53,3 +55,106 @@ def test_load_image_raises_for_missing_file(tmp_path: Path) -> None:
     missing = tmp_path / 'nope.png'
     with pytest.raises(OSError):
         load_image(str(missing))
+
+
+def test_parse_operation() -> None:
+    """
+    Проверка разбора строки трансформации.
+    """
+    assert parse_operation('resize=800x600') == (Options.Resize, (800, 600))
+    assert parse_operation('Brightness=1.5') == (Options.Brightness, 1.5)
+    assert parse_operation('filter=blur') == (Options.Filter, 'blur')
+
+    with pytest.raises(ValueError):
+        parse_operation('rotate=90')
+    with pytest.raises(ValueError):
+        parse_operation('resize=800')
+
+
+def test_load_image_id_is_content_hash(tmp_path: Path) -> None:
+    """
+    Проверка ID изображения, вычисляемого по содержимому файла.
+    """
+    img = Image.new('RGB', (6, 6), color=(1, 2, 3))
+    img.save(tmp_path / 'a.png')
+    img.save(tmp_path / 'b.png')
+    Image.new('RGB', (6, 6), color=(3, 2, 1)).save(tmp_path / 'c.png')
+
+    _, source_a, data_a = load_image(str(tmp_path / 'a.png'))
+    _, _, data_b = load_image(str(tmp_path / 'b.png'))
+    _, _, data_c = load_image(str(tmp_path / 'c.png'))
+
+    assert data_a.id == source_a.content_hash == file_hash(str(tmp_path / 'a.png'))
+    assert data_a.id == data_b.id
+    assert data_a.id != data_c.id
+
+
+def test_iter_images_prefetches_in_order_and_reports_errors(tmp_path: Path, monkeypatch) -> None:
+    """
+    Проверка фоновой загрузки: порядок, ограничение числа загружаемых заранее, ленивое декодирование и ошибки.
+    """
+    paths = []
+    for i in range(6):
+        path = tmp_path / f'img{i}.png'
+        Image.new('L', (8, 8), color=i).save(path)
+        paths.append(str(path))
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    paths.insert(3, str(broken))
+
+    started: list[str] = []
+    original = io._prefetch_image
+
+    def tracking(path, cache):
+        started.append(path)
+        return original(path, cache)
+
+    monkeypatch.setattr(io, '_prefetch_image', tracking)
+
+    results = io.iter_images(paths, prefetch=2)
+    first = next(results)
+    assert first.path == paths[0] and first.ok
+    assert isinstance(first.img, ImageFile.ImageFile)
+    assert first.img.tile, 'prefetch must not decode pixels'
+    assert first.img.getpixel((0, 0)) == 0
+    assert len(started) <= 3
+
+    rest = list(results)
+    assert [loaded.path for loaded in rest] == paths[1:]
+    failed = [loaded for loaded in rest if not loaded.ok]
+    assert [loaded.path for loaded in failed] == [str(broken)]
+    assert 'UnidentifiedImageError' in (failed[0].error or '')
+
+
+def test_save_presets_and_atomic_write(tmp_path: Path, noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка пресетов кодировщика и отсутствия временных файлов после сохранения.
+    """
+    img = noise_image_64x48.resize((256, 192))
+    fast, small = tmp_path / 'fast.jpg', tmp_path / 'small.jpg'
+    save_image(img, str(fast), preset='fast')
+    save_image(img, str(small), preset='small')
+
+    assert small.stat().st_size < fast.stat().st_size
+    assert Image.open(small).info.get('progressive') == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['fast.jpg', 'small.jpg']
+    with pytest.raises(ValueError):
+        save_image(img, str(tmp_path / 'x.png'), preset='tiny')
+
+
+def test_image_saver_writes_in_background(tmp_path: Path) -> None:
+    """
+    Проверка фонового сохранения, ограничения размера очереди и отчёта об ошибках записи.
+    """
+    images = [Image.new('RGB', (32, 32), color=(i, 0, 0)) for i in range(8)]
+    saver = io.ImageSaver(workers=2, max_pending_bytes=2 * 32 * 32 * 3, preset='fast')
+    futures = [saver.save(img, str(tmp_path / f'{i}.png')) for i, img in enumerate(images)]
+    failed_future = saver.save(images[0], str(tmp_path / 'bad.xyz'), formatting='NOPE')
+    failed = saver.close()
+
+    assert [future.result() for future in futures] == [str(tmp_path / f'{i}.png') for i in range(8)]
+    assert Image.open(tmp_path / '5.png').getpixel((0, 0)) == (5, 0, 0)
+    assert isinstance(failed_future.exception(), (KeyError, ValueError, OSError))
+    assert [path for path, _ in failed] == [str(tmp_path / 'bad.xyz')]
+    assert saver.close() == []
+    assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from src.core.analysis import apply_operation
+from src.core.pipeline import Pipeline
+from src.core.processing import Options
+from src.models import ImageData, ImageSource
+
+
+def test_pipeline_chains_operations(rgb_image_10x10: Image.Image) -> None:
+    """
+    Проверка последовательного применения операций к результату предыдущей.
+    """
+    out = Pipeline([(Options.Resize, (20, 4)), (Options.Brightness, 2.0)]).run(rgb_image_10x10)
+    assert out.size == (20, 4)
+    assert out.getpixel((0, 0)) == (20, 40, 60)
+
+
+def test_pipeline_fuses_point_operations(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка объединения яркости и контраста в один проход.
+    """
+    steps = [(Options.Brightness, 1.3), (Options.Contrast, 0.7)]
+    pipeline = Pipeline(steps)
+    assert len(pipeline.plan(noise_image_64x48.size)) == 1
+
+    fused = np.asarray(pipeline.run(noise_image_64x48), dtype=np.int16)
+    sequential = np.asarray(Pipeline(steps, optimize=False).run(noise_image_64x48), dtype=np.int16)
+    assert np.abs(fused - sequential).max() <= 1
+
+
+def test_pipeline_single_point_operation_is_exact(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка совпадения одиночной операции с ImageEnhance.
+    """
+    out = Pipeline([(Options.Contrast, 1.8)]).run(noise_image_64x48)
+    expected = ImageEnhance.Contrast(noise_image_64x48).enhance(1.8)
+    assert np.array_equal(np.asarray(out), np.asarray(expected))
+
+
+def test_pipeline_moves_downscale_before_point_operations() -> None:
+    """
+    Проверка переноса уменьшения размера перед поточечными операциями при reorder=True.
+    """
+    steps = [(Options.Brightness, 1.2), (Options.Filter, 'sharpen'), (Options.Resize, (10, 10))]
+    plan = Pipeline(steps, reorder=True).plan((100, 100))
+    assert [stage[0][0] for stage in plan] == [Options.Brightness, Options.Filter, Options.Resize]
+
+    steps = [(Options.Filter, 'sharpen'), (Options.Brightness, 1.2), (Options.Resize, (10, 10))]
+    plan = Pipeline(steps, reorder=True).plan((100, 100))
+    assert [stage[0][0] for stage in plan] == [Options.Filter, Options.Resize, Options.Brightness]
+    plan = Pipeline(steps).plan((100, 100))
+    assert [stage[0][0] for stage in plan] == [Options.Filter, Options.Brightness, Options.Resize]
+
+
+def test_pipeline_default_matches_unreordered_pixels(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка, что по умолчанию оптимизированная цепочка даёт те же пиксели, что и последовательное выполнение.
+    """
+    steps = [(Options.Contrast, 1.4), (Options.Resize, (16, 12)), (Options.Filter, 'blur'), (Options.Brightness, 0.8)]
+
+    optimized = Pipeline(steps).run(noise_image_64x48)
+    sequential = Pipeline(steps, optimize=False).run(noise_image_64x48)
+
+    assert np.array_equal(np.asarray(optimized), np.asarray(sequential))
+
+
+def test_apply_operation_records_every_step(temp_db, rgb_image_10x10: Image.Image) -> None:
+    """
+    Проверка записи истории для всех шагов цепочки.
+    """
+    import src.database.sqlite as db
+    from src.core.analysis import analyze
+
+    now = datetime.utcnow()
+    data = ImageData(source=ImageSource(), history=[], created_at=now, updated_at=now)
+    analyze(rgb_image_10x10, data.id)
+    out, record = apply_operation(rgb_image_10x10, data, {Options.Resize: (5, 5), Options.Contrast: 1.5}, data.id)
+
+    assert out.size == (5, 5)
+    assert [r.name for r in data.history] == [Options.Resize, Options.Contrast]
+    assert record is data.history[-1]
+    with db.db_cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM transformations WHERE image_id = ?', (data.id,))
+        assert cur.fetchone()[0] == 2
@@ -0,0 +1,76 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.core.io import load_image
+from src.core.pixel_cache import PixelCache
+from src.core.processing import change_brightness
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+def test_cached_load_matches_decoded_image(tmp_path: Path, noise_image_64x48: Image.Image, mode: str) -> None:
+    """
+    Проверка, что изображение из кеша совпадает с декодированным и не требует декодирования.
+    """
+    path = tmp_path / 'img.png'
+    noise_image_64x48.convert(mode).save(path)
+    cache = PixelCache(tmp_path / 'cache')
+
+    first, _, first_data = load_image(str(path), cache)
+    assert cache.get(str(path)) is not None
+
+    cached, source, data = load_image(str(path), cache)
+    assert (cached.mode, cached.size, cached.format) == (mode, (64, 48), 'PNG')
+    assert cached.tobytes() == first.tobytes()
+    assert data.id == first_data.id == source.content_hash
+    assert change_brightness(cached, 1.5).tobytes() == change_brightness(first, 1.5).tobytes()
+
+
+def test_cache_invalidates_changed_file_and_evicts_lru(tmp_path: Path) -> None:
+    """
+    Проверка ключа по размеру и mtime файла и вытеснения давно не использованных записей.
+    """
+    arr = np.zeros((32, 32), dtype=np.uint8)
+    paths = []
+    for i in range(3):
+        file = tmp_path / f'img{i}.png'
+        Image.fromarray(arr + i).save(file)
+        paths.append(str(file))
+
+    entry_size = np.asarray(arr).nbytes + 128
+    cache = PixelCache(tmp_path / 'cache', max_bytes=2 * entry_size)
+    for index, path in enumerate(paths[:2]):
+        load_image(path, cache)
+        os.utime(cache.directory / f'{cache._key(path)}.npy', ns=(index, index))
+
+    cache.get(paths[0])
+    load_image(paths[2], cache)
+    assert cache.get(paths[0]) is not None
+    assert cache.get(paths[1]) is None
+    assert cache.get(paths[2]) is not None
+
+    Image.fromarray(arr + 100).save(paths[0])
+    os.utime(paths[0], ns=(10**18, 10**18))
+    assert cache.get(paths[0]) is None
+    img, _, _ = load_image(paths[0], cache)
+    assert img.getpixel((0, 0)) == 100
+
+
+def test_load_image_survives_cache_write_errors(tmp_path: Path, monkeypatch) -> None:
+    """
+    Проверка, что ошибка записи в кеш не ломает загрузку изображения.
+    """
+    path = tmp_path / 'img.png'
+    Image.new('L', (4, 4), color=7).save(path)
+    cache = PixelCache(tmp_path / 'cache')
+
+    def fail(*args, **kwargs):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(cache, 'put', fail)
+    img, _, _ = load_image(str(path), cache)
+
+    assert img.getpixel((0, 0)) == 7
@@ -1,15 +1,27 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pytest
-from PIL import Image
+from PIL import Image, ImageEnhance, ImageFilter
 
 from src.core.processing import (
+    apply_filter,
+    blur,
     change_brightness,
     change_contrast,
+    choose_blur_quality,
     compute_contrast,
     compute_edge_density,
+    compute_features,
+    compute_features_tiled,
     compute_mean_brightness,
+    default_filter_workers,
+    filter_parallel,
+    point_lut,
     resize,
 )
+from src.core.pyramid import pyramid_for
 
 
 def test_resize_changes_size(gray_image_10x10: Image.Image) -> None:
@@ -21,6 +33,29 @@ def test_resize_changes_size(gray_image_10x10: Image.Image) -> None:
     assert out.mode == gray_image_10x10.mode
 
 
+def test_pyramid_resize_reuses_levels(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка уменьшения через пирамиду: выбор уровня, кеширование и близость к прямому resize.
+    """
+    pyramid = pyramid_for(noise_image_64x48)
+    assert pyramid_for(noise_image_64x48) is pyramid
+    assert pyramid.level_for(noise_image_64x48, (20, 10)).size == (32, 24)
+    assert pyramid.level_for(noise_image_64x48, (16, 12)).size == (16, 12)
+    assert pyramid.level_for(noise_image_64x48, (40, 10)) is noise_image_64x48
+    assert [level.size for level in pyramid.levels] == [(32, 24), (16, 12)]
+
+    smooth = noise_image_64x48.filter(ImageFilter.GaussianBlur(4))
+    for size in [(30, 20), (8, 6), (64, 48)]:
+        out = resize(smooth, size, use_pyramid=True)
+        assert out.size == size
+        diff = np.abs(np.asarray(out, dtype=float) - np.asarray(resize(smooth, size), dtype=float))
+        assert diff.mean() < 3
+
+    assert resize(noise_image_64x48.convert('P'), (16, 12), use_pyramid=True).mode == 'P'
+    sixteen_bit = Image.fromarray(np.full((48, 64), 1000, dtype=np.uint16))
+    assert resize(sixteen_bit, (16, 12), use_pyramid=True).getpixel((0, 0)) == 1000
+
+
 def test_change_brightness_increases_mean(gray_image_10x10: Image.Image) -> None:
     """
     Проверка увеличения яркости.
@@ -73,3 +108,136 @@ def test_compute_edge_density_higher_for_edge(edge_image_10x10: Image.Image, gra
     edge_density = compute_edge_density(edge_image_10x10)
     flat_density = compute_edge_density(gray_image_10x10)
     assert edge_density > flat_density
+
+
+def test_compute_features_matches_wrappers(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка совпадения однопроходного вычисления с отдельными функциями.
+    """
+    features = compute_features(noise_image_64x48)
+    assert features.histogram == noise_image_64x48.convert('L').histogram()
+    assert features.mean_brightness == compute_mean_brightness(noise_image_64x48)
+    assert features.contrast == compute_contrast(noise_image_64x48)
+    assert features.density == compute_edge_density(noise_image_64x48)
+
+
+def test_compute_features_matches_pixel_statistics(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка вычисления признаков по гистограмме относительно попиксельного расчёта.
+    """
+    gray = np.asarray(noise_image_64x48.convert('L'), dtype=np.float64)
+    features = compute_features(noise_image_64x48)
+    assert features.mean_brightness == pytest.approx(gray.mean(), abs=1e-9)
+    assert features.contrast == pytest.approx(gray.std(), abs=1e-9)
+
+
+@pytest.mark.parametrize('max_memory', [1, 500, 10**9])
+def test_compute_features_tiled_matches_full(noise_image_64x48: Image.Image, max_memory: int) -> None:
+    """
+    Проверка совпадения полосового анализа с анализом всего изображения.
+    """
+    assert compute_features_tiled(noise_image_64x48, max_memory) == compute_features(noise_image_64x48)
+
+
+@pytest.mark.parametrize('mode', ['L', 'RGB', 'RGBA'])
+@pytest.mark.parametrize('factor', [0.4, 1.0, 1.7])
+def test_point_tables_match_image_enhance(noise_image_64x48: Image.Image, mode: str, factor: float) -> None:
+    """
+    Проверка совпадения табличных яркости и контраста с ImageEnhance.
+    """
+    img = noise_image_64x48.convert(mode)
+    assert np.array_equal(
+        np.asarray(change_brightness(img, factor)), np.asarray(ImageEnhance.Brightness(img).enhance(factor))
+    )
+    assert np.array_equal(
+        np.asarray(change_contrast(img, factor)), np.asarray(ImageEnhance.Contrast(img).enhance(factor))
+    )
+    assert np.array_equal(
+        np.asarray(change_contrast(img, factor, compute_mean_brightness(img))),
+        np.asarray(ImageEnhance.Contrast(img).enhance(factor)),
+    )
+
+
+def test_point_lut_is_cached(gray_image_10x10: Image.Image) -> None:
+    """
+    Проверка кеширования таблиц.
+    """
+    point_lut.cache_clear()
+    change_brightness(gray_image_10x10, 1.25)
+    change_brightness(gray_image_10x10, 1.25)
+    info = point_lut.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_change_brightness_falls_back_for_other_modes() -> None:
+    """
+    Проверка изменения яркости для режимов без таблиц.
+    """
+    img = Image.new('CMYK', (4, 4), color=(100, 50, 20, 10))
+    out = change_brightness(img, 0.5)
+    assert out.mode == 'CMYK'
+    assert out.getpixel((0, 0)) == (50, 25, 10, 5)
+
+
+def test_apply_filter_blur_parses_radius_and_quality(noise_image_64x48: Image.Image) -> None:
+    """
+    Проверка радиуса и способа размытия в строке фильтра.
+    """
+    out = apply_filter(noise_image_64x48, 'blur:3:exact')
+    expected = noise_image_64x48.filter(ImageFilter.GaussianBlur(3))
+    assert np.array_equal(np.asarray(out), np.asarray(expected))
+
+    with pytest.raises(ValueError):
+        apply_filter(noise_image_64x48, 'blur:3:fastest')
+    with pytest.raises(ValueError):
+        apply_filter(noise_image_64x48, 'blur:wide')
+
+
+@pytest.mark.parametrize('quality', ['box', 'downsample'])
+def test_blur_approximations_are_close_to_exact(quality: str) -> None:
+    """
+    Проверка близости приближённых способов размытия к точному.
+    """
+    rng = np.random.default_rng(0)
+    small = Image.fromarray(rng.integers(0, 256, size=(40, 50), dtype=np.uint8), mode='L')
+    img = small.resize((400, 320), Image.Resampling.BICUBIC)
+
+    exact = np.asarray(blur(img, 20, 'exact'), dtype=np.int16)
+    approx = np.asarray(blur(img, 20, quality), dtype=np.int16)
+    diff = np.abs(exact - approx)[40:-40, 40:-40]
+    assert diff.mean() < 1.0
+    assert diff.max() <= 4
+
+
+def test_choose_blur_quality() -> None:
+    """
+    Проверка выбора способа размытия.
+    """
+    assert choose_blur_quality((100, 100), 50) == 'exact'
+    assert choose_blur_quality((4000, 3000), 2) == 'exact'
+    assert choose_blur_quality((4000, 3000), 40) == 'downsample'
+
+
+@pytest.mark.parametrize(
+    'image_filter',
+    [ImageFilter.SHARPEN, ImageFilter.EDGE_ENHANCE, ImageFilter.FIND_EDGES, ImageFilter.GaussianBlur(6)],
+)
+def test_filter_parallel_matches_single_thread(image_filter) -> None:
+    """
+    Проверка склейки полос при параллельной фильтрации.
+    """
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 256, size=(300, 90, 3), dtype=np.uint8), mode='RGB')
+    out = filter_parallel(img, image_filter, workers=4)
+    assert np.array_equal(np.asarray(out), np.asarray(img.filter(image_filter)))
+
+
+def test_default_filter_workers_uses_one_thread_in_worker_process() -> None:
+    """
+    Проверка, что воркер пакетной обработки не запускает фильтрацию на все ядра.
+    """
+    size = (4000, 3000)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(default_filter_workers, size).result() == 1
+    assert default_filter_workers(size) == (os.cpu_count() or 1)
+    assert default_filter_workers((100, 100)) == 1
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import src.database.sqlite as db
+from src.core.processing import Options
+from src.database import insert_image_features, insert_transformations, iter_transformations, query_image_features
+from src.database.queries import build_features_query
+from src.models import ImageFeatures, TransformationRecord
+
+
+def make_features(
+    image_id: str, brightness: float, contrast: float, width: int = 100, fmt: str = 'PNG'
+) -> ImageFeatures:
+    return ImageFeatures(
+        id=image_id,
+        image_id=image_id,
+        width=width,
+        height=50,
+        format=fmt,
+        mean_brightness=brightness,
+        contrast=contrast,
+        density=0.1,
+        histogram=[1] * 256,
+        computed_at=datetime(2024, 1, 1),
+    )
+
+
+def test_query_image_features_filters_by_ranges(temp_db) -> None:
+    """
+    Проверка выборки по диапазонам яркости, контраста, размера и формату.
+    """
+    for i in range(20):
+        insert_image_features(
+            make_features(f'img-{i:02d}', brightness=i * 10, contrast=i, fmt='JPEG' if i % 2 else 'PNG')
+        )
+
+    dark_flat = query_image_features(mean_brightness=(None, 50), contrast=(None, 3), batch_size=2)
+    assert [features.image_id for features in dark_flat] == ['img-00', 'img-01', 'img-02', 'img-03']
+
+    jpeg = list(query_image_features(mean_brightness=(100, 150), formats=['jpeg'], order_by='mean_brightness'))
+    assert [features.image_id for features in jpeg] == ['img-11', 'img-13', 'img-15']
+    assert list(query_image_features(width=(200, None))) == []
+
+
+def test_range_queries_use_indexes(temp_db) -> None:
+    """
+    Проверка, что выборки идут по индексам, а не полным просмотром таблицы.
+    """
+    sql, params = build_features_query({'mean_brightness': (None, 40.0)})
+    with db.db_cursor() as cur:
+        cur.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = ' '.join(row['detail'] for row in cur.fetchall())
+        sql, params = build_features_query({'height': (None, 40)})
+        cur.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        height_plan = ' '.join(row['detail'] for row in cur.fetchall())
+        cur.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM transformations WHERE image_id = ? ORDER BY applied_at, rowid', ('x',)
+        )
+        history_plan = ' '.join(row['detail'] for row in cur.fetchall())
+
+    assert 'idx_image_features_brightness' in plan
+    assert 'idx_image_features_height' in height_plan
+    assert 'idx_transformations_image' in history_plan
+    assert 'TEMP B-TREE' not in history_plan
+
+
+def test_iter_transformations_returns_history_in_order(temp_db) -> None:
+    """
+    Проверка чтения истории изображения.
+    """
+    insert_image_features(make_features('img', 100, 10))
+    applied_at = datetime(2024, 1, 1)
+    records = [
+        TransformationRecord(
+            id=f't{i}',
+            image_id='img',
+            name=option,
+            params={'step': i},
+            applied_at=applied_at + timedelta(seconds=i),
+        )
+        for i, option in enumerate([Options.Contrast, Options.Resize, Options.Brightness])
+    ]
+    insert_transformations(list(reversed(records)))
+
+    assert list(iter_transformations('img', batch_size=2)) == records
+    assert list(iter_transformations('missing')) == []
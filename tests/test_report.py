@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from src.core.report import REPORT_COLUMNS, REPORT_ROWS, ReportEntry, load_thumbnail, write_report
+from src.core.visualization import compare_before_after
+
+
+def test_write_report_paginates(tmp_path: Path) -> None:
+    """
+    Проверка разбиения отчёта на страницы и обработки отсутствующего результата.
+    """
+    source = tmp_path / 'src.jpg'
+    Image.new('RGB', (1600, 1200), color=(120, 40, 200)).save(source)
+    output = tmp_path / 'out.png'
+    Image.new('L', (80, 60), color=30).save(output)
+
+    per_page = REPORT_COLUMNS * REPORT_ROWS
+    entries = [ReportEntry(str(source), str(output), list(range(256))) for _ in range(per_page + 1)]
+    entries.append(ReportEntry(str(source), None, None))
+
+    sheets = write_report(iter(entries), tmp_path / 'report', workers=2)
+
+    assert [Path(sheet).name for sheet in sheets] == ['sheet_0001.jpg', 'sheet_0002.jpg']
+    with Image.open(sheets[0]) as first, Image.open(sheets[1]) as second:
+        assert first.width == second.width
+        assert first.height > second.height
+
+
+def test_write_report_survives_bad_images(tmp_path: Path) -> None:
+    """
+    Проверка, что 16-битные и повреждённые изображения не останавливают отчёт.
+    """
+    deep = tmp_path / 'deep.png'
+    Image.fromarray(np.full((600, 800), 40000, dtype=np.uint16)).save(deep)
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+
+    sheets = write_report([ReportEntry(str(deep), str(broken), None)], tmp_path / 'report')
+
+    assert len(sheets) == 1
+    assert load_thumbnail(str(deep), (200, 200)).getpixel((0, 0)) == (156, 156, 156)
+
+
+def test_load_thumbnail_fits_box(tmp_path: Path) -> None:
+    """
+    Проверка, что миниатюра помещается в рамку и сохраняет пропорции.
+    """
+    path = tmp_path / 'big.jpg'
+    Image.new('RGB', (4000, 1000), color=(10, 200, 10)).save(path)
+
+    thumb = load_thumbnail(str(path), (200, 200))
+
+    assert thumb.size == (200, 50)
+    assert thumb.mode == 'RGB'
+
+
+def test_compare_before_after_save_path(tmp_path: Path, rgb_image_10x10: Image.Image) -> None:
+    """
+    Проверка сохранения коллажа по заданному пути.
+    """
+    path = tmp_path / 'cmp' / 'a.jpg'
+    compare_before_after(rgb_image_10x10, rgb_image_10x10.convert('L'), str(path))
+
+    assert path.exists()
@@ -0,0 +1,95 @@
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from src.core import pipeline
+from src.core.analysis import analyze, apply_operation
+from src.core.io import load_image
+from src.core.processing import Options
+from src.core.result_cache import ResultCache
+from src.database import iter_transformations
+from src.models import ImageData, ImageSource
+
+
+def test_apply_operation_uses_cached_result(
+    temp_db, tmp_path: Path, noise_image_64x48: Image.Image, monkeypatch
+) -> None:
+    """
+    Проверка, что повторная цепочка берётся из кеша, а история всё равно записывается.
+    """
+    path = tmp_path / 'src.png'
+    noise_image_64x48.save(path)
+    img, _, data = load_image(str(path))
+    features = analyze(img, data.id)
+    cache = ResultCache(tmp_path / 'cache')
+    op = {Options.Resize: (32, 24), Options.Contrast: 1.3}
+
+    first, _ = apply_operation(img, data, op, data.id, features, cache)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('pipeline must not run on a cache hit')
+
+    monkeypatch.setattr(pipeline.Pipeline, 'run', fail)
+    same_op = {Options.Resize: [32.0, 24.0], Options.Contrast: '1.3'}
+    second, record = apply_operation(img, data, same_op, data.id, features, cache)
+
+    assert second.tobytes() == first.tobytes()
+    assert record.name == Options.Contrast
+    assert len(list(iter_transformations(data.id))) == 4
+    assert cache.key(data.id, op) != cache.key(data.id, {Options.Contrast: 1.3, Options.Resize: (32, 24)})
+
+
+def test_result_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    """
+    Проверка ограничения размера кеша результатов.
+    """
+    cache = ResultCache(tmp_path, max_bytes=0)
+    cache.put('a', Image.new('L', (4, 4)))
+    assert cache.get('a') is None
+
+    cache.max_bytes = 10**6
+    for index, key in enumerate(['a', 'b']):
+        cache.put(key, Image.new('L', (4, 4)))
+        os.utime(tmp_path / f'{key}.png', ns=(index, index))
+    cache.get('a')
+    cache.max_bytes = 2 * (tmp_path / 'a.png').stat().st_size
+    cache.put('c', Image.new('L', (4, 4), color=0))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+def test_apply_operation_skips_cache_without_content_hash(temp_db, tmp_path: Path) -> None:
+    """
+    Проверка, что изображения без хеша содержимого не получают чужой результат из кеша.
+    """
+    cache = ResultCache(tmp_path / 'cache')
+    op = {Options.Resize: (4, 4)}
+    results = []
+    for color in (10, 200):
+        img = Image.new('L', (8, 8), color=color)
+        data = ImageData(source=ImageSource(), history=[], created_at=datetime.utcnow(), updated_at=None)
+        features = analyze(img, data.id)
+        result, _ = apply_operation(img, data, op, data.id, features, cache)
+        results.append(result.getpixel((0, 0)))
+
+    assert results == [10, 200]
+    assert not (tmp_path / 'cache').exists() or not any((tmp_path / 'cache').iterdir())
+
+
+def test_result_cache_keeps_only_lossless_modes(tmp_path: Path) -> None:
+    """
+    Проверка, что 16-битные результаты кешируются без потерь, а 32-битные ('I') не кешируются.
+    """
+    cache = ResultCache(tmp_path)
+    deep = Image.fromarray(np.array([[1, 65535]], dtype=np.uint16))
+    cache.put('deep', deep)
+    cached = cache.get('deep')
+    assert cached is not None and (cached.mode, cached.tobytes()) == (deep.mode, deep.tobytes())
+
+    cache.put('wide', Image.fromarray(np.array([[-5, 70000]], dtype=np.int32)))
+    assert cache.get('wide') is None
@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from src.core.scan import scan_directory
+
+
+def test_scan_directory_is_incremental(temp_db, tmp_path: Path) -> None:
+    """
+    Проверка инкрементального сканирования директории.
+    """
+    root = tmp_path / 'images'
+    (root / 'nested').mkdir(parents=True)
+    Image.new('RGB', (8, 8), color=(10, 10, 10)).save(root / 'a.png')
+    Image.new('RGB', (8, 8), color=(20, 20, 20)).save(root / 'nested' / 'b.png')
+    (root / 'readme.txt').write_text('not an image')
+
+    first = scan_directory(str(root))
+    assert sorted(Path(p).name for p in first.added) == ['a.png', 'b.png']
+    assert first.unchanged == 0
+
+    second = scan_directory(str(root))
+    assert second.added == second.changed == second.deleted == []
+    assert second.unchanged == 2
+
+    Image.new('RGB', (8, 8), color=(30, 30, 30)).save(root / 'a.png')
+    stat = os.stat(root / 'a.png')
+    os.utime(root / 'a.png', ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    os.remove(root / 'nested' / 'b.png')
+    Image.new('RGB', (8, 8)).save(root / 'c.png')
+
+    third = scan_directory(str(root))
+    assert [Path(p).name for p in third.changed] == ['a.png']
+    assert [Path(p).name for p in third.added] == ['c.png']
+    assert [Path(p).name for p in third.deleted] == ['b.png']
+    assert third.unchanged == 0
+
+
+def test_scan_keeps_entries_under_unreadable_directory(temp_db, tmp_path: Path, monkeypatch) -> None:
+    """
+    Проверка, что записи манифеста под непрочитанной директорией не считаются удалёнными.
+    """
+    root = tmp_path / 'images'
+    (root / 'locked').mkdir(parents=True)
+    Image.new('RGB', (8, 8)).save(root / 'a.png')
+    Image.new('RGB', (8, 8)).save(root / 'locked' / 'b.png')
+    Image.new('RGB', (8, 8)).save(root / 'locked.png')
+    assert len(scan_directory(str(root)).added) == 3
+
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if os.path.basename(path) == 'locked':
+            raise PermissionError(13, 'Permission denied', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', failing_scandir)
+    os.remove(root / 'locked.png')
+    report = scan_directory(str(root))
+
+    assert report.failed_dirs == [str(root / 'locked')]
+    assert [Path(p).name for p in report.deleted] == ['locked.png']
+    monkeypatch.setattr(os, 'scandir', scandir)
+    assert scan_directory(str(root)).unchanged == 2
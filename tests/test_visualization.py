@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.core.visualization import (
+    BAR_COLOR,
+    MARGIN,
+    plot_histogram,
+    render_comparison,
+    render_histogram,
+)
+from src.models import ImageFeatures
+
+
+def _features(histogram: list[int]) -> ImageFeatures:
+    return ImageFeatures(
+        id='img',
+        image_id='img',
+        width=1,
+        height=1,
+        format='PNG',
+        mean_brightness=0.0,
+        contrast=0.0,
+        density=0.0,
+        histogram=histogram,
+    )
+
+
+def test_render_histogram_bars() -> None:
+    """
+    Проверка, что высота столбцов пропорциональна значениям бинов.
+    """
+    histogram = [0] * 256
+    histogram[:4] = [100] * 4
+    histogram[255] = 50
+    img = render_histogram(histogram, (296, 180))
+    arr = np.asarray(img)
+    plot_h = 180 - 2 * MARGIN
+
+    assert img.size == (296, 180)
+    first = (arr[MARGIN : MARGIN + plot_h, MARGIN + 1] == BAR_COLOR).all(axis=1).sum()
+    last = (arr[MARGIN : MARGIN + plot_h, MARGIN + 215] == BAR_COLOR).all(axis=1).sum()
+    middle = (arr[MARGIN : MARGIN + plot_h, MARGIN + 100] == BAR_COLOR).all(axis=1).sum()
+    assert first == plot_h
+    assert last == plot_h // 2
+    assert middle == 0
+
+
+def test_render_comparison_downscales_large_images() -> None:
+    """
+    Проверка, что коллаж имеет заданный размер независимо от размера исходников.
+    """
+    original = Image.new('RGB', (4000, 3000), color=(200, 10, 10))
+    modified = Image.new('L', (3000, 4000), color=50)
+
+    out = render_comparison(original, modified, (700, 350))
+
+    assert out.size == (700, 350)
+    assert out.mode == 'RGB'
+    assert out.getpixel((175, 175)) == (200, 10, 10)
+
+
+def test_plot_histogram_saves_file(tmp_path: Path) -> None:
+    """
+    Проверка сохранения гистограммы без matplotlib.
+    """
+    path = tmp_path / 'plots' / 'hist.png'
+    plot_histogram(_features(list(range(256))), str(path))
+
+    with Image.open(path) as img:
+        assert img.size == (800, 400)
+
+
+def test_plot_histogram_rejects_bad_input(tmp_path: Path) -> None:
+    """
+    Проверка ошибок при пустой гистограмме и неизвестном backend.
+    """
+    with pytest.raises(ValueError):
+        plot_histogram(_features([]), str(tmp_path / 'hist.png'))
+    with pytest.raises(ValueError):
+        plot_histogram(_features([1, 2, 3]), str(tmp_path / 'hist.png'), backend='svg')
+
+
+def test_render_comparison_handles_16_bit_images() -> None:
+    """
+    Проверка коллажа для больших 16-битных изображений: значения приводятся к 8 битам, а не обрезаются.
+    """
+    original = Image.fromarray(np.full((600, 800), 32768, dtype=np.uint16))
+    assert original.mode == 'I;16'
+
+    out = render_comparison(original, original, (300, 150))
+
+    assert out.getpixel((75, 75)) == (128, 128, 128)